@@ -1,13 +1,16 @@
 # -------------------- STANDARD IMPORTS --------------------
 import io
+import math
 import os
+import threading
 from datetime import datetime, date, timezone, timedelta
 
-from sqlalchemy import func
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import joinedload
 
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, flash, jsonify, send_file
+    url_for, flash, jsonify, send_file, g
 )
 from flask_login import (
     LoginManager, login_user, login_required,
@@ -31,7 +34,7 @@ from models import (
     Attendance,
     Notification, Message, ChatGroup, ChatGroupMember, PreMatchResponse, 
     PreMatchAvailability,NutritionGroupMember, NutritionGroup, NutritionLog, 
-    NutritionLogItem,FoodItem,MatchPayment
+    NutritionLogItem,FoodItem,MatchPayment,PaymentSummary
 )
 
 # -------------------- DRILL MAP --------------------
@@ -67,10 +70,56 @@ app.config["SECRET_KEY"] = "THIS_IS_A_STRONG_SECRET_KEY_12345"
 from routes.payments import payments_bp
 app.register_blueprint(payments_bp)
 
+from services.db_pool import pool_metrics
+from services.identity import identities
+from services.scorers import scorers, scorer_required, is_scorer
+from services.chat_store import chat_store
+from services.chat_groups import group_members
+from services.chat_search import chat_search
+from services.presence import presence
+from services.notifications import notifier
+from services.attendance import (
+    SLOTS, MAX_EDITS, default_slot, roster, unbatched, get_session,
+    open_session, claim_edit, session_records, locked_statuses, save_marks,
+    backfill_sessions
+)
+from services.attendance_day import attendance_days
+from services.drill_matcher import matcher as drill_matcher
+from services.drill_index import drill_index
+from services.payment_gateway import gateway
+from services.payment_reconciler import reconciler
+from services.payment_orders import payment_orders
+from services.receipts import receipts
+from services.food_catalogue import food_catalogue, CATEGORIES as FOOD_CATEGORIES
+from services.nutrition_stats import (
+    TREND_DAYS, record_log as record_nutrition_log,
+    user_trend, group_trend, group_leaderboard,
+    rebuild as rebuild_nutrition_rollups
+)
+from services.payment_stats import (
+    refresh as refresh_payment_summary, rebuild as rebuild_payment_summaries
+)
+from services.attendance_stats import (
+    apply_session, alert_absences, recent_months,
+    batch_heatmap, batch_rates, streaks_for, player_summary,
+    rebuild as rebuild_attendance_rollups
+)
+from services.chat_archive import (
+    archive_messages, conversation_page, group_page, cursor, parse_before
+)
+
 # -------------------- EXTENSIONS INIT --------------------
+pool_metrics.init_app(app)
 db.init_app(app)
+with app.app_context():
+    pool_metrics.watch(db.engine)
 
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    # needed for emits to reach sockets held by other workers
+    message_queue=app.config.get("SOCKETIO_MESSAGE_QUEUE")
+)
 
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
@@ -81,45 +130,161 @@ with app.app_context():
     except Exception as e:
         print("⚠️ Warning: create_all() failed:", e)
 
+identities.init_app(app)
+scorers.init_app(app)
+chat_store.init_app(app, socketio)
+group_members.init_app(app)
+chat_search.init_app(app)
+presence.init_app(app, socketio)
+notifier.init_app(app, socketio)
+attendance_days.init_app(app)
+gateway.init_app(app)
+payment_orders.init_app(app)
+receipts.init_app(app)
+food_catalogue.init_app(app)
+reconciler.init_app(app, socketio)
+
+
+# background loops belong to processes that serve requests only, not to
+# `flask <command>` runs or scripts that import app: they start with the
+# first HTTP request or socket connection of the process
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def start_background_tasks():
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        presence.start()
+        notifier.start()
+        reconciler.start()
+        _background_started = True
+
+
+@app.before_request
+def ensure_background_tasks():
+    start_background_tasks()
+
+
+@app.cli.command("chat-search-rebuild")
+def chat_search_rebuild():
+    """Re-index all chat messages into the FTS5 sidecar."""
+    print(f"Indexed {chat_search.rebuild()} messages")
+
+
+@app.cli.command("notifications-prune")
+def notifications_prune():
+    """Delete read notifications older than NOTIFY_RETENTION_DAYS."""
+    days = app.config["NOTIFY_RETENTION_DAYS"]
+    print(f"Deleted {notifier.prune(days)} read notifications older than {days} days")
+
+
+@app.cli.command("attendance-rollup-rebuild")
+def attendance_rollup_rebuild():
+    """Recompute monthly attendance counts and streaks from `attendance`."""
+    print(f"Rebuilt attendance rollups for {rebuild_attendance_rollups()} players")
+
+
+@app.cli.command("attendance-sessions-backfill")
+def attendance_sessions_backfill():
+    """Give attendance rows saved before sessions existed their batch session."""
+    linked, left = backfill_sessions(lambda p: assign_batch_by_age(p.age))
+    print(f"Linked {linked} attendance rows to sessions")
+    if left:
+        print(f"⚠️ {left} rows belong to players without a batch; assign one on /attendance and run this again")
+
+
+@app.cli.command("nutrition-rollup-rebuild")
+def nutrition_rollup_rebuild():
+    """Recompute daily nutrition rollups from `nutrition_log`."""
+    print(f"Rebuilt nutrition rollups for {rebuild_nutrition_rollups()} user-days")
+
+
+@app.cli.command("payments-reconcile")
+def payments_reconcile():
+    """Apply pending webhook events and check stale pending orders once."""
+    events = reconciler.process_events()
+    settled = reconciler.sweep_pending()
+    print(f"Applied {events} webhook events, settled {settled} stale orders")
+
+
+@app.cli.command("payments-receipts-migrate")
+def payments_receipts_migrate():
+    """Move loose receipts from static/uploads/payments into the receipt store."""
+    legacy_dir = os.path.join(app.static_folder, "uploads", "payments")
+    imported = receipts.import_legacy(legacy_dir)
+
+    existing = {
+        r[0] for r in db.session.query(MatchPayment.id)
+        .filter(MatchPayment.id.in_([pid for pid, _, _ in imported] or [0]))
+    }
+    changes = [{"id": pid, "receipt": name} for pid, name, _ in imported if pid in existing]
+    if changes:
+        db.session.execute(update(MatchPayment), changes)
+    db.session.commit()
 
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    for _, _, old_path in imported:
+        os.remove(old_path)
+    print(f"Moved {len(imported)} receipts, linked {len(changes)} to payments")
 
-@app.context_processor
-def inject_unread_count():
-    if current_user.is_authenticated:
-        count = Message.query.filter_by(
-            receiver_id=current_user.id,
-            is_read=False
-        ).count()
-        return dict(unread_count=count)
-    return dict(unread_count=0)
 
+@app.cli.command("payments-summary-rebuild")
+def payments_summary_rebuild():
+    """Recompute payment_summaries from match_payments for every session."""
+    print(f"Rebuilt payment summaries for {rebuild_payment_summaries()} sessions")
 
-@app.context_processor
-def inject_unread_message_count():
-    if current_user.is_authenticated:
-        count = Message.query.filter_by(
-            receiver_id=current_user.id,
-            is_read=0,
-            is_deleted=0
-        ).count()
-        return dict(unread_message_count=count)
-    return dict(unread_message_count=0)
 
+@app.cli.command("chat-archive")
+def chat_archive():
+    """Move messages older than CHAT_ARCHIVE_AFTER_DAYS to messages_archive."""
+    days = app.config["CHAT_ARCHIVE_AFTER_DAYS"]
+    print(f"Archived {archive_messages(days)} messages older than {days} days")
 
-@app.context_processor
-def inject_unread_messages():
-    if current_user.is_authenticated:
-        unread = Message.query.filter(
-            Message.receiver_id == current_user.id,
-            Message.is_read == 0
-        ).count()
-    else:
-        unread = 0
 
-    return dict(unread_messages=unread)
+@app.route("/metrics/db-pool")
+@login_required
+def db_pool_metrics():
+    """Connection pool checkout waits and churn for this worker."""
+    if current_user.role != "coach":
+        abort(403)
+    return jsonify(pool_metrics.snapshot())
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return identities.load(user_id)
+
+@app.context_processor
+def inject_unread_counts():
+    """
+    Navbar / dashboard badges, all from one query per request (kept on g
+    when several templates render). Live updates come from socket events.
+    """
+    if not current_user.is_authenticated:
+        return dict(unread_count=0, unread_messages=0, unread_message_count=0, unread_notifications=0)
+
+    if "unread_counts" not in g:
+        unread = (Message.receiver_id == current_user.id) & (Message.is_read == False)
+        g.unread_counts = db.session.execute(select(
+            select(func.count(Message.id)).where(unread).scalar_subquery(),
+            select(func.count(Message.id)).where(unread, Message.is_deleted == False).scalar_subquery(),
+            select(func.count(Notification.id)).where(
+                Notification.user_id == current_user.id,
+                Notification.is_read == False
+            ).scalar_subquery()
+        )).one()
+
+    messages, visible_messages, notifications = g.unread_counts
+    return dict(
+        unread_count=messages,
+        unread_messages=messages,
+        unread_message_count=visible_messages,
+        unread_notifications=notifications
+    )
 
 
 
@@ -218,27 +383,16 @@ def attendance_reminder_for_today(coach_user_id):
     Send reminder notification to coach
     if attendance is not marked today
     """
-    today = date.today()
-
-    attendance_exists = Attendance.query.filter(
-        Attendance.date == today
-    ).first()
-
-    if not attendance_exists:
-        existing = Notification.query.filter_by(
-            user_id=coach_user_id,
-            category="attendance_reminder"
-        ).filter(
-            Notification.created_at >= datetime.combine(today, datetime.min.time())
-        ).first()
-
-        if not existing:
-            notif = Notification(
-                user_id=coach_user_id,
-                message="Attendance not marked for today",
-                category="attendance_reminder"
-            )
-            db.session.add(notif)
+    today = attendance_days.today()
+
+    if not attendance_days.load(today):
+        # unique (user_id, dedup_key) -> at most one reminder per day
+        if notifier.notify(
+            coach_user_id,
+            "Attendance not marked for today",
+            category="attendance_reminder",
+            dedup_key=f"attendance_reminder:{today.isoformat()}"
+        ):
             db.session.commit()
 
 # =========================
@@ -343,12 +497,10 @@ def dashboard_coach():
     # -------------------------
     # ATTENDANCE
     # -------------------------
-    attendance_today = Attendance.query.filter(
-        Attendance.date == today
-    ).all()
+    attendance_today = attendance_days.load()
 
-    attendance_present = sum(1 for a in attendance_today if a.status == "present")
-    attendance_absent = sum(1 for a in attendance_today if a.status == "absent")
+    attendance_present = attendance_today.count("present")
+    attendance_absent = attendance_today.count("absent")
 
     # -------------------------
     # PLAYER APPROVAL (RESTORED)
@@ -397,14 +549,14 @@ def dashboard_coach():
     ).order_by(Notification.created_at.desc()).all()
 
     # -------------------------
-    # PAYMENT SUMMARY (NEW)
+    # PAYMENT SUMMARY (latest session, from payment_summaries)
     # -------------------------
-    payments = MatchPayment.query.order_by(
-        MatchPayment.created_at.desc()
-    ).all()
+    payment_summary = None
+    if latest_pre_match_session:
+        payment_summary = db.session.get(PaymentSummary, latest_pre_match_session.id)
 
-    paid_count = sum(1 for p in payments if p.status == "paid")
-    pending_count = sum(1 for p in payments if p.status != "paid")
+    paid_count = payment_summary.paid if payment_summary else 0
+    pending_count = payment_summary.unpaid if payment_summary else 0
 
     return render_template(
     "dashboard_coach.html",
@@ -419,6 +571,7 @@ def dashboard_coach():
     notifications=notifications,
 
     # ✅ PAYMENT CONTEXT
+    payment_summary=payment_summary,
     paid_count=paid_count,
     pending_count=pending_count
 )
@@ -443,83 +596,36 @@ def coach_pre_match_list():
 # ATTENDANCE LIST VIEWS (SAFE)
 # ================================
 
-@app.route("/attendance/today/present")
-@login_required
-def attendance_today_present():
+def attendance_list(status, title):
+    """Present / absent list of today, optionally for one ?batch_id=&slot= session."""
     if current_user.role != "coach":
         abort(403)
 
-    today = datetime.utcnow().date()
-
-    records = Attendance.query.filter(
-        Attendance.date == today,
-        Attendance.status == "present"
-    ).all()
-
-    return render_template(
-        "attendance_list.html",
-        title="Present Players",
-        records=records
+    records = attendance_days.load().filter(
+        status=status,
+        batch_id=request.args.get("batch_id", type=int),
+        slot=request.args.get("slot") or None
     )
 
-
-@app.route("/attendance/today/absent")
-@login_required
-def attendance_today_absent():
-    if current_user.role != "coach":
-        abort(403)
-
-    today = datetime.utcnow().date()
-
-    records = Attendance.query.filter(
-        Attendance.date == today,
-        Attendance.status == "absent"
-    ).all()
-
     return render_template(
         "attendance_list.html",
-        title="Absent Players",
+        title=title,
         records=records
     )
 
 
-@app.route("/attendance/present-list")
+@app.route("/attendance/today/present")
+@app.route("/attendance/present-list", endpoint="attendance_present_list")
 @login_required
-def attendance_present_list():
-    if current_user.role != "coach":
-        abort(403)
-
-    today = datetime.utcnow().date()
-    records = Attendance.query.filter_by(
-        date=today,
-        status="present"
-    ).all()
-
-    return render_template(
-        "attendance_list.html",
-        title="Present Players",
-        records=records
-    )
-
+def attendance_today_present():
+    return attendance_list("present", "Present Players")
 
 
-@app.route("/attendance/absent-list")
+@app.route("/attendance/today/absent")
+@app.route("/attendance/absent-list", endpoint="attendance_absent_list")
 @login_required
-def attendance_absent_list():
-    if current_user.role != "coach":
-        abort(403)
-
-    today = datetime.utcnow().date()
-    records = Attendance.query.filter_by(
-        date=today,
-        status="absent"
-    ).all()
-
-    return render_template(
-        "attendance_list.html",
-        title="Absent Players",
-        records=records
-    )
+def attendance_today_absent():
+    return attendance_list("absent", "Absent Players")
 
 
 
@@ -545,8 +651,7 @@ def player_public_profile(player_id):
         can_edit = True
     elif current_user.role == "player":
         # allow edit only if viewing your own profile
-        p_self = Player.query.filter_by(user_id=current_user.id).first()
-        if p_self and p_self.id == player.id:
+        if current_user.player_id == player.id:
             can_edit = True
 
     return render_template(
@@ -610,10 +715,9 @@ def dashboard_player():
         Match.match_date >= today
     ).order_by(Match.match_date.asc()).all()
 
-    attendance_today = Attendance.query.filter_by(
-        player_id=player.id,
-        date=today
-    ).first()
+    attendance_today = attendance_days.load().for_player(player.id)
+
+    attendance_month, attendance_streak = player_summary(player.id, attendance_days.today())
 
     notifications = Notification.query.filter(
     Notification.user_id == current_user.id,
@@ -639,11 +743,45 @@ def dashboard_player():
     player=player,
     upcoming_matches=upcoming_matches,
     attendance_today=attendance_today,
+    attendance_month=attendance_month,
+    attendance_streak=attendance_streak,
     notifications=notifications,
     unread_messages=unread_messages,
     pending_payment=pending_payment   # ✅ NEW
     )
 
+@app.route("/notifications")
+@login_required
+def notifications_inbox():
+    page = request.args.get("page", 1, type=int)
+
+    # (user_id, is_read, created_at) index: unread first, newest first
+    pagination = Notification.query.filter_by(
+        user_id=current_user.id
+    ).order_by(
+        Notification.is_read.asc(),
+        Notification.created_at.desc()
+    ).paginate(
+        page=page,
+        per_page=app.config["NOTIFICATIONS_PER_PAGE"],
+        error_out=False
+    )
+
+    return render_template(
+        "notifications.html",
+        notifications=pagination.items,
+        pagination=pagination
+    )
+
+
+@app.route("/notifications/read-all", methods=["POST"])
+@login_required
+def notifications_read_all():
+    notifier.mark_all_read(current_user.id)
+    flash("All notifications marked as read", "info")
+    return redirect(url_for("notifications_inbox"))
+
+
 @app.route("/notification/<int:notification_id>")
 @login_required
 def open_notification(notification_id):
@@ -655,7 +793,7 @@ def open_notification(notification_id):
     n.is_read = True
     db.session.commit()
 
-    return redirect(n.link)
+    return redirect(n.link or url_for("notifications_inbox"))
 
 
 # --------------------------------------------------------
@@ -758,7 +896,6 @@ def coach_create_match():
         return redirect(url_for("home"))
 
     form = MatchCreateForm()
-    coach = Coach.query.filter_by(user_id=current_user.id).first()
 
     # scorer players
     approved_players = Player.query.join(User).filter(User.status == "approved").all()
@@ -794,7 +931,7 @@ def coach_create_match():
 
         # scorer
         if form.scorer_type.data == "coach":
-            m.scorer_coach_id = coach.id
+            m.scorer_coach_id = current_user.coach_id
         else:
             # if scorer_player is not provided or 0 -> None
             m.scorer_player_id = form.scorer_player.data if form.scorer_player.data else None
@@ -832,8 +969,6 @@ def manual_match_create():
     form.toss_winner.choices = [(team_default, team_default), (opp_default, opp_default)]
 
     if form.validate_on_submit():
-        coach = Coach.query.filter_by(user_id=current_user.id).first()
-
         match = Match(
             title=form.title.data,
             match_date=form.match_date.data,
@@ -845,7 +980,7 @@ def manual_match_create():
             toss_winner=form.toss_winner.data,
             toss_decision=form.toss_decision.data,
             status="ongoing",
-            scorer_coach_id=coach.id if form.scorer_type.data == "coach" else None,
+            scorer_coach_id=current_user.coach_id if form.scorer_type.data == "coach" else None,
             scorer_player_id=form.scorer_player.data if (form.scorer_type.data == "player" and form.scorer_player.data != 0) else None
         )
 
@@ -891,22 +1026,13 @@ def coach_player_stats(id):
 def match_detail(match_id):
     m = Match.query.get_or_404(match_id)
 
-    def can_score(match):
-        if current_user.role == "coach":
-            c = Coach.query.filter_by(user_id=current_user.id).first()
-            return match.scorer_coach_id == c.id
-        if current_user.role == "player":
-            p = Player.query.filter_by(user_id=current_user.id).first()
-            return match.scorer_player_id == p.id
-        return False
-
     playing = MatchAssignment.query.filter_by(match_id=m.id).all()
     opponents = OpponentTempPlayer.query.filter_by(match_id=m.id).all()
 
     return render_template(
         "match_detail.html",
         match=m,
-        can_score=can_score(m),
+        can_score=is_scorer(current_user, m.scorer_coach_id, m.scorer_player_id),
         playing_count=len(playing),
         opponent_count=len(opponents)
     )
@@ -974,22 +1100,11 @@ def select_players(match_id):
 # --------------------------------------------------------
 @app.route("/match/<int:match_id>/manual")
 @login_required
+@scorer_required()
 def manual_scoring(match_id):
 
     m = Match.query.get_or_404(match_id)
 
-    allowed = False
-    if current_user.role == "coach":
-        c = Coach.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_coach_id == c.id)
-    elif current_user.role == "player":
-        p = Player.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_player_id == p.id)
-
-    if not allowed:
-        flash("You are not the assigned scorer.", "danger")
-        return redirect(url_for("match_detail", match_id=m.id))
-
     # players: if squad assigned use that otherwise fallback to all approved players
     squad_assignments = MatchAssignment.query.filter_by(match_id=m.id).all()
     if squad_assignments:
@@ -1015,22 +1130,11 @@ def manual_scoring(match_id):
 # --------------------------------------------------------
 @app.route("/api/match/<int:match_id>/manual_save", methods=["POST"])
 @login_required
+@scorer_required(api=True)
 def api_manual_save(match_id):
 
     m = Match.query.get_or_404(match_id)
 
-    # scorer permission check
-    allowed = False
-    if current_user.role == "coach":
-        c = Coach.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_coach_id == c.id)
-    elif current_user.role == "player":
-        p = Player.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_player_id == p.id)
-
-    if not allowed:
-        return jsonify({"error": "not_allowed"}), 403
-
     data = request.get_json() or {}
 
     try:
@@ -1129,22 +1233,11 @@ def api_manual_save(match_id):
 # --------------------------------------------------------
 @app.route("/match/<int:match_id>/panel")
 @login_required
+@scorer_required(message="Not authorized.")
 def scoring_panel(match_id):
 
     m = Match.query.get_or_404(match_id)
 
-    allowed = False
-    if current_user.role == "coach":
-        c = Coach.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_coach_id == c.id)
-    elif current_user.role == "player":
-        p = Player.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_player_id == p.id)
-
-    if not allowed:
-        flash("Not authorized.", "danger")
-        return redirect(url_for("match_detail", match_id=match_id))
-
     last = LiveBall.query.filter_by(match_id=match_id).order_by(LiveBall.id.desc()).first()
     next_over, next_ball = (1, 1)
 
@@ -1174,21 +1267,9 @@ def scoring_panel(match_id):
 
 @app.route("/api/live/<int:match_id>/add", methods=["POST"])
 @login_required
+@scorer_required(api=True)
 def api_live_add(match_id):
 
-    m = Match.query.get_or_404(match_id)
-
-    allowed = False
-    if current_user.role == "coach":
-        c = Coach.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_coach_id == c.id)
-    elif current_user.role == "player":
-        p = Player.query.filter_by(user_id=current_user.id).first()
-        allowed = (m.scorer_player_id == p.id)
-
-    if not allowed:
-        return jsonify({"error": "not_allowed"}), 403
-
     data = request.get_json() or {}
 
     try:
@@ -1746,90 +1827,140 @@ def player_stats_pdf(player_id):
 from datetime import date
 from collections import defaultdict
 
+def attendance_scope(args):
+    """
+    (batches, batch, slot) picked by ?batch_id=&slot=.
+    Defaults to the first batch and the current slot.
+    """
+    batches = Batch.query.order_by(Batch.min_age.asc()).all()
+    batch_id = args.get("batch_id", type=int)
+    batch = next((b for b in batches if b.id == batch_id), batches[0] if batches else None)
+
+    slot = args.get("slot")
+    if slot not in SLOTS:
+        slot = default_slot(attendance_days.now())
+
+    return batches, batch, slot
+
+
 @app.route("/attendance", methods=["GET", "POST"])
 @login_required
 def attendance():
     if current_user.role != "coach":
         abort(403)
 
-    players = Player.query.all()
-    today = date.today()
+    batches, batch, slot = attendance_scope(request.values)
+    if batch is None:
+        flash("Create a batch before taking attendance.", "warning")
+        return redirect(url_for("dashboard_coach"))
 
-    # ✅ Existing attendance for today
-    existing_attendance = Attendance.query.filter_by(date=today).all()
+    today = attendance_days.today()
+    players = roster(batch.id)
+    att_session = get_session(batch.id, today, slot)
 
-    # ✅ attendance_map FIX (for template)
-    attendance_map = {a.player_id: a for a in existing_attendance}
+    # ✅ Existing attendance for this session
+    attendance_map = {
+        a.player_id: a for a in session_records(batch.id, today, slot)
+    } if att_session else {}
 
     if request.method == "POST":
 
-        # 🔐 Edit limit check
-        if existing_attendance:
-            edit_count = existing_attendance[0].edit_count or 0
-            if edit_count >= 2:
-                flash("Attendance edit limit reached for today (max 2 edits).", "danger")
-                return redirect(url_for("attendance"))
+        att_session, created = open_session(batch.id, today, slot, current_user.id)
 
-        for p in players:
-            status = request.form.get(f"player_{p.id}", "absent")
-            note = request.form.get(f"note_{p.id}", "")
+        # 🔐 Edit limit check (atomic, shared by all coaches)
+        if not created and not claim_edit(att_session.id):
+            db.session.rollback()
+            flash(f"Attendance edit limit reached for this session (max {MAX_EDITS} edits).", "danger")
+            return redirect(url_for("attendance", batch_id=batch.id, slot=slot))
 
-            record = attendance_map.get(p.id)
+        # previous marks as stored now (another coach may have saved since
+        # the page was read); rollup deltas are taken against these
+        previous = locked_statuses(att_session.id)
 
-            if record:
-                # ✅ Update existing
-                record.status = status
-                record.improvement_note = note
-                record.edit_count += 1
-            else:
-                # ✅ First time mark
-                record = Attendance(
-                    player_id=p.id,
-                    date=today,
-                    status=status,
-                    improvement_note=note,
-                    edit_count=0
-                )
-                db.session.add(record)
-
-                # AI Suggestions (UNCHANGED)
-                ai_suggestions = generate_ai_suggestions(p, note)
-                for s in ai_suggestions:
-                    db.session.add(Notification(
-                        user_id=p.user_id,
-                        message=(
-                            f"Coach Suggestion ({s['area']}): "
-                            f"{s['recommendation']} | Drills: {', '.join(s['drills'])}"
-                        ),
-                        category="ai_suggestion"
-                    ))
+        # one upsert for the whole session
+        saved = save_marks(att_session, [
+            (
+                p.id,
+                request.form.get(f"player_{p.id}", "absent"),
+                request.form.get(f"note_{p.id}", "")
+            )
+            for p in players
+        ])
+
+        # AI suggestions for first-time marks, one digest upsert for all
+        suggestions = []
+        for p in players:
+            if p.id in previous:
+                continue
+            for s in generate_ai_suggestions(p, request.form.get(f"note_{p.id}", "")):
+                suggestions.append((
+                    p.user_id,
+                    (
+                        f"Coach Suggestion ({s['area']}): "
+                        f"{s['recommendation']} | Drills: {', '.join(s['drills'])}"
+                    ),
+                    None
+                ))
+        notifier.digest_many("ai_suggestion", suggestions)
+
+        # 📈 monthly + streak rollups, absence alerts
+        apply_session(att_session, {
+            pid: (previous.get(pid), status)
+            for pid, status in saved.items()
+        })
+        alert_absences(
+            [pid for pid, status in saved.items() if status == "absent"],
+            app.config["ATTENDANCE_ABSENCE_ALERT"],
+            link=url_for("attendance_history", batch_id=batch.id)
+        )
 
         db.session.commit()
+        attendance_days.invalidate(today)
         flash("Attendance saved successfully", "success")
         return redirect(url_for("dashboard_coach"))
 
     return render_template(
         "attendance.html",
         players=players,
-        attendance_map=attendance_map
+        unbatched=unbatched(),
+        attendance_map=attendance_map,
+        batches=batches,
+        batch=batch,
+        slot=slot,
+        slots=SLOTS,
+        att_session=att_session,
+        max_edits=MAX_EDITS,
+        today=today
     )
 
+@app.route("/attendance/assign-batch", methods=["POST"])
+@login_required
+def attendance_assign_batch():
+    """Put an unbatched player into a batch so they can be marked."""
+    if current_user.role != "coach":
+        abort(403)
+
+    player = Player.query.get_or_404(request.form.get("player_id", type=int))
+    batch = Batch.query.get_or_404(request.form.get("batch_id", type=int))
+    player.batch_id = batch.id
+    db.session.commit()
+    attendance_days.invalidate(attendance_days.today())
+
+    flash(f"{player.user.username} added to {batch.name}", "success")
+    return redirect(url_for("attendance", batch_id=batch.id, slot=request.form.get("slot")))
+
+
 @app.route("/attendance/summary")
 @login_required
 def attendance_summary():
     if current_user.role != "coach":
         abort(403)
 
-    today = date.today()
+    batches, batch, slot = attendance_scope(request.args)
+    day = attendance_days.load()
+    today = day.day
 
-    attendance = (
-        Attendance.query
-        .join(Player, Attendance.player_id == Player.id)
-        .join(User, Player.user_id == User.id)
-        .filter(Attendance.date == today)
-        .order_by(User.username.asc())
-        .all()
-    )
+    attendance = day.filter(batch_id=batch.id, slot=slot) if batch else []
 
     total = len(attendance)
     present = sum(1 for a in attendance if a.status == "present")
@@ -1839,6 +1970,11 @@ def attendance_summary():
         "attendance_summary.html",
         attendance=attendance,
         date=today,
+        batches=batches,
+        batch=batch,
+        slot=slot,
+        slots=SLOTS,
+        max_edits=MAX_EDITS,
         total=total,
         present=present,
         absent=absent
@@ -1848,12 +1984,20 @@ def attendance_summary():
 @app.route("/attendance/pdf")
 @login_required
 def attendance_pdf():
-    today = date.today()
+    if current_user.role != "coach":
+        abort(403)
 
-    attendance = Attendance.query.filter_by(date=today).all()
+    batches, batch, slot = attendance_scope(request.args)
+    if batch is None:
+        abort(404)
+
+    day = attendance_days.load()
+    today = day.day
+
+    attendance = day.filter(batch_id=batch.id, slot=slot)
 
     os.makedirs("generated_reports", exist_ok=True)
-    file_path = f"generated_reports/attendance_{today}.pdf"
+    file_path = f"generated_reports/attendance_{today}_{batch.id}_{slot}.pdf"
 
     doc = SimpleDocTemplate(
         file_path,
@@ -1869,7 +2013,7 @@ def attendance_pdf():
 
     # ===== TITLE =====
     elements.append(Paragraph(
-        f"<b>Attendance Report</b><br/>Date: {today}",
+        f"<b>Attendance Report</b><br/>{batch.name} · {slot.title()} · {today}",
         styles["Title"]
     ))
 
@@ -1882,8 +2026,8 @@ def attendance_pdf():
 
     for a in attendance:
         table_data.append([
-            a.player.user.username,
-            "Present" if a.status == "present" else "Absent",
+            a.username,
+            a.status.title(),
             a.improvement_note or "-"
         ])
 
@@ -1912,14 +2056,69 @@ def attendance_pdf():
 
 
 
+@app.route("/attendance/history")
+@login_required
+def attendance_history():
+    if current_user.role != "coach":
+        abort(403)
+
+    batches, batch, slot = attendance_scope(request.args)
+    if batch is None:
+        flash("Create a batch before taking attendance.", "warning")
+        return redirect(url_for("dashboard_coach"))
+
+    months = recent_months(max(1, min(request.args.get("months", 6, type=int) or 6, 24)))
+    heatmap = batch_heatmap(batch.id, months)
+
+    # today's roster, plus players who have since moved to another batch
+    players = roster(batch.id)
+    moved = set(heatmap) - {p.id for p in players}
+    if moved:
+        players = sorted(
+            players + Player.query.options(joinedload(Player.user)).filter(Player.id.in_(moved)).all(),
+            key=lambda p: p.user.username
+        )
+
+    return render_template(
+        "attendance_history.html",
+        batches=batches,
+        batch=batch,
+        months=months,
+        players=players,
+        heatmap=heatmap,
+        rates=batch_rates(batch.id, months),
+        streaks=streaks_for([p.id for p in players])
+    )
+
+
+@app.route("/api/drills/search")
+@login_required
+def api_drills_search():
+    """
+    ?q=free text (last word also matched as a prefix)
+    &pov=coach&angle=side view&focus=balance (repeatable, ANDed)
+    """
+    return jsonify(drill_index.search(
+        q=request.args.get("q", ""),
+        pov=request.args.getlist("pov"),
+        angle=request.args.getlist("angle"),
+        focus=request.args.getlist("focus"),
+        limit=max(1, min(request.args.get("limit", 10, type=int), 50))
+    ))
+
+
 @app.route("/drills/<int:player_id>", methods=["GET","POST"])
 @login_required
 def drills(player_id):
     player = Player.query.get_or_404(player_id)
 
     if request.method == "POST":
-        issue = request.form["issue"]
-        drills = DRILL_MAP.get(issue, {})
+        issue = request.form.get("issue", "").strip()
+        drills = DRILL_MAP.get(issue)
+        if drills is None:
+            # not an exact topic -> best ranked match, if anything matched
+            hits = drill_index.search(q=issue, limit=1)["results"] if issue else []
+            drills = DRILL_MAP[hits[0]["topic"]] if hits else {}
         return render_template("drills.html", player=player, drills=drills)
 
     return render_template("drills.html", player=player)
@@ -1935,55 +2134,13 @@ def drills(player_id):
 def generate_ai_suggestions(player, attendance_note=None):
     """
     AI rule-based coach suggestion engine.
-    Uses DRILL_MAP for auto drill suggestions.
+    Matches the note against every DRILL_MAP topic, focus term and
+    synonym in one pass (services/drill_matcher.py).
     """
-
-    suggestions = []
-
     if not attendance_note:
-        return suggestions
+        return []
 
-    note = attendance_note.lower()
-
-    # 🟦 Batting issues
-    if "bat" in note or "swing" in note:
-        suggestions.append({
-            "area": "Batting Technique",
-            "recommendation": "Improve bat swing & bat path control",
-            "drills": DRILL_MAP["bat swing"]["drills"]
-        })
-
-    if "foot" in note:
-        suggestions.append({
-            "area": "Footwork",
-            "recommendation": "Improve front & back foot movement",
-            "drills": DRILL_MAP["footwork batting"]["drills"]
-        })
-
-    if "timing" in note:
-        suggestions.append({
-            "area": "Timing",
-            "recommendation": "Improve timing and play late under eyes",
-            "drills": DRILL_MAP["timing"]["drills"]
-        })
-
-    # 🟦 Bowling issues
-    if "bowling" in note or "action" in note:
-        suggestions.append({
-            "area": "Bowling Action",
-            "recommendation": "Correct bowling action & alignment",
-            "drills": DRILL_MAP["bowling action"]["drills"]
-        })
-
-    # 🟦 Fitness issues
-    if "fitness" in note or "balance" in note:
-        suggestions.append({
-            "area": "Fitness & Balance",
-            "recommendation": "Improve balance, agility and core stability",
-            "drills": DRILL_MAP["balance training"]["drills"]
-        })
-
-    return suggestions
+    return drill_matcher.suggestions(attendance_note)
 
 
 
@@ -2027,15 +2184,10 @@ def chat_list():
 
     chat_users = User.query.filter(User.id.in_(user_ids)).all()
 
-    # 2️⃣ Groups user belongs to
-    group_ids = (
-        ChatGroupMember.query
-        .filter_by(user_id=current_user.id)
-        .with_entities(ChatGroupMember.group_id)
-        .subquery()
-    )
+    # 2️⃣ Groups user belongs to (membership index)
+    group_ids = group_members.groups_for(current_user.id)
 
-    chat_groups = ChatGroup.query.filter(ChatGroup.id.in_(group_ids)).all()
+    chat_groups = ChatGroup.query.filter(ChatGroup.id.in_(group_ids)).all() if group_ids else []
 
     return render_template(
         "chat_list.html",
@@ -2054,6 +2206,29 @@ def start_new_chat():
     return render_template("chat_new.html", users=users)
 
 
+# -------------------- SEARCH MESSAGES --------------------
+@app.route("/chat/search")
+@login_required
+def chat_search_view():
+    q = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+
+    results, has_next = chat_search.search(
+        current_user.id,
+        q,
+        group_members.groups_for(current_user.id),
+        page=page
+    )
+
+    return render_template(
+        "chat_search.html",
+        q=q,
+        page=page,
+        results=results,
+        has_next=has_next
+    )
+
+
 
 # -------------------- USER TO USER CHAT --------------------
 @app.route("/chat/user/<int:user_id>", methods=["GET", "POST"])
@@ -2061,10 +2236,11 @@ def start_new_chat():
 def chat_user(user_id):
     other_user = User.query.get_or_404(user_id)
 
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.created_at).all()
+    # newest page from the hot table, archive only when scrolling back
+    messages, has_more = conversation_page(
+        current_user.id, user_id,
+        before=parse_before(request.args.get("before"))
+    )
 
     # MARK RECEIVED MESSAGES AS READ
     Message.query.filter(
@@ -2077,6 +2253,8 @@ def chat_user(user_id):
     return render_template(
         "chat.html",
         messages=messages,
+        has_more=has_more,
+        older_cursor=cursor(messages[0]) if messages else None,
         other_user=other_user
     )
 
@@ -2086,12 +2264,14 @@ def chat_user(user_id):
 @app.route("/chat/delete/<int:msg_id>", methods=["POST"])
 @login_required
 def delete_message(msg_id):
+    chat_store.ensure_persisted(msg_id)
     msg = Message.query.get_or_404(msg_id)
     if msg.sender_id != current_user.id:
         abort(403)
 
     msg.is_deleted = 1
     db.session.commit()
+    chat_search.remove(msg.id)
     return redirect(request.referrer)
 
 
@@ -2099,6 +2279,7 @@ def delete_message(msg_id):
 @app.route("/chat/edit/<int:msg_id>", methods=["POST"])
 @login_required
 def edit_message(msg_id):
+    chat_store.ensure_persisted(msg_id)
     msg = Message.query.get_or_404(msg_id)
     if msg.sender_id != current_user.id:
         abort(403)
@@ -2106,6 +2287,7 @@ def edit_message(msg_id):
     msg.content = request.form["content"]
     msg.updated_at = datetime.utcnow()
     db.session.commit()
+    chat_search.update(msg)
     return redirect(request.referrer)
 
 
@@ -2125,20 +2307,16 @@ def create_group_chat():
         db.session.add(group)
         db.session.commit()
 
-        # Add creator
-        db.session.add(ChatGroupMember(
-            group_id=group.id,
-            user_id=current_user.id
-        ))
-
-        # Add selected members
-        for uid in members:
+        # Creator + selected members
+        member_ids = {current_user.id} | {int(uid) for uid in members}
+        for uid in member_ids:
             db.session.add(ChatGroupMember(
                 group_id=group.id,
-                user_id=int(uid)
+                user_id=uid
             ))
 
         db.session.commit()
+        group_members.set_group(group.id, member_ids)
         flash("Group created successfully", "success")
 
         return redirect(url_for("chat_group", group_id=group.id))
@@ -2152,21 +2330,17 @@ def create_group_chat():
 @app.route("/chat/group/<int:group_id>", methods=["GET"])
 @login_required
 def chat_group(group_id):
-    from models import ChatGroup, ChatGroupMember, Message, User
-
-    group = ChatGroup.query.get_or_404(group_id)
-
-    member_ids = [
-        m.user_id for m in ChatGroupMember.query.filter_by(group_id=group_id)
-    ]
+    member_ids = group_members.members(group_id)
 
     if current_user.id not in member_ids:
         abort(403)
 
-    messages = Message.query.filter_by(
-        group_id=group_id,
-        is_deleted=0
-    ).order_by(Message.created_at).all()
+    group = ChatGroup.query.get_or_404(group_id)
+
+    messages, has_more = group_page(
+        group_id,
+        before=parse_before(request.args.get("before"))
+    )
 
     users = User.query.filter(User.id.in_(member_ids)).all()
     users_map = {u.id: u for u in users}
@@ -2175,6 +2349,8 @@ def chat_group(group_id):
         "chat_group.html",
         group=group,
         messages=messages,
+        has_more=has_more,
+        older_cursor=cursor(messages[0]) if messages else None,
         users_map=users_map,
         group_id=group_id
     )
@@ -2200,18 +2376,16 @@ def pre_match_create():
         db.session.commit()
 
         # 🔔 Notify players + coaches (availability only, payment later)
-        users = User.query.filter(User.role.in_(["player", "coach"])).all()
-        for u in users:
-            db.session.add(Notification(
-                user_id=u.id,
-                message=f"📢 Pre-Match Availability: {availability.title}",
-                link=url_for(
-                    "respond_availability",
-                    availability_id=availability.id
-                )
-            ))
-
-        db.session.commit()
+        notifier.fan_out(
+            db.select(User.id).where(User.role.in_(["player", "coach"])),
+            message=f"📢 Pre-Match Availability: {availability.title}",
+            link=url_for(
+                "respond_availability",
+                availability_id=availability.id
+            ),
+            category="availability",
+            dedup_key=f"availability:{availability.id}"
+        )
 
         flash("Pre-match availability created successfully", "success")
         return redirect(
@@ -2250,6 +2424,8 @@ def respond_availability(availability_id):
 
         response.status = status
         response.updated_at = datetime.utcnow()
+        db.session.flush()
+        refresh_payment_summary([availability_id])
         db.session.commit()
 
         # 🔔 Mark notification read automatically
@@ -2297,18 +2473,15 @@ def availability_summary(availability_id):
     # -------------------------
     if request.method == "POST":
         availability.is_finalized = True
+        refresh_payment_summary([availability.id])
         db.session.commit()
 
         # 🔔 Notify ONLY AVAILABLE PLAYERS
-        for r in responses:
-            if r.status == "available":
-                db.session.add(Notification(
-                    user_id=r.id,
-                    message=f"💰 Match fee ₹{availability.amount} enabled. Please pay now.",
-                    link=url_for("payments.payment_page", availability_id=availability.id)
-                ))
-
-        db.session.commit()
+        notify_payment_enabled(
+            availability.id,
+            availability.amount,
+            link=url_for("payments.payment_page", availability_id=availability.id)
+        )
 
         flash("Squad finalized & payment enabled", "success")
         return redirect(url_for("dashboard_coach"))
@@ -2402,30 +2575,46 @@ def availability_pdf(availability_id):
 @app.route("/chat/send", methods=["POST"])
 @login_required
 def chat_send():
-    data = request.json
+    data = request.get_json(silent=True) or {}
+    try:
+        group_id = int(data["group_id"]) if data.get("group_id") else None
+        receiver_id = int(data["receiver_id"]) if data.get("receiver_id") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid recipient"}), 400
+
+    # exactly one target: a group or a user
+    if (group_id is None) == (receiver_id is None):
+        return jsonify({"error": "Send to either a group or a user"}), 400
 
-    msg = Message(
+    content = data.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return jsonify({"error": "Message is empty"}), 400
+
+    # same membership check as the socket handler
+    if group_id and not group_members.is_member(group_id, current_user.id):
+        abort(403)
+
+    msg = chat_store.save(
         sender_id=current_user.id,
-        receiver_id=data.get("receiver_id"),  # None for group
-        group_id=data.get("group_id"),        # None for user chat
-        content=data["content"],
-        delivered=True
+        receiver_id=receiver_id,  # None for group
+        group_id=group_id,        # None for user chat
+        content=content
     )
 
-    db.session.add(msg)
-    db.session.commit()
+    payload = {
+        "id": msg.id,
+        "content": msg.content,
+        "sender_id": msg.sender_id,
+        "receiver_id": msg.receiver_id,
+        "group_id": msg.group_id,
+        "created_at": msg.created_at.strftime("%H:%M")
+    }
 
-    socketio.emit(
-        "new_message",
-        {
-            "id": msg.id,
-            "content": msg.content,
-            "sender_id": msg.sender_id,
-            "receiver_id": msg.receiver_id,
-            "group_id": msg.group_id,
-            "created_at": msg.created_at.strftime("%H:%M")
-        }
-    )
+    if group_id:
+        socketio.emit("new_message", payload, to=f"group_{group_id}")
+    else:
+        socketio.emit("new_message", payload, to=f"user_{receiver_id}")
+        socketio.emit("new_message", payload, to=f"user_{current_user.id}")
 
     return jsonify({"status": "sent"})
 
@@ -2496,19 +2685,52 @@ def nutrition_group_create():
 # =========================
 # VIEW GROUP
 # =========================
+def trend_days(args):
+    """?days= limited to the 7 / 30 / 90 day windows."""
+    days = args.get("days", 7, type=int)
+    return days if days in TREND_DAYS else 7
+
+
+def require_nutrition_group_member(group_id):
+    """403 unless current_user is a coach or a member of the group."""
+    if current_user.role == "coach":
+        return
+    member = db.session.query(NutritionGroupMember.id).filter_by(
+        group_id=group_id, user_id=current_user.id
+    ).first()
+    if member is None:
+        abort(403)
+
+
 @app.route("/nutrition/group/<int:group_id>")
 @login_required
 def nutrition_group_view(group_id):
     group = NutritionGroup.query.get_or_404(group_id)
+    require_nutrition_group_member(group.id)
+    days = trend_days(request.args)
 
-    logs = NutritionLog.query.filter_by(
+    # (group_id, created_at) index, one page at a time
+    pagination = NutritionLog.query.options(
+        joinedload(NutritionLog.user)
+    ).filter_by(
         group_id=group.id
-    ).order_by(NutritionLog.created_at.desc()).all()
+    ).order_by(
+        NutritionLog.created_at.desc(), NutritionLog.id.desc()
+    ).paginate(
+        page=request.args.get("page", 1, type=int),
+        per_page=app.config["NUTRITION_LOGS_PER_PAGE"],
+        error_out=False
+    )
 
     return render_template(
         "nutrition/nutrition_group_view.html",
         group=group,
-        logs=logs
+        logs=pagination.items,
+        pagination=pagination,
+        days=days,
+        trend_windows=TREND_DAYS,
+        trend=group_trend(group.id, days),
+        leaderboard=group_leaderboard(group.id, days)
     )
 
 
@@ -2519,86 +2741,138 @@ def nutrition_group_view(group_id):
 @login_required
 def nutrition_calculator(group_id):
     group = NutritionGroup.query.get_or_404(group_id)
-    foods = FoodItem.query.all()
+    catalogue = food_catalogue.get()
 
     if request.method == "POST":
+        # only the qty_<food_id> fields that were filled in
+        quantities = {}
+        for key, value in request.form.items():
+            if not key.startswith("qty_") or not value:
+                continue
+            try:
+                qty = float(value)
+                food_id = int(key[4:])
+            except ValueError:
+                continue
+            if math.isfinite(qty):   # "inf" / "nan" parse as floats
+                quantities[food_id] = qty
+
+        items, totals = catalogue.totals(quantities)
+
         log = NutritionLog(
             user_id=current_user.id,
             group_id=group.id,
             log_date=date.today(),
-            total_calories=0,
-            total_protein=0,
-            total_carbs=0,
-            total_fat=0
+            total_calories=totals["calories"],
+            total_protein=totals["protein"],
+            total_carbs=totals["carbs"],
+            total_fat=totals["fat"]
         )
         db.session.add(log)
         db.session.flush()
 
-        for f in foods:
-            qty = request.form.get(f"qty_{f.id}")
-            if qty and float(qty) > 0:
-                qty = float(qty)
-
-                item = NutritionLogItem(
-                    log_id=log.id,
-                    food_id=f.id,
-                    quantity=qty,
-                    calories=f.calories * qty,
-                    protein=f.protein * qty,
-                    carbs=f.carbs * qty,
-                    fat=f.fat * qty
-                )
-
-                log.total_calories += item.calories
-                log.total_protein += item.protein
-                log.total_carbs += item.carbs
-                log.total_fat += item.fat
+        if items:
+            db.session.execute(
+                insert(NutritionLogItem),
+                [dict(item, log_id=log.id) for item in items]
+            )
 
-                db.session.add(item)
+        record_nutrition_log(log)
 
         db.session.commit()
         flash("Nutrition saved & shared", "success")
         return redirect(url_for("nutrition_group_view", group_id=group.id))
 
+    # foods are picked through /api/foods/search, not rendered up front
     return render_template(
         "nutrition/nutrition_calculator.html",
-        foods=foods,
+        categories=FOOD_CATEGORIES,
         group=group
     )
 
 
+@app.route("/api/foods/search")
+@login_required
+def api_foods_search():
+    """?q=typed text (every word matched as a prefix) &category=dairy &limit=10"""
+    category = request.args.get("category") or None
+    if category and category not in FOOD_CATEGORIES:
+        category = None
+
+    return jsonify(food_catalogue.get().search(
+        q=request.args.get("q", ""),
+        category=category,
+        limit=max(1, min(request.args.get("limit", 10, type=int), 50))
+    ))
+
+
 # =========================
 # HISTORY
 # =========================
 @app.route("/nutrition/history")
 @login_required
 def nutrition_history():
-    logs = NutritionLog.query.filter_by(
+    days = trend_days(request.args)
+
+    # (user_id, log_date) index, one page at a time
+    pagination = NutritionLog.query.filter_by(
         user_id=current_user.id
-    ).order_by(NutritionLog.log_date.desc()).all()
+    ).order_by(
+        NutritionLog.log_date.desc(), NutritionLog.id.desc()
+    ).paginate(
+        page=request.args.get("page", 1, type=int),
+        per_page=app.config["NUTRITION_LOGS_PER_PAGE"],
+        error_out=False
+    )
 
     return render_template(
         "nutrition/nutrition_history.html",
-        logs=logs
+        logs=pagination.items,
+        pagination=pagination,
+        days=days,
+        trend_windows=TREND_DAYS,
+        trend=user_trend(current_user.id, days)
     )
 
 
+@app.route("/api/nutrition/trends")
+@login_required
+def api_nutrition_trends():
+    """
+    ?days=7|30|90, own trend by default;
+    &group_id= per-member group averages + leaderboard (members and coaches);
+    &user_id= another player's trend (coaches only).
+    """
+    days = trend_days(request.args)
 
-def notify_payment_enabled(availability_id, amount):
-    available_players = PreMatchResponse.query.filter_by(
-        availability_id=availability_id,
-        status="available"
-    ).all()
+    group_id = request.args.get("group_id", type=int)
+    if group_id:
+        NutritionGroup.query.get_or_404(group_id)
+        require_nutrition_group_member(group_id)
+        return jsonify({
+            "group_id": group_id,
+            **group_trend(group_id, days),
+            "leaderboard": group_leaderboard(group_id, days)
+        })
 
-    for r in available_players:
-        n = Notification(
-            user_id=r.user_id,
-            message=f"💰 Match fee ₹{amount} enabled. Please complete payment.",
-            link=f"/payment/{availability_id}"
-        )
-        db.session.add(n)
+    user_id = request.args.get("user_id", type=int) or current_user.id
+    if user_id != current_user.id and current_user.role != "coach":
+        abort(403)
+    return jsonify({"user_id": user_id, **user_trend(user_id, days)})
 
-    db.session.commit()
+
+
+def notify_payment_enabled(availability_id, amount, link=None):
+    return notifier.fan_out(
+        db.select(PreMatchResponse.user_id).where(
+            PreMatchResponse.availability_id == availability_id,
+            PreMatchResponse.status == "available"
+        ),
+        message=f"💰 Match fee ₹{amount} enabled. Please pay now.",
+        link=link or f"/payment/{availability_id}",
+        category="payment",
+        dedup_key=f"payment:{availability_id}"
+    )
 
 
 
@@ -2608,16 +2882,134 @@ def notify_payment_enabled(availability_id, amount):
 # -------------------------------------------------
 @socketio.on("connect")
 def on_connect():
+    start_background_tasks()
     if current_user.is_authenticated:
         join_room(f"user_{current_user.id}")
+        presence.connect(current_user.id, request.sid)
+
+
+@socketio.on("disconnect")
+def on_disconnect(*args):
+    if current_user.is_authenticated:
+        presence.disconnect(current_user.id, request.sid)
+
+
+# -------------------------------------------------
+# PRESENCE + TYPING (in-memory, see services/presence.py)
+# -------------------------------------------------
+@socketio.on("presence_ping")
+def presence_ping(data=None):
+    if current_user.is_authenticated:
+        presence.heartbeat(current_user.id, request.sid)
+
+
+def presence_visible(user_ids):
+    """
+    The users among user_ids whose online status current_user may see:
+    members of one of their chat groups, players of their batch, and
+    people they have a direct conversation with.
+    """
+    wanted = set(user_ids)
+    allowed = set()
+
+    for group_id in group_members.groups_for(current_user.id):
+        allowed |= group_members.members(group_id) & wanted
+
+    rest = wanted - allowed
+    if rest and current_user.player_id:
+        batch_id = db.session.query(Player.batch_id).filter(
+            Player.id == current_user.player_id
+        ).scalar()
+        if batch_id:
+            allowed |= {
+                r[0] for r in db.session.query(Player.user_id).filter(
+                    Player.batch_id == batch_id,
+                    Player.user_id.in_(rest)
+                )
+            }
+
+    rest = wanted - allowed
+    if rest:
+        allowed |= {
+            r[0] for r in db.session.query(Message.sender_id).filter(
+                Message.receiver_id == current_user.id,
+                Message.sender_id.in_(rest)
+            ).union(
+                db.session.query(Message.receiver_id).filter(
+                    Message.sender_id == current_user.id,
+                    Message.receiver_id.in_(rest)
+                )
+            )
+        }
+
+    return [uid for uid in user_ids if uid in allowed]
+
+
+@socketio.on("watch_presence")
+def watch_presence(data=None):
+    if not current_user.is_authenticated:
+        return
+
+    data = data or {}
+    user_ids = []
+    for uid in (data.get("user_ids") or [])[:50]:
+        try:
+            user_ids.append(int(uid))
+        except (TypeError, ValueError):
+            continue
+
+    user_ids = presence_visible(user_ids)
+    for uid in user_ids:
+        join_room(f"presence_{uid}")
+
+    emit("presence_snapshot", {
+        "online": sorted(presence.online_among(user_ids))
+    })
+
+
+@socketio.on("typing")
+def typing(data=None):
+    if not current_user.is_authenticated:
+        return
+
+    data = data or {}
+    group_id = data.get("group_id")
+    receiver_id = data.get("receiver_id")
+
+    if group_id:
+        if not group_members.is_member(group_id, current_user.id):
+            return
+        target = f"group_{group_id}"
+    elif receiver_id:
+        target = f"user_{receiver_id}"
+    else:
+        return
+
+    if not presence.should_send_typing(current_user.id, target):
+        return
+
+    socketio.emit(
+        "typing",
+        {
+            "user_id": current_user.id,
+            "username": current_user.username,
+            "group_id": group_id
+        },
+        to=target,
+        skip_sid=request.sid
+    )
 
 
 @socketio.on("join_group")
 def join_group(data):
     group_id = data.get("group_id")
-    if current_user.is_authenticated and group_id:
-        join_room(f"group_{group_id}")
-        print(f"User {current_user.id} joined group_{group_id}")
+    if not (current_user.is_authenticated and group_id):
+        return
+
+    if not group_members.is_member(group_id, current_user.id):
+        return
+
+    join_room(f"group_{group_id}")
 
 
 @socketio.on("join_match_room")
@@ -2626,16 +3018,6 @@ def join_match_room(data):
     join_room(f"match_{match_id}")
 
 
-# -------------------------------------------------
-# JOIN GROUP ROOM
-# -------------------------------------------------
-@socketio.on("join_group")
-def handle_join_group(data):
-    group_id = data.get("group_id")
-    if group_id:
-        join_room(f"group_{group_id}")
-        print(f"✅ Joined group room: group_{group_id}")
-
 # -------------------- SOCKET EVENTS --------------------
 @socketio.on("send_message")
 def handle_send_message(data):
@@ -2643,14 +3025,12 @@ def handle_send_message(data):
     receiver_id = data.get("receiver_id")
     content = data.get("content")
 
-    msg = Message(
+    # commits now, or queues for the write-behind batcher
+    msg = chat_store.save(
         sender_id=sender_id,
         receiver_id=receiver_id,
-        content=content,
-        delivered=1
+        content=content
     )
-    db.session.add(msg)
-    db.session.commit()
 
     payload = {
         "id": msg.id,
@@ -2683,14 +3063,15 @@ def handle_group_message(data):
     content = data.get("content")
     group_id = data.get("group_id")
 
-    msg = Message(
+    # only members may post (no DB hit, see services/chat_groups.py)
+    if not current_user.is_authenticated or not group_members.is_member(group_id, current_user.id):
+        return
+
+    msg = chat_store.save(
         sender_id=current_user.id,
         group_id=group_id,
-        content=content,
-        delivered=1
+        content=content
     )
-    db.session.add(msg)
-    db.session.commit()
 
     socketio.emit(
         "receive_group_message",
@@ -2707,10 +3088,13 @@ def handle_group_message(data):
 
 @socketio.on("edit_group_message")
 def edit_group_message(data):
+    chat_store.ensure_persisted(data["msg_id"])
     msg = Message.query.get(data["msg_id"])
     if msg and msg.sender_id == current_user.id:
         msg.content = data["content"]
+        msg.updated_at = datetime.utcnow()
         db.session.commit()
+        chat_search.update(msg)
 
         socketio.emit(
             "group_message_edited",
@@ -2725,10 +3109,12 @@ def edit_group_message(data):
 
 @socketio.on("delete_group_message")
 def delete_group_message(data):
+    chat_store.ensure_persisted(data["msg_id"])
     msg = Message.query.get(data["msg_id"])
     if msg and msg.sender_id == current_user.id:
         msg.is_deleted = 1
         db.session.commit()
+        chat_search.remove(msg.id)
 
         socketio.emit(
             "group_message_deleted",
@@ -2742,6 +3128,7 @@ def delete_group_message(data):
 
 @socketio.on("message_read")
 def message_read(data):
+    chat_store.ensure_persisted(data["message_id"])
     msg = Message.query.get(data["message_id"])
     msg.is_read = 1
     db.session.commit()
@@ -2753,23 +3140,28 @@ def message_read(data):
 
 @socketio.on("edit_message")
 def edit_message(data):
+    chat_store.ensure_persisted(data["id"])
     msg = Message.query.get(data["id"])
     if msg.sender_id == current_user.id:
-        msg.message = data["new_text"]
+        msg.content = data["new_text"]
+        msg.updated_at = datetime.utcnow()
         db.session.commit()
+        chat_search.update(msg)
 
         emit("message_edited", {
             "id": msg.id,
-            "new_text": msg.message
+            "new_text": msg.content
         }, room=data["room"])
 
 
 @socketio.on("delete_message")
 def delete_message(data):
+    chat_store.ensure_persisted(data["id"])
     msg = Message.query.get(data["id"])
     if msg.sender_id == current_user.id:
         msg.is_deleted = 1
         db.session.commit()
+        chat_search.remove(msg.id)
 
         emit("message_deleted", {
             "id": msg.id
@@ -2794,4 +3186,5 @@ def handle_mark_read(data):
 # RUN SERVER
 # --------------------------------------------------------
 if __name__ == "__main__":
+    start_background_tasks()
     socketio.run(app, debug=True)
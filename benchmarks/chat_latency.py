@@ -0,0 +1,130 @@
+"""
+Send-to-receive latency of direct chat messages, sync vs write-behind.
+
+    python benchmarks/chat_latency.py --messages 500 --db-latency-ms 20
+
+Every SQL statement is delayed by --db-latency-ms to stand in for the
+round trip to the hosted MySQL. Uses a throwaway SQLite file unless
+DATABASE_URL is already set.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+tmp = tempfile.mkdtemp(prefix="chat_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+os.environ["CHAT_JOURNAL_DIR"] = os.path.join(tmp, "journal")
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, socketio
+from models import db, User, Message
+from services.chat_store import chat_store
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values))) - 1))
+    return values[k]
+
+
+def make_user(name):
+    u = User.query.filter_by(username=name).first()
+    if not u:
+        u = User(
+            username=name, email=f"{name}@bench.local",
+            password_hash=generate_password_hash("x"),
+            role="player", status="approved"
+        )
+        db.session.add(u)
+        db.session.commit()
+    return u.id
+
+
+def logged_in_socket(user_id):
+    http = app.test_client()
+    with http.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+    return socketio.test_client(app, flask_test_client=http)
+
+
+def run(mode, sender_id, receiver_id, n):
+    if mode == "write-behind":
+        chat_store.start()
+    else:
+        chat_store.enabled = False
+
+    sender = logged_in_socket(sender_id)
+    receiver = logged_in_socket(receiver_id)
+    receiver.get_received()
+
+    samples = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        sender.emit("send_message", {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "content": f"{mode} #{i}"
+        })
+
+        got = [
+            p for p in receiver.get_received()
+            if p["name"] == "receive_message"
+        ]
+        if got:
+            samples.append((time.perf_counter() - t0) * 1000)
+
+        # think time between messages; lets the batcher run
+        time.sleep(0.001)
+
+    sender.disconnect()
+    receiver.disconnect()
+
+    if mode == "write-behind":
+        chat_store.stop()
+
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--db-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        sender_id = make_user("bench_sender")
+        receiver_id = make_user("bench_receiver")
+
+        delay = args.db_latency_ms / 1000.0
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _simulated_round_trip(*_):
+            time.sleep(delay)
+
+        before = Message.query.count()
+
+    print(f"{args.messages} messages, simulated DB round trip {args.db_latency_ms} ms")
+    print(f"{'mode':<14}{'p50 ms':>10}{'p99 ms':>10}")
+
+    for mode in ("sync", "write-behind"):
+        samples = run(mode, sender_id, receiver_id, args.messages)
+        print(f"{mode:<14}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}")
+
+    with app.app_context():
+        stored = Message.query.count() - before
+    print(f"rows persisted: {stored} / {2 * args.messages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Coach-note matching: the old substring chain vs the compiled matcher.
+
+    python benchmarks/drill_matcher.py --notes 20000
+
+Prints time per note and how many DRILL_MAP topics each approach can
+reach, plus a few notes where the substring chain misfires. "substring,
+all" is the old approach stretched to every phrase the matcher knows,
+i.e. what the chain would cost at the same coverage.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drillmap import DRILL_MAP
+from services.drill_matcher import SYNONYMS, matcher
+
+
+def legacy_topics(note):
+    """The chain generate_ai_suggestions used before the matcher."""
+    note = note.lower()
+    topics = []
+    if "bat" in note or "swing" in note:
+        topics.append("bat swing")
+    if "foot" in note:
+        topics.append("footwork batting")
+    if "timing" in note:
+        topics.append("timing")
+    if "bowling" in note or "action" in note:
+        topics.append("bowling action")
+    if "fitness" in note or "balance" in note:
+        topics.append("balance training")
+    return topics
+
+
+def naive_all_topics(note):
+    """Substring checks extended to every phrase the matcher knows."""
+    note = note.lower()
+    topics = set()
+    for phrase, votes in matcher.votes.items():
+        if phrase in note:
+            topics.update(votes)
+    return topics
+
+
+FILLER = (
+    "good session today needs to work on his the ball was keeping low "
+    "nets after lunch very keen great attitude struggled a bit with "
+    "combat batch warmup"
+).split()
+
+
+def make_notes(n, seed=7):
+    rng = random.Random(seed)
+    phrases = list(DRILL_MAP) + list(SYNONYMS) + [
+        term for data in DRILL_MAP.values() for term in data["focus"]
+    ]
+    notes = []
+    for _ in range(n):
+        words = rng.sample(FILLER, 8)
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(phrases))
+        notes.append(" ".join(words))
+    return notes
+
+
+def bench(fn, notes):
+    start = time.perf_counter()
+    hits = set()
+    for note in notes:
+        hits.update(fn(note))
+    elapsed = time.perf_counter() - start
+    return elapsed / len(notes) * 1e6, hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=20000)
+    args = parser.parse_args()
+
+    notes = make_notes(args.notes)
+
+    legacy_us, legacy_hits = bench(legacy_topics, notes)
+    naive_us, naive_hits = bench(naive_all_topics, notes)
+    compiled_us, compiled_hits = bench(matcher.match, notes)
+
+    print(f"notes:            {len(notes)}")
+    print(f"substring chain:  {legacy_us:7.2f} us/note  topics reachable: {len(legacy_hits)}/{len(DRILL_MAP)}")
+    print(f"substring, all:   {naive_us:7.2f} us/note  topics reachable: {len(naive_hits)}/{len(DRILL_MAP)}")
+    print(f"compiled matcher: {compiled_us:7.2f} us/note  topics reachable: {len(compiled_hits)}/{len(DRILL_MAP)}")
+
+    print("\nfalse positives of the substring chain:")
+    for note in ("combat fitness drills", "batch moved to evening", "footage reviewed"):
+        print(f"  {note!r:32} chain={legacy_topics(note)} matcher={matcher.match(note)}")
+
+
+if __name__ == "__main__":
+    main()
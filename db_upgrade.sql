@@ -0,0 +1,146 @@
+-- ============================================================
+-- Schema upgrades for an existing database.
+-- New installs get these from db.create_all(); run the blocks
+-- added since your last deploy, in order.
+-- ============================================================
+
+-- ============================
+-- CHAT SEARCH (FULLTEXT on messages.content)
+-- ============================
+ALTER TABLE messages ADD FULLTEXT INDEX ft_messages_content (content);
+
+-- ============================
+-- CHAT ARCHIVE + HOT TABLE INDEXES
+-- ============================
+CREATE INDEX ix_messages_receiver_read ON messages (receiver_id, is_read);
+CREATE INDEX ix_messages_pair_created ON messages (sender_id, receiver_id, created_at);
+CREATE INDEX ix_messages_group_created ON messages (group_id, created_at);
+-- messages_archive itself is created by db.create_all()
+
+-- ============================
+-- NOTIFICATION CATEGORY
+-- ============================
+ALTER TABLE notifications ADD COLUMN category VARCHAR(50) NULL;
+
+-- ============================
+-- NOTIFICATION INBOX INDEX
+-- ============================
+CREATE INDEX ix_notifications_user_read_created ON notifications (user_id, is_read, created_at);
+
+
+-- ============================
+-- NOTIFICATION DIGEST / DEDUP
+-- ============================
+ALTER TABLE notifications ADD COLUMN dedup_key VARCHAR(120) NULL;
+ALTER TABLE notifications ADD COLUMN count INT NOT NULL DEFAULT 1;
+ALTER TABLE notifications ADD CONSTRAINT uq_notifications_user_dedup UNIQUE (user_id, dedup_key);
+
+-- ============================
+-- ATTENDANCE UPSERT KEY
+-- ============================
+-- remove duplicate (player_id, date) rows first, keeping the newest
+DELETE a FROM attendance a JOIN attendance b
+  ON a.player_id = b.player_id AND a.date = b.date AND a.id < b.id;
+ALTER TABLE attendance ADD CONSTRAINT uq_attendance_player_date UNIQUE (player_id, date);
+
+-- ============================
+-- BATCH-SCOPED ATTENDANCE SESSIONS
+-- ============================
+-- attendance_sessions itself is created by db.create_all()
+CREATE INDEX ix_players_batch_id ON players (batch_id);
+ALTER TABLE attendance
+  ADD COLUMN session_id INT NULL,
+  ADD COLUMN slot ENUM('morning', 'evening') NOT NULL DEFAULT 'morning',
+  ADD CONSTRAINT fk_attendance_session FOREIGN KEY (session_id) REFERENCES attendance_sessions (id);
+ALTER TABLE attendance
+  DROP INDEX uq_attendance_player_date,
+  ADD CONSTRAINT uq_attendance_player_date_slot UNIQUE (player_id, date, slot);
+-- then give the rows saved before sessions existed their batch session
+-- (unbatched players get a batch by age first):
+--   flask attendance-sessions-backfill
+-- rows of players still without a batch are reported; assign them a batch
+-- on /attendance and run it again, then flask attendance-rollup-rebuild
+
+-- ============================
+-- ATTENDANCE ROLLUPS
+-- ============================
+-- attendance_monthly and attendance_streaks are created by db.create_all();
+-- then fill them from existing rows with: flask attendance-rollup-rebuild
+
+
+-- ============================
+-- PAYMENT RECONCILIATION
+-- ============================
+-- payment_events is created by db.create_all()
+CREATE INDEX ix_match_payments_razorpay_order_id ON match_payments (razorpay_order_id);
+
+
+-- ============================
+-- PAYMENT SUMMARIES
+-- ============================
+-- payment_summaries is created by db.create_all();
+-- then fill it from existing rows with: flask payments-summary-rebuild
+CREATE INDEX ix_match_payments_session_user_status
+  ON match_payments (availability_id, user_id, payment_status);
+
+
+-- ============================
+-- ONE ACTIVE PAYMENT PER PLAYER PER SESSION
+-- ============================
+ALTER TABLE match_payments ADD COLUMN is_active TINYINT(1) NULL;
+-- keep the paid row (else the latest) of every player/session active
+UPDATE match_payments m
+JOIN (
+  SELECT COALESCE(MAX(CASE WHEN payment_status = 'paid' THEN id END), MAX(id)) AS id
+  FROM match_payments
+  GROUP BY availability_id, user_id
+) keep ON keep.id = m.id
+SET m.is_active = 1;
+ALTER TABLE match_payments
+  ADD CONSTRAINT uq_match_payments_active UNIQUE (availability_id, user_id, is_active);
+
+
+-- ============================
+-- CASH RECEIPTS
+-- ============================
+ALTER TABLE match_payments ADD COLUMN receipt VARCHAR(80) NULL;
+CREATE INDEX ix_match_payments_receipt ON match_payments (receipt);
+-- then move the old static/uploads/payments files: flask payments-receipts-migrate
+
+
+-- ============================
+-- NUTRITION ROLLUPS
+-- ============================
+CREATE INDEX ix_nutrition_log_user_date ON nutrition_log (user_id, log_date);
+CREATE INDEX ix_nutrition_log_group_created ON nutrition_log (group_id, created_at);
+-- nutrition_daily and nutrition_group_daily are created by db.create_all();
+-- then fill them from existing logs with: flask nutrition-rollup-rebuild
+
+
+-- ============================
+-- FOOD CATEGORIES (calculator search facets)
+-- ============================
+ALTER TABLE food_item ADD COLUMN category VARCHAR(30) NULL;
+CREATE INDEX ix_food_item_category ON food_item (category);
+-- fruits / vegetables / nuts_seeds / dairy / grains / protein, as on /diet/foods/*
+
+
+-- ============================
+-- LIVE BALL WAGON FIELDS (sent by the scoring panel)
+-- ============================
+ALTER TABLE live_balls ADD COLUMN angle FLOAT NULL;
+ALTER TABLE live_balls ADD COLUMN shot_type VARCHAR(50) NULL;
+
+
+-- ============================
+-- ATTENDANCE ROLLUPS PER BATCH
+-- ============================
+-- monthly counts are kept per batch; the rollup is rebuilt from attendance
+DELETE FROM attendance_monthly;
+ALTER TABLE attendance_monthly
+  ADD COLUMN batch_id INT NOT NULL AFTER player_id,
+  ADD CONSTRAINT fk_attendance_monthly_batch FOREIGN KEY (batch_id) REFERENCES batches (id),
+  DROP INDEX uq_attendance_monthly,
+  ADD CONSTRAINT uq_attendance_monthly UNIQUE (player_id, year, month, batch_id),
+  ADD INDEX ix_attendance_monthly_batch_month (batch_id, year, month);
+-- then: flask attendance-rollup-rebuild
@@ -3,10 +3,11 @@ from .base_models import db
 # Import in correct order to avoid circular dependencies
 from .player_model import User, Player, Coach, Batch, Match, MatchAssignment, OpponentTempPlayer, ManualScore, WagonWheel, LiveBall
 from .stats_model import PlayerStats, BattingStats, BowlingStats, FieldingStats
-from .attendance import Attendance
+from .attendance import Attendance, AttendanceSession
+from .attendance_rollup import AttendanceMonthly, AttendanceStreak
 # Notifications & Chat
 from .notification import Notification
-from .message import Message
+from .message import Message, MessageArchive, MessageIdSequence
 
 from .chat_group import ChatGroup , ChatGroupMember
 from .pre_match import PreMatchResponse
@@ -15,8 +16,9 @@ from .food_item import FoodItem
 from .nutrition_group import NutritionGroup
 from .nutrition_log import NutritionLog
 from .nutrition_log_item import NutritionLogItem
+from .nutrition_rollup import NutritionDaily, NutritionGroupDaily
 from .nutrition_group_member import NutritionGroupMember
-from .payment import MatchPayment
+from .payment import MatchPayment, PaymentEvent, PaymentSummary
 
 
 __all__ = [
@@ -24,7 +26,9 @@ __all__ = [
     "User", "Player", "Coach", "Batch", "Match",
     "MatchAssignment", "OpponentTempPlayer",
     "ManualScore", "WagonWheel", "LiveBall",
-    "PlayerStats", "BattingStats", "BowlingStats", "FieldingStats", "Attendance",
-    "Notification", "Message","ChatGroup","ChatGroupMember","PreMatchAvailability","PreMatchResponse","FoodItem",
-    "NutritionGroup", "NutritionLog", "NutritionLogItem","NutritionGroupMember","MatchPayment"
+    "PlayerStats", "BattingStats", "BowlingStats", "FieldingStats", "Attendance", "AttendanceSession",
+    "AttendanceMonthly", "AttendanceStreak",
+    "Notification", "Message", "MessageArchive", "MessageIdSequence","ChatGroup","ChatGroupMember","PreMatchAvailability","PreMatchResponse","FoodItem",
+    "NutritionGroup", "NutritionLog", "NutritionLogItem","NutritionGroupMember",
+    "NutritionDaily", "NutritionGroupDaily","MatchPayment","PaymentEvent","PaymentSummary"
 ]
@@ -1,15 +1,42 @@
-from datetime import date
+from datetime import date, datetime
 from .base_models import db
 
+
+class AttendanceSession(db.Model):
+    """One coach-marked session: a batch on a date, morning or evening."""
+    __tablename__ = "attendance_sessions"
+    __table_args__ = (
+        db.UniqueConstraint("batch_id", "date", "slot", name="uq_attendance_session"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    slot = db.Column(db.Enum("morning", "evening"), nullable=False)
+    edit_count = db.Column(db.Integer, default=0, nullable=False)
+    marked_by = db.Column(db.Integer)   # user id of the coach who first saved
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    batch = db.relationship("Batch")
+
+
 class Attendance(db.Model):
     __tablename__ = "attendance"
+    __table_args__ = (
+        # one mark per player per session slot; bulk saves upsert on this
+        db.UniqueConstraint("player_id", "date", "slot", name="uq_attendance_player_date_slot"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     player_id = db.Column(db.Integer, db.ForeignKey("players.id"), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey("attendance_sessions.id"))
     date = db.Column(db.Date, default=date.today)
+    slot = db.Column(db.Enum("morning", "evening"), nullable=False, server_default="morning")
     status = db.Column(db.Enum("present", "absent", "late"), nullable=False)
     improvement_note = db.Column(db.Text)
     edit_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
     player = db.relationship("Player", backref="attendance_records")
+    session = db.relationship("AttendanceSession", backref="records")
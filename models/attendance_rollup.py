@@ -0,0 +1,45 @@
+from datetime import datetime
+from .base_models import db
+
+
+class AttendanceMonthly(db.Model):
+    """
+    Per-player, per-batch, per-month attendance counts, kept up to date on
+    every save. batch_id is the batch of the sessions counted, so a player
+    who moves up a batch keeps their old months under the old batch.
+    """
+    __tablename__ = "attendance_monthly"
+    __table_args__ = (
+        db.UniqueConstraint("player_id", "year", "month", "batch_id", name="uq_attendance_monthly"),
+        # batch heatmap / rates
+        db.Index("ix_attendance_monthly_batch_month", "batch_id", "year", "month"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey("players.id"), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    present = db.Column(db.Integer, default=0, nullable=False)
+    absent = db.Column(db.Integer, default=0, nullable=False)
+    late = db.Column(db.Integer, default=0, nullable=False)
+
+    @property
+    def total(self):
+        return self.present + self.absent + self.late
+
+    @property
+    def rate(self):
+        """Attended (present + late) as a percentage, None without sessions."""
+        return round(100 * (self.present + self.late) / self.total) if self.total else None
+
+
+class AttendanceStreak(db.Model):
+    """Current run of attended / missed sessions per player."""
+    __tablename__ = "attendance_streaks"
+
+    player_id = db.Column(db.Integer, db.ForeignKey("players.id"), primary_key=True)
+    present_streak = db.Column(db.Integer, default=0, nullable=False)
+    absent_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
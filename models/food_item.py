@@ -5,6 +5,7 @@ class FoodItem(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
+    category = db.Column(db.String(30), index=True)   # services/food_catalogue.CATEGORIES
     calories = db.Column(db.Float)
     protein = db.Column(db.Float)
     carbs = db.Column(db.Float)
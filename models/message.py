@@ -3,6 +3,16 @@ from datetime import datetime
 
 class Message(db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        # chat search (services/chat_search.py, mysql backend)
+        db.Index("ft_messages_content", "content", mysql_prefix="FULLTEXT"),
+        # inbox / unread / conversation pages
+        db.Index("ix_messages_receiver_read", "receiver_id", "is_read"),
+        db.Index("ix_messages_pair_created", "sender_id", "receiver_id", "created_at"),
+        db.Index("ix_messages_group_created", "group_id", "created_at"),
+    )
+
+    is_archived = False
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -24,4 +34,42 @@ class Message(db.Model):
         "User",
         foreign_keys=[sender_id],
         backref="sent_messages"
-    )
\ No newline at end of file
+    )
+
+
+class MessageArchive(db.Model):
+    """
+    Cold copy of old messages (services/chat_archive.py moves them here).
+    Same ids and columns as messages, so pages can read both.
+    """
+    __tablename__ = "messages_archive"
+    __table_args__ = (
+        db.Index("ix_messages_archive_pair_created", "sender_id", "receiver_id", "created_at"),
+        db.Index("ix_messages_archive_group_created", "group_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    sender_id = db.Column(db.Integer, nullable=False)
+    receiver_id = db.Column(db.Integer, nullable=True)
+    group_id = db.Column(db.Integer, nullable=True)
+
+    content = db.Column(db.Text, nullable=False)
+
+    delivered = db.Column(db.Boolean, default=True)
+    is_read = db.Column(db.Boolean, default=False)
+    is_deleted = db.Column(db.Boolean, default=False)
+
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    is_archived = True
+
+
+class MessageIdSequence(db.Model):
+    """Single-row id allocator used by write-behind chat (see services/chat_store.py)."""
+    __tablename__ = "message_id_sequence"
+
+    id = db.Column(db.Integer, primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
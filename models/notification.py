@@ -3,10 +3,19 @@ from .base_models import db
 
 class Notification(db.Model):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # inbox + dashboard "unread in last N minutes" queries
+        db.Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+        # one row per (user, dedup_key): reminders + digests upsert on this
+        db.UniqueConstraint("user_id", "dedup_key", name="uq_notifications_user_dedup"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     message = db.Column(db.String(255), nullable=False)
     link = db.Column(db.String(255))
+    category = db.Column(db.String(50))
+    dedup_key = db.Column(db.String(120))
+    count = db.Column(db.Integer, default=1, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
@@ -1,8 +1,12 @@
 from .base_models import db
-from datetime import date
+from datetime import date, datetime
 
 class NutritionLog(db.Model):
     __tablename__ = "nutrition_log"
+    __table_args__ = (
+        db.Index("ix_nutrition_log_user_date", "user_id", "log_date"),
+        db.Index("ix_nutrition_log_group_created", "group_id", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
@@ -15,7 +19,7 @@ class NutritionLog(db.Model):
     total_carbs = db.Column(db.Float)
     total_fat = db.Column(db.Float)
 
-    created_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # ✅ RELATIONSHIP (FIXES your error)
     user = db.relationship("User", backref="nutrition_logs")
@@ -0,0 +1,40 @@
+from .base_models import db
+
+
+class NutritionDaily(db.Model):
+    """Macros one user logged on one day (all groups), kept up to date on every log."""
+    __tablename__ = "nutrition_daily"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "log_date", name="uq_nutrition_daily"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    log_date = db.Column(db.Date, nullable=False)
+    calories = db.Column(db.Float, default=0, nullable=False)
+    protein = db.Column(db.Float, default=0, nullable=False)
+    carbs = db.Column(db.Float, default=0, nullable=False)
+    fat = db.Column(db.Float, default=0, nullable=False)
+    logs = db.Column(db.Integer, default=0, nullable=False)
+
+
+class NutritionGroupDaily(db.Model):
+    """Macros logged to one group on one day, and by how many members."""
+    __tablename__ = "nutrition_group_daily"
+    __table_args__ = (
+        db.UniqueConstraint("group_id", "log_date", name="uq_nutrition_group_daily"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("nutrition_group.id"), nullable=False)
+    log_date = db.Column(db.Date, nullable=False)
+    calories = db.Column(db.Float, default=0, nullable=False)
+    protein = db.Column(db.Float, default=0, nullable=False)
+    carbs = db.Column(db.Float, default=0, nullable=False)
+    fat = db.Column(db.Float, default=0, nullable=False)
+    logs = db.Column(db.Integer, default=0, nullable=False)
+    members = db.Column(db.Integer, default=0, nullable=False)   # distinct users who logged
+
+    def average(self, macro):
+        """Per logging member."""
+        return getattr(self, macro) / self.members if self.members else 0
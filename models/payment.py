@@ -3,6 +3,13 @@ from models import db
 
 class MatchPayment(db.Model):
     __tablename__ = "match_payments"
+    __table_args__ = (
+        # per-session aggregates + coach history filter (covering for both)
+        db.Index("ix_match_payments_session_user_status", "availability_id", "user_id", "payment_status"),
+        # at most one active payment per player per session; superseded
+        # rows have is_active NULL, which the unique index ignores
+        db.UniqueConstraint("availability_id", "user_id", "is_active", name="uq_match_payments_active"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -12,10 +19,57 @@ class MatchPayment(db.Model):
     amount = db.Column(db.Numeric(10, 2), nullable=False)
 
     payment_method = db.Column(db.String(20), nullable=False)  # razorpay / cash
-    payment_status = db.Column(db.String(20), default="pending")  # pending / paid / cash_pending
+    payment_status = db.Column(db.String(20), default="pending")  # pending / paid / cash_pending / failed
 
-    razorpay_order_id = db.Column(db.String(100))
+    # reconciliation matches webhooks to payments by order id
+    razorpay_order_id = db.Column(db.String(100), index=True)
     razorpay_payment_id = db.Column(db.String(100))
     razorpay_signature = db.Column(db.String(255))
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    is_active = db.Column(db.Boolean, default=True)   # True or NULL, never False
+
+    # cash receipt, content-addressed name in services/receipts
+    receipt = db.Column(db.String(80), index=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PaymentSummary(db.Model):
+    """
+    Payment counts per pre-match session (one player counted once, by
+    their best payment), refreshed by services/payment_stats on every
+    payment state change so dashboards never scan match_payments.
+    """
+    __tablename__ = "payment_summaries"
+
+    availability_id = db.Column(db.Integer, db.ForeignKey("pre_match_availability.id"), primary_key=True)
+    expected = db.Column(db.Integer, default=0, nullable=False)      # players marked available
+    paid = db.Column(db.Integer, default=0, nullable=False)
+    cash_pending = db.Column(db.Integer, default=0, nullable=False)
+    pending = db.Column(db.Integer, default=0, nullable=False)        # order created, not settled
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    collected = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def unpaid(self):
+        """Available players with no payment settled yet."""
+        return max(self.expected - self.paid, 0)
+
+
+class PaymentEvent(db.Model):
+    """
+    Gateway webhook inbox. The webhook only stores the verified event;
+    the reconciliation worker applies them to match_payments in batches.
+    """
+    __tablename__ = "payment_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(100), unique=True)   # X-Razorpay-Event-Id, dedups retries
+    event = db.Column(db.String(50), nullable=False)     # payment.captured / payment.failed / order.paid
+    order_id = db.Column(db.String(100), index=True)
+    payment_id = db.Column(db.String(100))
+    payload = db.Column(db.Text)
+
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, index=True)
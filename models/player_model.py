@@ -51,7 +51,7 @@ class Player(db.Model):
     role_in_team = db.Column(db.String(50))
     bio = db.Column(db.Text)
 
-    batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"))
+    batch_id = db.Column(db.Integer, db.ForeignKey("batches.id"), index=True)
 
     user = db.relationship("User", back_populates="player")
     batch = db.relationship("Batch")
@@ -204,5 +204,7 @@ class LiveBall(db.Model):
     extras = db.Column(db.String(20))
     wicket = db.Column(db.String(20))
     commentary = db.Column(db.Text)
+    angle = db.Column(db.Float)
+    shot_type = db.Column(db.String(50))
 
     
\ No newline at end of file
@@ -1,25 +1,22 @@
+import json
 import os
-import razorpay
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import (
+    Blueprint, current_app, render_template, request, redirect, url_for,
+    flash, jsonify, abort, send_file
+)
 from flask_login import login_required, current_user
 
-from models import db, PreMatchAvailability, PreMatchResponse
-from models.payment import MatchPayment
+from models import db, PreMatchAvailability, PreMatchResponse, User
+from models.payment import MatchPayment, PaymentSummary
+from services.payment_gateway import gateway, GatewayUnavailable
+from services.payment_reconciler import reconciler
+from services.payment_orders import payment_orders, OrderRejected
+from services.payment_stats import refresh as refresh_summary, summaries
+from services.receipts import receipts, ReceiptRejected
 
 payments_bp = Blueprint("payments", __name__)
 
-# -------------------------------------------------
-# Razorpay Client (TEST & LIVE both supported)
-# -------------------------------------------------
-def get_razorpay_client():
-    return razorpay.Client(
-        auth=(
-            os.getenv("RAZORPAY_KEY_ID"),
-            os.getenv("RAZORPAY_KEY_SECRET")
-        )
-    )
-
 # -------------------------------------------------
 # PAYMENT PAGE
 # -------------------------------------------------
@@ -36,13 +33,9 @@ def payment_page(availability_id):
         status="available"
     ).first_or_404()
 
-    existing = MatchPayment.query.filter_by(
-        availability_id=availability.id,
-        user_id=current_user.id,
-        payment_status="paid"
-    ).first()
+    existing = payment_orders.active(availability.id, current_user.id)
 
-    if existing:
+    if existing and existing.payment_status == "paid":
         flash("Payment already completed", "info")
         return redirect(url_for("payments.payment_history_player"))
 
@@ -60,42 +53,16 @@ def create_payment_order(availability_id):
 
     availability = PreMatchAvailability.query.get_or_404(availability_id)
 
-    # prevent duplicate payment
-    existing = MatchPayment.query.filter_by(
-        availability_id=availability.id,
-        user_id=current_user.id,
-        payment_status="paid"
-    ).first()
-
-    if existing:
-        return jsonify({"error": "Already paid"}), 400
-
+    # one active payment per player per session: repeated clicks get the
+    # same order back instead of a new gateway order + row each time
     try:
-        order = razorpay_client.order.create({
-            "amount": int(float(availability.amount) * 100),  # paise
-            "currency": "INR",
-            "payment_capture": 1
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-    payment = MatchPayment(
-        availability_id=availability.id,
-        user_id=current_user.id,
-        amount=availability.amount,
-        payment_method="razorpay",
-        payment_status="pending",
-        razorpay_order_id=order["id"]
-    )
-
-    db.session.add(payment)
-    db.session.commit()
+        checkout = payment_orders.checkout(availability, current_user.id)
+    except OrderRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except GatewayUnavailable as e:
+        return jsonify({"error": str(e)}), 503
 
-    return jsonify({
-        "order_id": order["id"],
-        "amount": int(float(availability.amount) * 100),
-        "key": os.getenv("RAZORPAY_KEY_ID")
-    })
+    return jsonify(checkout)
 
 # -------------------------------------------------
 # PAYMENT SUCCESS CALLBACK
@@ -107,37 +74,79 @@ def payment_success():
     data = request.form
 
     payment = MatchPayment.query.filter_by(
-        razorpay_order_id=data.get("razorpay_order_id")
+        razorpay_order_id=data.get("razorpay_order_id"),
+        user_id=current_user.id
     ).first_or_404()
 
-    payment.razorpay_payment_id = data.get("razorpay_payment_id")
-    payment.razorpay_signature = data.get("razorpay_signature")
-    payment.payment_status = "paid"
+    # 🔐 never trust the browser: the signature must match our key secret
+    if not gateway.verify_payment(
+        data.get("razorpay_order_id"),
+        data.get("razorpay_payment_id"),
+        data.get("razorpay_signature")
+    ):
+        flash("Payment could not be verified. If money was debited it will be confirmed automatically.", "danger")
+        return redirect(url_for("payments.payment_history_player"))
 
-    db.session.commit()
+    if payment.payment_status != "paid":
+        payment.razorpay_payment_id = data.get("razorpay_payment_id")
+        payment.razorpay_signature = data.get("razorpay_signature")
+        payment.payment_status = "paid"
+        db.session.flush()
+        refresh_summary([payment.availability_id])
+        db.session.commit()
+        payment_orders.forget(payment.availability_id, payment.user_id)
 
     flash("Payment successful ✅", "success")
     return redirect(url_for("payments.payment_history_player"))
 
+# -------------------------------------------------
+# GATEWAY WEBHOOK (no login - verified by signature)
+# -------------------------------------------------
+@payments_bp.route("/payment/webhook", methods=["POST"])
+def payment_webhook():
+
+    body = request.get_data()
+    if not gateway.verify_webhook(body, request.headers.get("X-Razorpay-Signature")):
+        abort(400)
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        abort(400)
+
+    # stored only; the reconciliation worker applies it in bulk
+    reconciler.record_event(
+        request.headers.get("X-Razorpay-Event-Id") or f"{payload.get('event')}:{payload.get('created_at')}:{len(body)}",
+        payload
+    )
+    db.session.commit()
+
+    return jsonify({"status": "ok"})
+
 # -------------------------------------------------
 # CASH PAYMENT
 # -------------------------------------------------
-@payments_bp.route("/payment/cash/<int:availability_id>")
+@payments_bp.route("/payment/cash/<int:availability_id>", methods=["GET", "POST"])
 @login_required
 def cash_payment(availability_id):
 
     availability = PreMatchAvailability.query.get_or_404(availability_id)
 
-    payment = MatchPayment(
-        availability_id=availability.id,
-        user_id=current_user.id,
-        amount=availability.amount,
-        payment_method="cash",
-        payment_status="cash_pending"
-    )
+    # optional photo / PDF of the receipt, stored by content hash
+    receipt = None
+    upload = request.files.get("receipt")
+    if upload and upload.filename:
+        try:
+            receipt = receipts.save(upload)
+        except ReceiptRejected as e:
+            flash(str(e), "danger")
+            return redirect(url_for("payments.payment_page", availability_id=availability.id))
 
-    db.session.add(payment)
-    db.session.commit()
+    try:
+        payment_orders.request_cash(availability, current_user.id, receipt=receipt)
+    except OrderRejected as e:
+        flash(str(e), "info")
+        return redirect(url_for("payments.payment_history_player"))
 
     flash("Cash payment sent for coach approval", "info")
     return redirect(url_for("payments.payment_history_player"))
@@ -168,11 +177,134 @@ def payment_history_coach():
     if current_user.role != "coach":
         abort(403)
 
-    payments = MatchPayment.query.order_by(
-        MatchPayment.created_at.desc()
-    ).all()
+    page = request.args.get("page", 1, type=int)
+    availability_id = request.args.get("availability_id", type=int)
+    status = request.args.get("status") or None
+
+    query = db.session.query(
+        MatchPayment, User.username, PreMatchAvailability.title
+    ).join(
+        User, User.id == MatchPayment.user_id
+    ).join(
+        PreMatchAvailability, PreMatchAvailability.id == MatchPayment.availability_id
+    )
+
+    # (availability_id, user_id, payment_status) index serves the filters
+    if availability_id:
+        query = query.filter(MatchPayment.availability_id == availability_id)
+    if status:
+        query = query.filter(MatchPayment.payment_status == status)
+
+    pagination = query.order_by(MatchPayment.id.desc()).paginate(
+        page=page,
+        per_page=current_app.config["PAYMENTS_PER_PAGE"],
+        error_out=False
+    )
+
+    sessions = PreMatchAvailability.query.order_by(
+        PreMatchAvailability.created_at.desc()
+    ).limit(current_app.config["PAYMENTS_PER_PAGE"]).all()
+
+    selected = PreMatchAvailability.query.get(availability_id) if availability_id else None
+    if selected and selected not in sessions:
+        sessions.insert(0, selected)
 
     return render_template(
         "payment/payment_history_coach.html",
-        payments=payments
-    )
\ No newline at end of file
+        payments=pagination.items,
+        pagination=pagination,
+        sessions=sessions,
+        summaries=summaries([s.id for s in sessions]),
+        availability_id=availability_id,
+        status=status
+    )
+
+# -------------------------------------------------
+# CASH APPROVAL (coach, whole session at once)
+# -------------------------------------------------
+@payments_bp.route("/payment/cash-approval", methods=["GET", "POST"])
+@login_required
+def cash_approval():
+
+    if current_user.role != "coach":
+        abort(403)
+
+    if request.method == "POST":
+        availability_id = request.form.get("availability_id", type=int)
+        PreMatchAvailability.query.get_or_404(availability_id)
+
+        payment_ids = None
+        if not request.form.get("approve_all"):
+            payment_ids = request.form.getlist("payment_ids", type=int)
+            if not payment_ids:
+                flash("Select at least one payment", "warning")
+                return redirect(url_for("payments.cash_approval", availability_id=availability_id))
+
+        approved = payment_orders.approve_cash(availability_id, payment_ids)
+        db.session.commit()
+
+        flash(f"Approved {approved} cash payment(s)", "success")
+        return redirect(url_for("payments.cash_approval", availability_id=availability_id))
+
+    # sessions with cash waiting, straight from payment_summaries
+    waiting = db.session.query(
+        PreMatchAvailability, PaymentSummary.cash_pending
+    ).join(
+        PaymentSummary, PaymentSummary.availability_id == PreMatchAvailability.id
+    ).filter(
+        PaymentSummary.cash_pending > 0
+    ).order_by(PreMatchAvailability.match_date.desc()).all()
+
+    availability_id = request.args.get("availability_id", type=int)
+    if not availability_id and waiting:
+        availability_id = waiting[0][0].id
+    availability = PreMatchAvailability.query.get(availability_id) if availability_id else None
+
+    pending = []
+    if availability:
+        pending = db.session.query(
+            MatchPayment, User.username
+        ).join(
+            User, User.id == MatchPayment.user_id
+        ).filter(
+            MatchPayment.availability_id == availability.id,
+            MatchPayment.payment_method == "cash",
+            MatchPayment.payment_status == "cash_pending"
+        ).order_by(User.username).all()
+
+    return render_template(
+        "payment/cash_approval.html",
+        waiting=waiting,
+        availability=availability,
+        pending=pending,
+        thumbnails=receipts.thumbnails_enabled
+    )
+
+# -------------------------------------------------
+# RECEIPTS (content-addressed, cached by the browser)
+# -------------------------------------------------
+@payments_bp.route("/payment/receipt/<name>")
+@payments_bp.route("/payment/receipt/<name>/thumb", endpoint="receipt_thumb", defaults={"thumb": True})
+@login_required
+def receipt(name, thumb=False):
+
+    if not receipts.valid(name):
+        abort(404)
+
+    # coaches see every receipt, players only their own
+    if current_user.role != "coach":
+        owner = MatchPayment.query.filter_by(receipt=name, user_id=current_user.id).first()
+        if not owner:
+            abort(404)
+
+    path = receipts.thumbnail(name) if thumb else receipts.path(name)
+    if not path or not os.path.exists(path):
+        abort(404)
+
+    # the name is the content hash: the file behind a URL never changes
+    response = send_file(path, max_age=receipts.max_age, etag=name.split(".")[0], conditional=True)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
@@ -0,0 +1,235 @@
+# services/attendance.py
+#
+# Attendance is taken per session: one batch, one date, one slot
+# (morning / evening), stored in attendance_sessions with
+# UNIQUE(batch_id, date, slot).
+#
+# - roster() reads one batch through the players.batch_id index instead
+#   of loading every player in the academy
+# - open_session() is insert-or-ignore on the session key, so two coaches
+#   opening the same session get the same row
+# - claim_edit() bumps edit_count with a guarded UPDATE, so concurrent
+#   saves cannot both slip under the limit or overwrite each other's count
+# - locked_statuses() re-reads the session's marks after that, so the
+#   rollup deltas of a save are taken against what is really stored
+# - save_marks() stores the whole session with one multi-row upsert on
+#   UNIQUE(player_id, date, slot)
+#
+# Sessions belong to a batch, so a player without one cannot be marked:
+# unbatched() lists them on the attendance page, where the coach assigns
+# a batch. backfill_sessions() (flask attendance-sessions-backfill) gives
+# rows saved before sessions existed their session.
+
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Attendance, AttendanceSession, Player, User
+from services.upsert import upsert
+
+STATUSES = ("present", "absent", "late")
+SLOTS = ("morning", "evening")
+MAX_EDITS = 2
+
+
+def default_slot(now=None):
+    """Morning until 2 pm, evening after."""
+    now = now or datetime.now()
+    return "morning" if now.hour < 14 else "evening"
+
+
+def roster(batch_id):
+    """Players of one batch with their users, ordered by username."""
+    return (
+        Player.query
+        .options(joinedload(Player.user))
+        .join(User, Player.user_id == User.id)
+        .filter(Player.batch_id == batch_id)
+        .order_by(User.username.asc())
+        .all()
+    )
+
+
+def unbatched():
+    """Approved players without a batch, ordered by username."""
+    return (
+        Player.query
+        .options(joinedload(Player.user))
+        .join(User, Player.user_id == User.id)
+        .filter(Player.batch_id.is_(None), User.status == "approved")
+        .order_by(User.username.asc())
+        .all()
+    )
+
+
+def get_session(batch_id, day, slot):
+    return AttendanceSession.query.filter_by(
+        batch_id=batch_id,
+        date=day,
+        slot=slot
+    ).first()
+
+
+def open_session(batch_id, day, slot, user_id):
+    """
+    Get or create the session row. Returns (session, created).
+    Caller commits.
+    """
+    result = db.session.execute(
+        insert(AttendanceSession)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .values(
+            batch_id=batch_id,
+            date=day,
+            slot=slot,
+            edit_count=0,
+            marked_by=user_id,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+    )
+    return get_session(batch_id, day, slot), bool(result.rowcount)
+
+
+def claim_edit(session_id, limit=MAX_EDITS):
+    """Count one more edit of a saved session; False once the limit is reached."""
+    result = db.session.execute(
+        db.update(AttendanceSession)
+        .where(
+            AttendanceSession.id == session_id,
+            AttendanceSession.edit_count < limit
+        )
+        .values(
+            edit_count=AttendanceSession.edit_count + 1,
+            updated_at=datetime.utcnow()
+        )
+    )
+    return bool(result.rowcount)
+
+
+def session_records(batch_id, day, slot, status=None):
+    """Attendance rows of one session with player + user loaded."""
+    q = (
+        Attendance.query
+        .options(joinedload(Attendance.player).joinedload(Player.user))
+        .join(AttendanceSession, Attendance.session_id == AttendanceSession.id)
+        .join(Player, Attendance.player_id == Player.id)
+        .join(User, Player.user_id == User.id)
+        .filter(
+            AttendanceSession.batch_id == batch_id,
+            AttendanceSession.date == day,
+            AttendanceSession.slot == slot
+        )
+    )
+    if status:
+        q = q.filter(Attendance.status == status)
+    return q.order_by(User.username.asc()).all()
+
+
+def locked_statuses(session_id):
+    """
+    {player_id: status} of one session, read with FOR UPDATE: call after
+    open_session() / claim_edit() so the rows are the latest committed
+    ones, not the snapshot the request started with. Concurrent saves of
+    the session wait here until this transaction commits.
+    """
+    return dict(
+        db.session.query(Attendance.player_id, Attendance.status)
+        .filter(Attendance.session_id == session_id)
+        .with_for_update()
+        .all()
+    )
+
+
+def save_marks(session, marks):
+    """
+    marks: iterable of (player_id, status, note) for one session.
+    Unknown statuses are stored as "absent". Returns {player_id: status}
+    as stored. Caller commits.
+    """
+    rows = [
+        {
+            "player_id": player_id,
+            "session_id": session.id,
+            "date": session.date,
+            "slot": session.slot,
+            "status": status if status in STATUSES else "absent",
+            "improvement_note": note,
+            "edit_count": 0
+        }
+        for player_id, status, note in marks
+    ]
+    if not rows:
+        return {}
+
+    db.session.execute(upsert(
+        Attendance,
+        rows,
+        ["player_id", "date", "slot"],
+        lambda new: {
+            "session_id": new.session_id,
+            "status": new.status,
+            "improvement_note": new.improvement_note,
+            "edit_count": Attendance.edit_count + 1
+        }
+    ))
+    return {r["player_id"]: r["status"] for r in rows}
+
+
+def backfill_sessions(assign_batch=None):
+    """
+    Link attendance rows saved before sessions existed to a session of
+    their player's batch, creating the sessions. assign_batch(player)
+    may return a Batch for unbatched players first (by age). Returns
+    (rows linked, rows left without a batch). Commits.
+    """
+    if assign_batch:
+        for p in Player.query.filter(Player.batch_id.is_(None)).all():
+            batch = assign_batch(p)
+            if batch:
+                p.batch_id = batch.id
+        db.session.flush()
+
+    orphans = (
+        select(Player.batch_id, Attendance.date, Attendance.slot)
+        .join(Player, Attendance.player_id == Player.id)
+        .where(Attendance.session_id.is_(None), Player.batch_id.isnot(None))
+        .distinct()
+        .subquery()
+    )
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(AttendanceSession)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .from_select(
+            ["batch_id", "date", "slot", "edit_count", "created_at", "updated_at"],
+            select(
+                orphans.c.batch_id, orphans.c.date, orphans.c.slot,
+                db.literal(0), db.literal(now), db.literal(now)
+            )
+        )
+    )
+
+    session_of_row = (
+        select(AttendanceSession.id)
+        .join(Player, Player.batch_id == AttendanceSession.batch_id)
+        .where(
+            Player.id == Attendance.player_id,
+            AttendanceSession.date == Attendance.date,
+            AttendanceSession.slot == Attendance.slot
+        )
+        .scalar_subquery()
+    )
+    linked = db.session.execute(
+        db.update(Attendance)
+        .where(Attendance.session_id.is_(None))
+        .values(session_id=session_of_row)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    left = Attendance.query.filter(Attendance.session_id.is_(None)).count()
+    db.session.commit()
+    return linked - left, left
@@ -0,0 +1,153 @@
+# services/attendance_day.py
+#
+# One read path for "today's attendance".
+#
+# The academy's day is the ACADEMY_TIMEZONE day (IST by default), not the
+# server's local date and not UTC - otherwise marks made between midnight
+# and 05:30 IST land on the wrong day.
+#
+# load() fetches every record of a day in ONE query (attendance + player
+# + user + session + batch joined, plain columns only) and keeps the
+# snapshot for the request (flask.g) and for ATTENDANCE_DAY_TTL seconds
+# in-process. Saves call invalidate(); other workers catch up when their
+# copy expires.
+#
+# A record's batch is the batch of the session it was marked in, not the
+# player's current batch, so re-batching a player does not move marks
+# already taken; only marks not yet linked to a session fall back to
+# Player.batch_id.
+#
+# Dashboards, present/absent lists, the summary and the PDF all read the
+# snapshot.
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from flask import g, has_request_context
+from sqlalchemy import func
+
+from models import db, Attendance, AttendanceSession, Batch, Player, User
+
+IST = timezone(timedelta(hours=5, minutes=30), "IST")
+
+DayRecord = namedtuple("DayRecord", [
+    "player_id", "user_id", "username", "batch_id", "batch_name",
+    "slot", "status", "improvement_note"
+])
+
+
+class DaySnapshot:
+
+    def __init__(self, day, records):
+        self.day = day
+        self.records = records
+
+    def __bool__(self):
+        return bool(self.records)
+
+    def filter(self, status=None, batch_id=None, slot=None):
+        return [
+            r for r in self.records
+            if (status is None or r.status == status)
+            and (batch_id is None or r.batch_id == batch_id)
+            and (slot is None or r.slot == slot)
+        ]
+
+    def count(self, status=None, batch_id=None, slot=None):
+        return len(self.filter(status, batch_id, slot))
+
+    def for_player(self, player_id):
+        """The player's latest record of the day (evening over morning)."""
+        rows = [r for r in self.records if r.player_id == player_id]
+        return max(rows, key=lambda r: r.slot == "evening") if rows else None
+
+
+class AttendanceDays:
+
+    def __init__(self):
+        self.tz = IST
+        self.ttl = 30
+        self._lock = threading.Lock()
+        self._cache = {}    # day -> (loaded_at, DaySnapshot)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("ATTENDANCE_DAY_TTL", self.ttl)
+
+        name = app.config.get("ACADEMY_TIMEZONE", "Asia/Kolkata")
+        try:
+            from zoneinfo import ZoneInfo
+            self.tz = ZoneInfo(name)
+        except Exception:
+            # no tz database (e.g. Windows without tzdata) -> fixed IST
+            print(f"⚠️ Time zone {name} not available, using UTC+05:30")
+            self.tz = IST
+
+    # -------------------------------------------------
+    # DAY BOUNDARIES
+    # -------------------------------------------------
+    def now(self):
+        return datetime.now(self.tz)
+
+    def today(self):
+        return self.now().date()
+
+    # -------------------------------------------------
+    # SNAPSHOT
+    # -------------------------------------------------
+    def load(self, day=None):
+        day = day or self.today()
+
+        per_request = g.setdefault("attendance_days", {}) if has_request_context() else {}
+        if day in per_request:
+            return per_request[day]
+
+        entry = self._cache.get(day)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            snapshot = entry[1]
+        else:
+            snapshot = DaySnapshot(day, self._query(day))
+            with self._lock:
+                self._cache[day] = (time.monotonic(), snapshot)
+                # keep only recent days
+                for old in [d for d in self._cache if d < day - timedelta(days=1)]:
+                    del self._cache[old]
+
+        per_request[day] = snapshot
+        return snapshot
+
+    def invalidate(self, day=None):
+        with self._lock:
+            if day is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(day, None)
+        if has_request_context():
+            g.pop("attendance_days", None)
+
+    def _query(self, day):
+        batch_id = func.coalesce(AttendanceSession.batch_id, Player.batch_id)
+        rows = (
+            db.session.query(
+                Attendance.player_id,
+                User.id,
+                User.username,
+                batch_id,
+                Batch.name,
+                Attendance.slot,
+                Attendance.status,
+                Attendance.improvement_note
+            )
+            .join(Player, Attendance.player_id == Player.id)
+            .join(User, Player.user_id == User.id)
+            .outerjoin(AttendanceSession, Attendance.session_id == AttendanceSession.id)
+            .outerjoin(Batch, batch_id == Batch.id)
+            .filter(Attendance.date == day)
+            .order_by(User.username.asc())
+            .all()
+        )
+        return [DayRecord(*r) for r in rows]
+
+
+attendance_days = AttendanceDays()
@@ -0,0 +1,311 @@
+# services/attendance_stats.py
+#
+# Attendance rollups, so history views never scan `attendance`:
+#   attendance_monthly  - present / absent / late per player per batch per
+#                         month (the batch of the session, not the player's
+#                         current one: batches are age-based and players
+#                         move up every year)
+#   attendance_streaks  - current attended / missed run per player
+#
+# apply_session() is called with the status changes of one saved session
+# and updates both with a few multi-row upserts: first marks extend the
+# streak, edits only recompute the players whose outcome flipped.
+# rebuild() (flask attendance-rollup-rebuild) recomputes everything from
+# `attendance`, e.g. after the tables are first created. Rows not linked to
+# a session yet count under the player's current batch; rows of players
+# without any batch are left out until they get one.
+
+from datetime import date
+
+from sqlalchemy import case, extract, func, insert, select
+
+from models import (
+    db, Attendance, AttendanceMonthly, AttendanceSession, AttendanceStreak, Player, User
+)
+from services.attendance import SLOTS
+from services.notifications import notifier
+from services.upsert import upsert
+
+ATTENDED = ("present", "late")
+
+
+# -------------------------------------------------
+# INCREMENTAL UPDATE
+# -------------------------------------------------
+def apply_session(att_session, changes):
+    """
+    changes: {player_id: (old_status or None, new_status)} for one saved
+    session. Caller commits.
+    """
+    day = att_session.date
+
+    rows = []
+    for player_id, (old, new) in changes.items():
+        if old == new:
+            continue
+        delta = {"present": 0, "absent": 0, "late": 0}
+        if old:
+            delta[old] -= 1
+        delta[new] += 1
+        rows.append(dict(
+            player_id=player_id, batch_id=att_session.batch_id,
+            year=day.year, month=day.month, **delta
+        ))
+
+    if rows:
+        db.session.execute(upsert(
+            AttendanceMonthly,
+            rows,
+            ["player_id", "year", "month", "batch_id"],
+            lambda new: {
+                "present": AttendanceMonthly.present + new.present,
+                "absent": AttendanceMonthly.absent + new.absent,
+                "late": AttendanceMonthly.late + new.late
+            }
+        ))
+
+    first_attended = [p for p, (old, new) in changes.items() if old is None and new in ATTENDED]
+    first_missed = [p for p, (old, new) in changes.items() if old is None and new not in ATTENDED]
+    flipped = [
+        p for p, (old, new) in changes.items()
+        if old is not None and (old in ATTENDED) != (new in ATTENDED)
+    ]
+
+    _extend_streaks(first_attended, day, attended=True)
+    _extend_streaks(first_missed, day, attended=False)
+    if flipped:
+        recompute_streaks(flipped)
+
+
+def _extend_streaks(player_ids, day, attended):
+    if not player_ids:
+        return
+
+    rows = [
+        dict(
+            player_id=pid,
+            present_streak=1 if attended else 0,
+            absent_streak=0 if attended else 1,
+            last_date=day
+        )
+        for pid in player_ids
+    ]
+
+    if attended:
+        update = lambda new: {
+            "present_streak": AttendanceStreak.present_streak + 1,
+            "absent_streak": 0,
+            "last_date": new.last_date
+        }
+    else:
+        update = lambda new: {
+            "present_streak": 0,
+            "absent_streak": AttendanceStreak.absent_streak + 1,
+            "last_date": new.last_date
+        }
+
+    db.session.execute(upsert(AttendanceStreak, rows, ["player_id"], update))
+
+
+def recompute_streaks(player_ids):
+    """Recount current streaks of these players from their attendance rows."""
+    history = {pid: [] for pid in player_ids}
+    for r in db.session.query(
+        Attendance.player_id, Attendance.date, Attendance.slot, Attendance.status
+    ).filter(Attendance.player_id.in_(player_ids)):
+        history[r.player_id].append(r)
+
+    rows = []
+    for pid, records in history.items():
+        records.sort(key=lambda r: (r.date, SLOTS.index(r.slot or "morning")), reverse=True)
+
+        run = 0
+        attended = records[0].status in ATTENDED if records else True
+        for r in records:
+            if (r.status in ATTENDED) != attended:
+                break
+            run += 1
+
+        rows.append(dict(
+            player_id=pid,
+            present_streak=run if attended else 0,
+            absent_streak=0 if attended else run,
+            last_date=records[0].date if records else None
+        ))
+
+    if rows:
+        db.session.execute(upsert(
+            AttendanceStreak,
+            rows,
+            ["player_id"],
+            lambda new: {
+                "present_streak": new.present_streak,
+                "absent_streak": new.absent_streak,
+                "last_date": new.last_date
+            }
+        ))
+
+
+# -------------------------------------------------
+# ABSENCE ALERTS
+# -------------------------------------------------
+def alert_absences(player_ids, threshold, link=None):
+    """
+    Notify every coach about players whose missed run just reached
+    `threshold`. One alert per player per streak. Caller commits.
+    """
+    if not player_ids or threshold <= 0:
+        return 0
+
+    hits = (
+        db.session.query(AttendanceStreak, User.username)
+        .join(Player, Player.id == AttendanceStreak.player_id)
+        .join(User, User.id == Player.user_id)
+        .filter(
+            AttendanceStreak.player_id.in_(player_ids),
+            AttendanceStreak.absent_streak == threshold
+        )
+        .all()
+    )
+    if not hits:
+        return 0
+
+    coach_ids = [r[0] for r in db.session.query(User.id).filter(User.role == "coach")]
+
+    for streak, username in hits:
+        for coach_id in coach_ids:
+            notifier.notify(
+                coach_id,
+                f"⚠️ {username} has missed {threshold} sessions in a row",
+                link=link,
+                category="absence_alert",
+                dedup_key=f"absence_alert:{streak.player_id}:{streak.last_date}"
+            )
+
+    return len(hits)
+
+
+# -------------------------------------------------
+# READS (rollups only)
+# -------------------------------------------------
+def recent_months(n, today=None):
+    """The last n (year, month) pairs, oldest first."""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1
+    return [(i // 12, i % 12 + 1) for i in range(index - n + 1, index + 1)]
+
+
+def _month_index(model):
+    return model.year * 12 + model.month - 1
+
+
+def batch_heatmap(batch_id, months):
+    """
+    {player_id: {(year, month): AttendanceMonthly}} for one batch over
+    `months` (see recent_months).
+    """
+    first = months[0][0] * 12 + months[0][1] - 1
+
+    grid = {}
+    for row in AttendanceMonthly.query.filter(
+        AttendanceMonthly.batch_id == batch_id,
+        _month_index(AttendanceMonthly) >= first
+    ):
+        grid.setdefault(row.player_id, {})[(row.year, row.month)] = row
+    return grid
+
+
+def batch_rates(batch_id, months):
+    """{(year, month): attended %} for the whole batch."""
+    first = months[0][0] * 12 + months[0][1] - 1
+
+    rows = (
+        db.session.query(
+            AttendanceMonthly.year,
+            AttendanceMonthly.month,
+            func.sum(AttendanceMonthly.present + AttendanceMonthly.late),
+            func.sum(AttendanceMonthly.present + AttendanceMonthly.late + AttendanceMonthly.absent)
+        )
+        .filter(
+            AttendanceMonthly.batch_id == batch_id,
+            _month_index(AttendanceMonthly) >= first
+        )
+        .group_by(AttendanceMonthly.year, AttendanceMonthly.month)
+        .all()
+    )
+    return {
+        (y, m): round(100 * attended / total)
+        for y, m, attended, total in rows if total
+    }
+
+
+def streaks_for(player_ids):
+    if not player_ids:
+        return {}
+    return {
+        s.player_id: s for s in
+        AttendanceStreak.query.filter(AttendanceStreak.player_id.in_(player_ids))
+    }
+
+
+def player_summary(player_id, today=None):
+    """
+    (this month's AttendanceMonthly or None, AttendanceStreak or None).
+    The month is summed over every batch the player trained with in it
+    (not added to the session).
+    """
+    today = today or date.today()
+    counts = db.session.query(
+        func.sum(AttendanceMonthly.present),
+        func.sum(AttendanceMonthly.absent),
+        func.sum(AttendanceMonthly.late)
+    ).filter_by(
+        player_id=player_id,
+        year=today.year,
+        month=today.month
+    ).one()
+
+    month = None
+    if counts[0] is not None:
+        month = AttendanceMonthly(
+            player_id=player_id, year=today.year, month=today.month,
+            present=counts[0], absent=counts[1], late=counts[2]
+        )
+    return month, db.session.get(AttendanceStreak, player_id)
+
+
+# -------------------------------------------------
+# FULL REBUILD
+# -------------------------------------------------
+def rebuild(batch_size=500):
+    """Recompute both rollups from `attendance`. Returns players processed."""
+    db.session.query(AttendanceMonthly).delete(synchronize_session=False)
+
+    year = extract("year", Attendance.date)
+    month = extract("month", Attendance.date)
+    batch_id = func.coalesce(AttendanceSession.batch_id, Player.batch_id)
+
+    def count(status):
+        return func.sum(case((Attendance.status == status, 1), else_=0))
+
+    db.session.execute(
+        insert(AttendanceMonthly).from_select(
+            ["player_id", "batch_id", "year", "month", "present", "absent", "late"],
+            select(
+                Attendance.player_id, batch_id, year, month,
+                count("present"), count("absent"), count("late")
+            )
+            .join(Player, Player.id == Attendance.player_id)
+            .outerjoin(AttendanceSession, AttendanceSession.id == Attendance.session_id)
+            .where(batch_id.is_not(None))
+            .group_by(Attendance.player_id, batch_id, year, month)
+        )
+    )
+
+    db.session.query(AttendanceStreak).delete(synchronize_session=False)
+    player_ids = [r[0] for r in db.session.query(Attendance.player_id).distinct()]
+    for i in range(0, len(player_ids), batch_size):
+        recompute_streaks(player_ids[i:i + batch_size])
+
+    db.session.commit()
+    return len(player_ids)
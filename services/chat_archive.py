@@ -0,0 +1,121 @@
+# services/chat_archive.py
+#
+# Keeps the hot `messages` table small.
+#
+# archive_messages() moves read / group messages older than
+# CHAT_ARCHIVE_AFTER_DAYS into `messages_archive` in id-ordered batches
+# (INSERT ... SELECT + DELETE, one commit per batch). Unread direct
+# messages stay hot so unread counts never need the archive.
+#
+# conversation_page() / group_page() read the newest page from the hot
+# table and only fall back to the archive when the user scrolls back past
+# what is still hot.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, insert, or_, select
+
+from models import db, Message, MessageArchive
+
+ARCHIVE_COLUMNS = (
+    "id", "sender_id", "receiver_id", "group_id", "content",
+    "delivered", "is_read", "is_deleted", "created_at", "updated_at"
+)
+
+PAGE_SIZE = 50
+
+
+def archive_messages(older_than_days, batch_size=1000):
+    """Move old messages to messages_archive. Returns rows moved."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    eligible = and_(
+        Message.created_at < cutoff,
+        or_(Message.is_read == True, Message.receiver_id.is_(None))
+    )
+
+    moved = 0
+    while True:
+        ids = [
+            r[0] for r in db.session.query(Message.id)
+            .filter(eligible)
+            .order_by(Message.id)
+            .limit(batch_size).all()
+        ]
+        if not ids:
+            break
+
+        cols = [getattr(Message, c) for c in ARCHIVE_COLUMNS]
+        db.session.execute(
+            insert(MessageArchive).from_select(
+                list(ARCHIVE_COLUMNS),
+                select(*cols).where(Message.id.in_(ids))
+            )
+        )
+        db.session.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        moved += len(ids)
+
+    return moved
+
+
+def _page(model, scope, before, limit):
+    q = model.query.filter(scope, model.is_deleted == False)
+    if before:
+        # keyset on (created_at, id): messages sharing the cursor's second
+        # are not skipped (archived rows keep their ids)
+        created_at, last_id = before
+        older = model.created_at < created_at
+        if last_id is not None:
+            older = or_(older, and_(model.created_at == created_at, model.id < last_id))
+        q = q.filter(older)
+    return q.order_by(model.created_at.desc(), model.id.desc()).limit(limit).all()
+
+
+def _read_page(scope_for, before, limit):
+    """Newest `limit` messages before the (created_at, id) cursor, hot table first."""
+    rows = _page(Message, scope_for(Message), before, limit + 1)
+
+    if len(rows) <= limit:
+        # reached the start of the hot table -> continue in the archive
+        oldest = (rows[-1].created_at, rows[-1].id) if rows else before
+        rows += _page(MessageArchive, scope_for(MessageArchive), oldest, limit + 1 - len(rows))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
+
+
+def conversation_page(user_a, user_b, before=None, limit=PAGE_SIZE):
+    """Direct messages between two users, oldest first. Returns (messages, has_more)."""
+    def scope(m):
+        return or_(
+            and_(m.sender_id == user_a, m.receiver_id == user_b),
+            and_(m.sender_id == user_b, m.receiver_id == user_a)
+        )
+    return _read_page(scope, before, limit)
+
+
+def group_page(group_id, before=None, limit=PAGE_SIZE):
+    """Group messages, oldest first. Returns (messages, has_more)."""
+    return _read_page(lambda m: m.group_id == group_id, before, limit)
+
+
+def cursor(message):
+    """?before= value for the page that ends just before `message`."""
+    return f"{message.created_at.isoformat()}_{message.id}"
+
+
+def parse_before(value):
+    """
+    ?before=<iso timestamp>_<id> cursor from the "older messages" link,
+    as (created_at, id). A bare timestamp (old links) gives id None.
+    """
+    if not value:
+        return None
+    stamp, _, last_id = value.partition("_")
+    try:
+        return datetime.fromisoformat(stamp), int(last_id) if last_id else None
+    except ValueError:
+        return None
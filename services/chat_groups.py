@@ -0,0 +1,92 @@
+# services/chat_groups.py
+#
+# In-process chat group membership index:
+#   group_id -> set(user_id)   (authorization + fan-out)
+#   user_id  -> set(group_id)  (chat list)
+#
+# Entries are loaded from chat_group_members on first use and kept for
+# CHAT_MEMBERSHIP_TTL seconds. Member lists are only written when a group
+# is created; set_group() updates this process's index directly, other
+# workers pick the group up when their entry expires.
+
+import threading
+import time
+
+from models import db, ChatGroupMember
+
+
+class GroupMembership:
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._groups = {}   # group_id -> (loaded_at, set(user_id))
+        self._users = {}    # user_id  -> (loaded_at, set(group_id))
+
+    def init_app(self, app):
+        self.ttl = app.config.get("CHAT_MEMBERSHIP_TTL", self.ttl)
+
+    def _fresh(self, entry):
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    # -------------------------------------------------
+    # LOOKUPS
+    # -------------------------------------------------
+    def members(self, group_id):
+        group_id = int(group_id)
+        entry = self._groups.get(group_id)
+        if self._fresh(entry):
+            return entry[1]
+
+        ids = {
+            r[0] for r in db.session.query(ChatGroupMember.user_id)
+            .filter(ChatGroupMember.group_id == group_id).all()
+        }
+        with self._lock:
+            self._groups[group_id] = (time.monotonic(), ids)
+        return ids
+
+    def groups_for(self, user_id):
+        user_id = int(user_id)
+        entry = self._users.get(user_id)
+        if self._fresh(entry):
+            return entry[1]
+
+        ids = {
+            r[0] for r in db.session.query(ChatGroupMember.group_id)
+            .filter(ChatGroupMember.user_id == user_id).all()
+        }
+        with self._lock:
+            self._users[user_id] = (time.monotonic(), ids)
+        return ids
+
+    def is_member(self, group_id, user_id):
+        try:
+            return int(user_id) in self.members(group_id)
+        except (TypeError, ValueError):
+            return False
+
+    # -------------------------------------------------
+    # WRITES (call after the DB commit)
+    # -------------------------------------------------
+    def set_group(self, group_id, user_ids):
+        """A group was created (or its member list replaced)."""
+        group_id = int(group_id)
+        user_ids = {int(u) for u in user_ids}
+        now = time.monotonic()
+
+        with self._lock:
+            old = self._groups.get(group_id, (0, set()))[1]
+            self._groups[group_id] = (now, user_ids)
+
+            for uid in old - user_ids:
+                entry = self._users.get(uid)
+                if entry:
+                    entry[1].discard(group_id)
+            for uid in user_ids:
+                entry = self._users.get(uid)
+                if entry:
+                    entry[1].add(group_id)
+
+
+group_members = GroupMembership()
@@ -0,0 +1,242 @@
+# services/chat_search.py
+#
+# Full-text search over chat messages.
+#
+# Two backends, picked by CHAT_SEARCH_BACKEND ("auto" by default):
+#   mysql - MATCH ... AGAINST on the FULLTEXT index of messages.content
+#   fts5  - a local SQLite FTS5 sidecar file, kept in sync by the send,
+#           edit and delete handlers (index / update / remove below)
+# "auto" uses mysql when the main DB is MySQL and fts5 otherwise.
+#
+# Results are always scoped to the user's direct conversations and the
+# groups they belong to.
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from markupsafe import Markup, escape
+from sqlalchemy import or_, text
+
+from models import db, Message, User
+
+# markers that cannot appear in typed text; swapped for <mark> after escaping
+HL_START, HL_END = "\x02", "\x03"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(q):
+    return [t.lower() for t in TOKEN_RE.findall(q or "")][:8]
+
+
+def highlight(content, terms):
+    """Escape content and wrap every word starting with a search term."""
+    if not terms:
+        return escape(content)
+    pattern = re.compile(
+        r"\b(" + "|".join(re.escape(t) for t in terms) + r")\w*",
+        re.IGNORECASE | re.UNICODE
+    )
+    marked = pattern.sub(lambda m: HL_START + m.group(0) + HL_END, content)
+    return _markers_to_html(marked)
+
+
+def _markers_to_html(marked):
+    return Markup(
+        str(escape(marked))
+        .replace(HL_START, "<mark>")
+        .replace(HL_END, "</mark>")
+    )
+
+
+class ChatSearch:
+
+    def __init__(self):
+        self.backend = "fts5"
+        self.sidecar_path = None
+        self._local = threading.local()
+
+    def init_app(self, app):
+        backend = app.config.get("CHAT_SEARCH_BACKEND", "auto")
+        if backend == "auto":
+            uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
+            backend = "mysql" if uri.startswith("mysql") else "fts5"
+
+        self.backend = backend
+        self.sidecar_path = app.config.get("CHAT_SEARCH_SIDECAR", "instance/chat_search.db")
+
+        if self.backend == "fts5":
+            self._conn().execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                "content, message_id UNINDEXED, sender_id UNINDEXED, "
+                "receiver_id UNINDEXED, group_id UNINDEXED, created_at UNINDEXED, "
+                "tokenize='unicode61')"
+            )
+
+    # -------------------------------------------------
+    # SIDECAR CONNECTION (one per thread / greenlet)
+    # -------------------------------------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.sidecar_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.sidecar_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -------------------------------------------------
+    # SYNC HOOKS (no-ops for the mysql backend)
+    # -------------------------------------------------
+    def index(self, msg):
+        if self.backend != "fts5":
+            return
+        self._write(
+            "INSERT INTO messages_fts(content, message_id, sender_id, receiver_id, group_id, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (msg.content, msg.id, msg.sender_id, msg.receiver_id, msg.group_id,
+             msg.created_at.isoformat() if msg.created_at else None)
+        )
+
+    def update(self, msg):
+        if self.backend != "fts5":
+            return
+        self._write(
+            "UPDATE messages_fts SET content = ? WHERE message_id = ?",
+            (msg.content, msg.id)
+        )
+
+    def remove(self, msg_id):
+        if self.backend != "fts5":
+            return
+        self._write("DELETE FROM messages_fts WHERE message_id = ?", (msg_id,))
+
+    def _write(self, sql, params):
+        # a sidecar hiccup must never fail the chat write itself
+        try:
+            self._conn().execute(sql, params)
+        except sqlite3.Error as e:
+            print("⚠️ Chat search index write failed:", e)
+
+    def rebuild(self, batch_size=5000):
+        """Re-index every non-deleted message into the sidecar (flask chat-search-rebuild)."""
+        conn = self._conn()
+        conn.execute("DELETE FROM messages_fts")
+
+        last_id, total = 0, 0
+        while True:
+            rows = db.session.query(
+                Message.id, Message.content, Message.sender_id,
+                Message.receiver_id, Message.group_id, Message.created_at
+            ).filter(
+                Message.id > last_id,
+                Message.is_deleted == False
+            ).order_by(Message.id).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO messages_fts(message_id, content, sender_id, receiver_id, group_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(r.id, r.content, r.sender_id, r.receiver_id, r.group_id,
+                  r.created_at.isoformat() if r.created_at else None) for r in rows]
+            )
+            conn.execute("COMMIT")
+
+            last_id = rows[-1].id
+            total += len(rows)
+
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')")
+        return total
+
+    # -------------------------------------------------
+    # SEARCH
+    # -------------------------------------------------
+    def search(self, user_id, q, group_ids, page=1, per_page=20):
+        """
+        Returns (results, has_next). Each result is a dict with message id,
+        sender/receiver/group, created_at and highlighted content (Markup).
+        """
+        terms = tokenize(q)
+        if not terms:
+            return [], False
+
+        page = max(1, page)
+        offset = (page - 1) * per_page
+
+        if self.backend == "mysql":
+            rows = self._search_mysql(user_id, terms, group_ids, per_page + 1, offset)
+        else:
+            rows = self._search_fts5(user_id, terms, group_ids, per_page + 1, offset)
+
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+        names = dict(
+            db.session.query(User.id, User.username)
+            .filter(User.id.in_({r["sender_id"] for r in rows})).all()
+        ) if rows else {}
+
+        for r in rows:
+            r["sender_name"] = names.get(r["sender_id"], "?")
+
+        return rows, has_next
+
+    def _search_mysql(self, user_id, terms, group_ids, limit, offset):
+        boolean_q = " ".join(f"+{t}*" for t in terms)
+        match = text("MATCH (messages.content) AGAINST (:q IN BOOLEAN MODE)").bindparams(q=boolean_q)
+
+        scope = [Message.sender_id == user_id, Message.receiver_id == user_id]
+        if group_ids:
+            scope.append(Message.group_id.in_(group_ids))
+
+        rows = Message.query.filter(
+            match,
+            Message.is_deleted == False,
+            or_(*scope)
+        ).order_by(Message.created_at.desc()).limit(limit).offset(offset).all()
+
+        return [{
+            "id": m.id,
+            "sender_id": m.sender_id,
+            "receiver_id": m.receiver_id,
+            "group_id": m.group_id,
+            "created_at": m.created_at,
+            "content": highlight(m.content, terms)
+        } for m in rows]
+
+    def _search_fts5(self, user_id, terms, group_ids, limit, offset):
+        fts_q = " ".join('"' + t.replace('"', '') + '"*' for t in terms)
+
+        scope = "(sender_id = ? OR receiver_id = ?"
+        params = [fts_q, user_id, user_id]
+        if group_ids:
+            scope += " OR group_id IN (%s)" % ",".join("?" * len(group_ids))
+            params.extend(group_ids)
+        scope += ")"
+
+        cur = self._conn().execute(
+            "SELECT message_id, sender_id, receiver_id, group_id, created_at, "
+            f"highlight(messages_fts, 0, '{HL_START}', '{HL_END}') "
+            "FROM messages_fts WHERE messages_fts MATCH ? AND " + scope +
+            " ORDER BY rank LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+
+        return [{
+            "id": r[0],
+            "sender_id": r[1],
+            "receiver_id": r[2],
+            "group_id": r[3],
+            "created_at": datetime.fromisoformat(r[4]) if r[4] else None,
+            "content": _markers_to_html(r[5])
+        } for r in cur.fetchall()]
+
+
+chat_search = ChatSearch()
@@ -0,0 +1,386 @@
+# services/chat_store.py
+#
+# Chat message persistence.
+#
+# Sync mode (default): every message is committed before it is emitted,
+# exactly like the old handlers did.
+#
+# Write-behind mode (CHAT_WRITE_BEHIND=1): the message gets an id from a
+# locally reserved block, is appended to a local journal and emitted
+# straight away. A background task bulk-inserts whatever is queued every
+# CHAT_FLUSH_INTERVAL_MS. If the process dies before a flush, the journal
+# is replayed on the next start (under a file lock, with INSERT IGNORE, so
+# workers starting together cannot insert a message twice).
+#
+# A failed batch is retried after a backoff. If it fails again it is
+# inserted row by row: rows the database rejects (too long, bad foreign
+# key, ...) go to chat-dead-letter.jsonl in the journal dir instead of
+# blocking the queue; a connection error stops the pass and backs off.
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:     # Windows dev box: single process, no lock needed
+    fcntl = None
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import db, Message, MessageArchive, MessageIdSequence
+from services.chat_search import chat_search
+
+MAX_BACKOFF = 30    # seconds between retries of a failing flush
+DEAD_LETTER = "chat-dead-letter.jsonl"
+
+
+class ChatStore:
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+
+        self._lock = threading.Lock()
+        # one flush at a time (batcher vs. stop()/ensure_persisted())
+        self._flush_lock = threading.Lock()
+        self._queue = deque()
+
+        # reserved id block [next_id, block_end)
+        self._next_id = None
+        self._block_end = None
+
+        self._journal = None
+        self._journal_path = None
+        self._running = False
+
+        self._failures = 0      # consecutive failed flushes
+        self._retry_at = 0.0    # monotonic time of the next batcher attempt
+
+    # -------------------------------------------------
+    # SETUP
+    # -------------------------------------------------
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+
+        self.enabled = app.config.get("CHAT_WRITE_BEHIND", False)
+        self.interval = app.config.get("CHAT_FLUSH_INTERVAL_MS", 5) / 1000.0
+        self.block_size = app.config.get("CHAT_ID_BLOCK_SIZE", 1000)
+        self.fsync = app.config.get("CHAT_JOURNAL_FSYNC", True)
+        self.journal_dir = app.config.get("CHAT_JOURNAL_DIR", "instance/chat_journal")
+
+        if self.enabled:
+            self.start()
+
+    def start(self):
+        if self._running:
+            return
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+
+        with self.app.app_context():
+            self.recover()
+
+        self._journal_path = os.path.join(self.journal_dir, f"chat-{os.getpid()}.journal")
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+        self.enabled = True
+        self._running = True
+        self.socketio.start_background_task(self._flush_loop)
+
+    def stop(self):
+        """Flush everything still queued and close the journal."""
+        self._running = False
+        self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    # -------------------------------------------------
+    # SAVE (called from send handlers)
+    # -------------------------------------------------
+    def save(self, sender_id, content, receiver_id=None, group_id=None):
+        """
+        Persist a chat message and return it.
+        In write-behind mode the returned Message is transient (not in the
+        session) but already has its final id and created_at.
+        """
+        if not self.enabled:
+            msg = Message(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                group_id=group_id,
+                content=content,
+                delivered=True
+            )
+            db.session.add(msg)
+            db.session.commit()
+            chat_search.index(msg)
+            return msg
+
+        row = {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "group_id": group_id,
+            "content": content,
+            "delivered": True,
+            "is_read": False,
+            "is_deleted": False,
+            "created_at": datetime.utcnow()
+        }
+
+        with self._lock:
+            row["id"] = self._allocate_id()
+            self._append_journal({"op": "msg", **row})
+            self._queue.append(row)
+
+        msg = Message(**row)
+        chat_search.index(msg)
+        return msg
+
+    def is_pending(self, msg_id):
+        try:
+            msg_id = int(msg_id)
+        except (TypeError, ValueError):
+            return False
+
+        with self._lock:
+            return any(r["id"] == msg_id for r in self._queue)
+
+    def ensure_persisted(self, msg_id):
+        """Edits/deletes must not race the batcher for a fresh message."""
+        if self.enabled and self.is_pending(msg_id):
+            self.flush()
+
+    # -------------------------------------------------
+    # ID BLOCKS
+    # -------------------------------------------------
+    def _allocate_id(self):
+        if self._next_id is None or self._next_id >= self._block_end:
+            self._next_id, self._block_end = self._reserve_block()
+
+        msg_id = self._next_id
+        self._next_id += 1
+        return msg_id
+
+    def _reserve_block(self):
+        """
+        Reserve block_size ids in one short transaction so several workers
+        never hand out the same id. Runs on its own connection so it cannot
+        commit half-finished work of the caller.
+        """
+        with db.engine.begin() as conn:
+            seq = conn.execute(
+                db.select(MessageIdSequence).with_for_update()
+            ).first()
+
+            # rows written in sync mode use AUTO_INCREMENT, so never start
+            # below the current max id (archived ids included)
+            max_id = max(
+                conn.execute(db.select(func.max(Message.id))).scalar() or 0,
+                conn.execute(db.select(func.max(MessageArchive.id))).scalar() or 0
+            )
+
+            if seq is None:
+                start = max_id + 1
+                conn.execute(insert(MessageIdSequence).values(
+                    id=1, next_id=start + self.block_size
+                ))
+            else:
+                start = max(seq.next_id, max_id + 1)
+                conn.execute(
+                    db.update(MessageIdSequence)
+                    .where(MessageIdSequence.id == seq.id)
+                    .values(next_id=start + self.block_size)
+                )
+
+        return start, start + self.block_size
+
+    # -------------------------------------------------
+    # JOURNAL
+    # -------------------------------------------------
+    def _append_journal(self, record):
+        if "created_at" in record:
+            record = dict(record, created_at=record["created_at"].isoformat())
+
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _truncate_journal(self):
+        # only called with the lock held and an empty queue
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def recover(self):
+        """
+        Replay journals left behind by dead processes: insert every
+        journalled message that was never acked. One worker at a time
+        (file lock); INSERT IGNORE skips ids that are already stored.
+        """
+        with open(os.path.join(self.journal_dir, "recover.lock"), "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._recover()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _recover(self):
+        for path in glob.glob(os.path.join(self.journal_dir, "chat-*.journal")):
+            pid = _journal_pid(path)
+            if pid and pid != os.getpid() and _pid_alive(pid):
+                continue
+
+            pending = {}
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write
+                        continue
+
+                    if rec.get("op") == "msg":
+                        rec.pop("op")
+                        rec["created_at"] = datetime.fromisoformat(rec["created_at"])
+                        pending[rec["id"]] = rec
+                    elif rec.get("op") == "ack":
+                        for i in rec["ids"]:
+                            pending.pop(i, None)
+
+            if pending:
+                db.session.execute(
+                    insert(Message)
+                    .prefix_with("IGNORE", dialect="mysql")
+                    .prefix_with("OR IGNORE", dialect="sqlite"),
+                    list(pending.values())
+                )
+                db.session.commit()
+
+            os.remove(path)
+
+    # -------------------------------------------------
+    # BATCHER
+    # -------------------------------------------------
+    def flush(self):
+        """Bulk insert everything queued. Returns the number of rows written."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            rows = list(self._queue)
+
+        if not rows:
+            return 0
+
+        dead = []
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(Message), rows)
+                db.session.commit()
+                self._failures = 0
+            except Exception as e:
+                db.session.rollback()
+                self._failures += 1
+                if self._failures < 2:
+                    self._back_off()
+                    print("⚠️ Chat flush failed, will retry:", e)
+                    return 0
+
+                print("⚠️ Chat flush failed again, inserting row by row:", e)
+                done, dead = self._flush_rows(rows)
+                if done < len(rows):
+                    self._back_off()
+                else:
+                    self._failures = 0
+                rows = rows[:done]
+
+        if dead:
+            self._dead_letter(dead)
+
+        ids = [r["id"] for r in rows]
+        with self._lock:
+            for _ in ids:
+                self._queue.popleft()
+
+            if self._journal and ids:
+                if self._queue:
+                    self._append_journal({"op": "ack", "ids": ids})
+                else:
+                    self._truncate_journal()
+
+        return len(rows) - len(dead)
+
+    def _flush_rows(self, rows):
+        """
+        Insert rows one by one. Rows the database rejects are returned as
+        dead; any other error stops the pass. Returns (rows handled, dead).
+        """
+        dead = []
+        for n, row in enumerate(rows):
+            try:
+                db.session.execute(insert(Message), [row])
+                db.session.commit()
+            except (DataError, IntegrityError) as e:
+                db.session.rollback()
+                dead.append((row, e))
+            except Exception as e:
+                db.session.rollback()
+                print("⚠️ Chat flush stopped, will retry:", e)
+                return n, dead
+        return len(rows), dead
+
+    def _back_off(self):
+        self._retry_at = time.monotonic() + min(0.5 * 2 ** (self._failures - 1), MAX_BACKOFF)
+
+    def _dead_letter(self, dead):
+        path = os.path.join(self.journal_dir, DEAD_LETTER)
+        with open(path, "a", encoding="utf-8") as fh:
+            for row, error in dead:
+                fh.write(json.dumps(dict(
+                    row,
+                    created_at=row["created_at"].isoformat(),
+                    error=str(getattr(error, "orig", error))
+                )) + "\n")
+        print(f"⚠️ {len(dead)} chat messages rejected by the database, see {path}")
+
+    def _flush_loop(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            if time.monotonic() < self._retry_at:
+                continue
+            self.flush()
+
+
+def _journal_pid(path):
+    name = os.path.basename(path)
+    try:
+        return int(name[len("chat-"):-len(".journal")])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+chat_store = ChatStore()
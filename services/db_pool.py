@@ -0,0 +1,219 @@
+# services/db_pool.py
+#
+# Connection pool profiles and pool metrics.
+#
+# The hosted MySQL sits behind a TCP proxy that silently drops idle
+# connections, so every profile pre-pings on checkout and recycles
+# connections after DB_POOL_RECYCLE seconds (below the proxy's idle
+# cut-off). DB_POOL_PROFILE picks the sizing:
+#
+#   sync      gunicorn sync workers: one request at a time per worker ->
+#             a small pool, a few overflow connections
+#   eventlet  socket.io workers: many greenlets share one process ->
+#             a bigger LIFO pool (idle extras age out), short checkout
+#             timeout so a stuck database fails requests fast instead of
+#             piling up greenlets
+#   test      NullPool: a fresh connection per checkout, nothing shared
+#             between tests
+#   auto      eventlet when the socket module is monkey-patched, else sync
+#
+# Every worker also runs background tasks that hold a connection while
+# they work (chat write-behind flusher, payment reconciler, large
+# notification fan-outs), so BACKGROUND_CONNECTIONS are added to each
+# profile's pool_size: requests never queue behind them.
+#
+# DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT override the profile's
+# numbers (DB_POOL_SIZE is the total, background connections included).
+# On MySQL every connection also gets connect / read / write socket
+# timeouts and max_execution_time = DB_STATEMENT_TIMEOUT_MS, so one slow
+# query cannot hold a pooled connection forever. An explicit
+# SQLALCHEMY_ENGINE_OPTIONS in the config is left alone.
+#
+# pool_metrics counts, per worker: checkouts and how long they waited for
+# a connection (total, max, histogram), checkout timeouts, connections
+# opened / closed / invalidated (churn), and the pool's current state.
+# GET /metrics/db-pool returns them as JSON.
+
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import NullPool, QueuePool
+
+# pool_size here is for requests; BACKGROUND_CONNECTIONS come on top
+PROFILES = {
+    "sync": dict(pool_size=2, max_overflow=3, pool_timeout=10),
+    "eventlet": dict(pool_size=10, max_overflow=10, pool_timeout=5, pool_use_lifo=True),
+    "test": dict(),
+}
+
+# chat flusher + payment reconciler + one background notification fan-out
+BACKGROUND_CONNECTIONS = 3
+
+# checkout wait histogram upper bounds, milliseconds
+WAIT_BUCKETS_MS = (1, 10, 100, 1000)
+
+
+def _eventlet_patched():
+    eventlet = sys.modules.get("eventlet")
+    return bool(eventlet) and eventlet.patcher.is_monkey_patched("socket")
+
+
+def resolve_profile(name):
+    name = (name or "auto").lower()
+    if name == "auto":
+        return "eventlet" if _eventlet_patched() else "sync"
+    if name not in PROFILES:
+        print(f"⚠️ Unknown DB_POOL_PROFILE {name!r}, using sync")
+        return "sync"
+    return name
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited."""
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            conn = super()._do_get()
+        except PoolTimeout:
+            pool_metrics.checkout_timeout(time.monotonic() - started)
+            raise
+        pool_metrics.checkout_wait(time.monotonic() - started)
+        return conn
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured profile and database URI."""
+    profile = resolve_profile(config.get("DB_POOL_PROFILE"))
+    uri = config.get("SQLALCHEMY_DATABASE_URI") or ""
+
+    if profile == "test":
+        return {"poolclass": NullPool}
+
+    options = dict(PROFILES[profile])
+    options["pool_size"] += BACKGROUND_CONNECTIONS
+    for key, setting in (("pool_size", "DB_POOL_SIZE"),
+                         ("max_overflow", "DB_MAX_OVERFLOW"),
+                         ("pool_timeout", "DB_POOL_TIMEOUT")):
+        if config.get(setting) not in (None, ""):
+            options[key] = int(config[setting])
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_recycle=config.get("DB_POOL_RECYCLE", 280),
+        pool_pre_ping=True,
+    )
+
+    if uri.startswith("mysql"):
+        timeout_ms = config.get("DB_STATEMENT_TIMEOUT_MS", 30000)
+        options["connect_args"] = {
+            "connect_timeout": 10,
+            # socket backstop for writes, which max_execution_time does not cover
+            "read_timeout": timeout_ms // 1000 + 5,
+            "write_timeout": timeout_ms // 1000 + 5,
+            "init_command": f"SET SESSION max_execution_time={int(timeout_ms)}",
+        }
+    return options
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.profile = None
+        self.engine = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.timeouts = 0
+            self.connects = 0
+            self.closes = 0
+            self.invalidations = 0
+            self.since = time.time()
+
+    def init_app(self, app):
+        """Call before db.init_app: sets the engine options."""
+        self.profile = resolve_profile(app.config.get("DB_POOL_PROFILE"))
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
+
+    def watch(self, engine):
+        """Count connection churn on this engine's pool."""
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "close_detached", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_close(self, dbapi_connection, *args):
+        with self._lock:
+            self.closes += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def checkout_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if seconds * 1000 < bound:
+                    self.wait_buckets[i] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+
+    def checkout_timeout(self, seconds):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                "profile": self.profile,
+                "since": self.since,
+                "checkouts": self.checkouts,
+                "checkout_wait_ms": {
+                    "total": round(self.wait_total * 1000, 2),
+                    "avg": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                    "max": round(self.wait_max * 1000, 2),
+                    "buckets": {
+                        **{f"<{b}ms": n for b, n in zip(WAIT_BUCKETS_MS, self.wait_buckets)},
+                        f">={WAIT_BUCKETS_MS[-1]}ms": self.wait_buckets[-1],
+                    },
+                },
+                "checkout_timeouts": self.timeouts,
+                "connections": {
+                    "opened": self.connects,
+                    "closed": self.closes,
+                    "invalidated": self.invalidations,
+                },
+            }
+
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            data["pool"] = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        return data
+
+
+pool_metrics = PoolMetrics()
@@ -0,0 +1,184 @@
+# services/drill_index.py
+#
+# Inverted indexes over DRILL_MAP, built once at import:
+#   focus term -> topics      pov   -> topics
+#   angle      -> topics      drill -> topics
+#   word       -> {topic: weight}   (free-text ranking)
+#   sorted vocabulary                (prefix autocomplete via bisect)
+#
+# search() intersects the facet sets, ranks the survivors by the words of
+# the query (the last word also counts as a prefix, for search-as-you-type)
+# and counts facets over the result - no per-request walk of DRILL_MAP.
+
+import re
+from bisect import bisect_left
+
+from drillmap import DRILL_MAP
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# how much a query word counts when it appears in ...
+TOPIC_WEIGHT = 3
+FOCUS_WEIGHT = 2
+DRILL_WEIGHT = 1
+FACET_WEIGHT = 0.5   # pov / angle words typed into the free text
+PREFIX_FACTOR = 0.5  # partial (prefix) match of the last word
+
+FACETS = ("pov", "angle", "focus")
+
+
+def words(text):
+    return WORD_RE.findall((text or "").lower())
+
+
+def _key(value):
+    return " ".join(words(value))
+
+
+class DrillIndex:
+
+    def __init__(self, drill_map):
+        self.drill_map = drill_map
+        self.order = {topic: i for i, topic in enumerate(drill_map)}
+
+        self.by_focus = {}
+        self.by_pov = {}
+        self.by_angle = {}
+        self.by_drill = {}
+        self.word_index = {}    # word -> {topic: weight}
+        self.labels = {}        # phrase -> (kind, display text) for autocomplete
+
+        for topic, data in drill_map.items():
+            self._add_words(topic, topic, TOPIC_WEIGHT)
+            self._label(topic, "topic", topic)
+
+            for term in data.get("focus", []):
+                self.by_focus.setdefault(_key(term), set()).add(topic)
+                self._add_words(term, topic, FOCUS_WEIGHT)
+                self._label(term, "focus", term)
+
+            for pov in data.get("pov", []):
+                self.by_pov.setdefault(_key(pov), set()).add(topic)
+                self._add_words(pov, topic, FACET_WEIGHT)
+                self._label(pov, "pov", pov)
+
+            for angle in data.get("angles", []):
+                self.by_angle.setdefault(_key(angle), set()).add(topic)
+                self._add_words(angle, topic, FACET_WEIGHT)
+                self._label(angle, "angle", angle)
+
+            for drill in data.get("drills", []):
+                self.by_drill.setdefault(_key(drill), set()).add(topic)
+                self._add_words(drill, topic, DRILL_WEIGHT)
+                self._label(drill, "drill", drill)
+
+        self.vocabulary = sorted(self.word_index)
+        self.phrases = sorted(self.labels)
+
+    def _add_words(self, text, topic, weight):
+        for w in set(words(text)):
+            bucket = self.word_index.setdefault(w, {})
+            bucket[topic] = max(bucket.get(topic, 0), weight)
+
+    def _label(self, text, kind, display):
+        self.labels.setdefault(_key(text), (kind, display))
+
+    # -------------------------------------------------
+    # PREFIX LOOKUPS
+    # -------------------------------------------------
+    @staticmethod
+    def _with_prefix(sorted_items, prefix):
+        i = bisect_left(sorted_items, prefix)
+        while i < len(sorted_items) and sorted_items[i].startswith(prefix):
+            yield sorted_items[i]
+            i += 1
+
+    def complete(self, prefix, limit=8):
+        """Autocomplete entries [{"text", "kind"}] whose phrase starts with prefix."""
+        prefix = _key(prefix)
+        if not prefix:
+            return []
+        out = []
+        for phrase in self._with_prefix(self.phrases, prefix):
+            kind, display = self.labels[phrase]
+            out.append({"text": display, "kind": kind})
+            if len(out) >= limit:
+                break
+        return out
+
+    # -------------------------------------------------
+    # SEARCH
+    # -------------------------------------------------
+    def candidates(self, pov=(), angle=(), focus=()):
+        """Topics matching every given facet value (all topics without facets)."""
+        result = None
+        for index, values in ((self.by_pov, pov), (self.by_angle, angle), (self.by_focus, focus)):
+            for value in values:
+                topics = index.get(_key(value), set())
+                result = set(topics) if result is None else result & topics
+        return set(self.drill_map) if result is None else result
+
+    def search(self, q="", pov=(), angle=(), focus=(), limit=10):
+        """
+        Returns {"results": [...], "facets": {...}, "suggestions": [...]}.
+        Each result: topic, score, drills, angles, focus, pov. A blank
+        query has no results.
+        """
+        pool = self.candidates(pov, angle, focus)
+        terms = words(q)
+
+        if terms:
+            scores = {}
+            *full, last = terms
+            for w in full:
+                for topic, weight in self.word_index.get(w, {}).items():
+                    if topic in pool:
+                        scores[topic] = scores.get(topic, 0) + weight
+
+            # last word: exact hit, else the best prefix completion
+            last_scores = dict(self.word_index.get(last, {}))
+            for w in self._with_prefix(self.vocabulary, last):
+                if w == last:
+                    continue
+                for topic, weight in self.word_index[w].items():
+                    partial = weight * PREFIX_FACTOR
+                    if partial > last_scores.get(topic, 0):
+                        last_scores[topic] = partial
+            for topic, weight in last_scores.items():
+                if topic in pool:
+                    scores[topic] = scores.get(topic, 0) + weight
+        else:
+            # nothing typed: no hits (callers must not take a "top hit" from
+            # an arbitrary order); facets still count the filtered pool
+            scores = {}
+
+        ranked = sorted(scores, key=lambda t: (-scores[t], self.order[t]))
+
+        facets = {"pov": {}, "angle": {}, "focus": {}}
+        for topic in (ranked if terms else sorted(pool, key=self.order.get)):
+            data = self.drill_map[topic]
+            for kind, field in (("pov", "pov"), ("angle", "angles"), ("focus", "focus")):
+                for value in data.get(field, []):
+                    facets[kind][value] = facets[kind].get(value, 0) + 1
+
+        results = []
+        for topic in ranked[:limit]:
+            data = self.drill_map[topic]
+            results.append({
+                "topic": topic,
+                "score": round(scores[topic], 2),
+                "drills": data.get("drills", []),
+                "angles": data.get("angles", []),
+                "focus": data.get("focus", []),
+                "pov": data.get("pov", [])
+            })
+
+        return {
+            "total": len(ranked),
+            "results": results,
+            "facets": facets,
+            "suggestions": self.complete(terms[-1]) if terms else []
+        }
+
+
+drill_index = DrillIndex(DRILL_MAP)
@@ -0,0 +1,208 @@
+# services/drill_matcher.py
+#
+# Keyword matcher behind the AI coach suggestions.
+#
+# Built once at import from DRILL_MAP: every topic key, every `focus`
+# term and the SYNONYMS below are compiled into ONE regex with word
+# boundaries, so a coach note is scanned in a single pass and "bat" no
+# longer fires on "combat" or "batch". Multi-word phrases accept spaces
+# or hyphens between words and a plural "s"/"es".
+#
+# The regex is laid out as a character trie ("bat|bat swing|batting" ->
+# "bat(?:ting|[\s-]+swing)?"), so a position that cannot start a phrase
+# fails on its first character instead of trying ~130 alternatives.
+#
+# Each phrase votes for its topics:
+#   topic key  3
+#   synonym    2
+#   focus term 1, split between the topics sharing it
+# and topics are returned best score first.
+
+import re
+
+from drillmap import DRILL_MAP
+
+TOPIC_WEIGHT = 3
+SYNONYM_WEIGHT = 2
+FOCUS_WEIGHT = 1
+
+# coach shorthand -> DRILL_MAP topics
+SYNONYMS = {
+    "bat": ["bat swing"],
+    "swing": ["bat swing"],
+    "bat speed": ["bat swing"],
+    "foot": ["footwork batting"],
+    "feet": ["footwork batting"],
+    "footwork": ["footwork batting"],
+    "front foot": ["front foot movement"],
+    "back foot": ["back foot movement"],
+    "late": ["timing"],
+    "early": ["timing"],
+    "edge": ["outside edge issues", "inside edge issues"],
+    "nick": ["outside edge issues"],
+    "backlift": ["backlift control"],
+    "head": ["head position"],
+    "shot": ["shot selection"],
+    "slog": ["power hitting"],
+    "sixes": ["power hitting"],
+    "bowling": ["bowling action"],
+    "action": ["bowling action"],
+    "run up": ["run-up consistency"],
+    "runup": ["run-up consistency"],
+    "wrist": ["wrist position"],
+    "seam": ["seam control"],
+    "release": ["release point"],
+    "line": ["line and length"],
+    "length": ["line and length"],
+    "yorker": ["death over bowling"],
+    "death": ["death over bowling"],
+    "slower ball": ["pace variation"],
+    "googly": ["googly control"],
+    "spin": ["spin on flat pitch"],
+    "catch": ["catching"],
+    "dropped": ["catching"],
+    "fielding": ["ground fielding"],
+    "throw": ["throwing accuracy"],
+    "dive": ["diving"],
+    "keeper": ["glove work"],
+    "keeping": ["glove work", "keeping footwork"],
+    "gloves": ["glove work"],
+    "fitness": ["balance training"],
+    "balance": ["balance training"],
+    "core": ["core stability"],
+    "posture": ["core stability"],
+    "quick": ["speed"],
+    "sprint": ["speed"],
+    "focus": ["concentration"],
+    "distracted": ["concentration"],
+    "nervous": ["pressure handling"],
+    "pressure": ["pressure handling"],
+}
+
+# area + recommendation wording for topics coaches see most; the rest are
+# derived from the topic name and its focus terms
+AREAS = {
+    "bat swing": ("Batting Technique", "Improve bat swing & bat path control"),
+    "footwork batting": ("Footwork", "Improve front & back foot movement"),
+    "timing": ("Timing", "Improve timing and play late under eyes"),
+    "bowling action": ("Bowling Action", "Correct bowling action & alignment"),
+    "balance training": ("Fitness & Balance", "Improve balance, agility and core stability"),
+}
+
+WORD_SEP = re.compile(r"[\s\-]+")
+
+
+def _normalize(phrase):
+    return WORD_SEP.sub(" ", phrase.strip().lower())
+
+
+def _trie_pattern(phrases):
+    """One regex for all phrases, longest match first, shared prefixes merged."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = {}   # end of a phrase
+
+    def build(node):
+        alternatives = [
+            (r"[\s\-]+" if ch == " " else re.escape(ch)) + build(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not alternatives:
+            return ""
+        ends_here = "" in node
+        if len(alternatives) == 1 and not ends_here:
+            return alternatives[0]
+        group = "(?:" + "|".join(alternatives) + ")"
+        # greedy "?" keeps the longer phrase when both match
+        return group + "?" if ends_here else group
+
+    return build(trie)
+
+
+class DrillMatcher:
+
+    def __init__(self, drill_map, synonyms=None):
+        self.drill_map = drill_map
+
+        # phrase -> {topic: weight}
+        votes = {}
+
+        def vote(phrase, topic, weight):
+            phrase = _normalize(phrase)
+            if phrase and topic in drill_map:
+                bucket = votes.setdefault(phrase, {})
+                bucket[topic] = max(bucket.get(topic, 0), weight)
+
+        focus_topics = {}
+        for topic, data in drill_map.items():
+            vote(topic, topic, TOPIC_WEIGHT)
+            for term in data.get("focus", []):
+                focus_topics.setdefault(_normalize(term), []).append(topic)
+
+        for term, topics in focus_topics.items():
+            for topic in topics:
+                vote(term, topic, FOCUS_WEIGHT / len(topics))
+
+        for phrase, topics in (synonyms or {}).items():
+            for topic in topics:
+                vote(phrase, topic, SYNONYM_WEIGHT)
+
+        self.votes = votes
+
+        self.pattern = re.compile(
+            r"\b(?:" + _trie_pattern(votes) + r")(?:e?s)?\b",
+            re.IGNORECASE
+        )
+
+    def _lookup(self, text):
+        phrase = _normalize(text)
+        if phrase in self.votes:
+            return self.votes[phrase]
+        for suffix in ("es", "s"):
+            if phrase.endswith(suffix) and phrase[:-len(suffix)] in self.votes:
+                return self.votes[phrase[:-len(suffix)]]
+        return {}
+
+    def _scan(self, note):
+        scores, first_seen = {}, {}
+        for m in self.pattern.finditer(note or ""):
+            for topic, weight in self._lookup(m.group(0)).items():
+                scores[topic] = scores.get(topic, 0) + weight
+                first_seen.setdefault(topic, m.start())
+        return scores, first_seen
+
+    def score(self, note):
+        """{topic: score} for every topic mentioned in the note."""
+        return self._scan(note)[0]
+
+    def match(self, note, limit=5, min_score=1):
+        """Topics best first (ties: earliest mention first)."""
+        scores, first_seen = self._scan(note)
+        ranked = sorted(
+            (t for t, s in scores.items() if s >= min_score),
+            key=lambda t: (-scores[t], first_seen[t])
+        )
+        return ranked[:limit]
+
+    def suggestions(self, note, limit=5):
+        """Suggestion dicts in the shape generate_ai_suggestions returns."""
+        result = []
+        for topic in self.match(note, limit=limit):
+            data = self.drill_map[topic]
+            focus = data.get("focus") or [topic]
+            area, recommendation = AREAS.get(topic) or (
+                topic.title(),
+                "Work on " + ", ".join(focus)
+            )
+            result.append({
+                "area": area,
+                "recommendation": recommendation,
+                "drills": data["drills"]
+            })
+        return result
+
+
+matcher = DrillMatcher(DRILL_MAP, SYNONYMS)
@@ -0,0 +1,218 @@
+# services/food_catalogue.py
+#
+# The food_item table, held in memory as parallel arrays:
+#
+#   ids       array('q')   food id of row i
+#   calories  array('d')   per unit, row i
+#   protein   array('d')
+#   carbs     array('d')
+#   fat       array('d')
+#   names     list[str]
+#   categories list[str]   one of CATEGORIES (the diet food pages) or ""
+#
+# plus position = {food_id: i}. Loaded once and kept for
+# FOOD_CATALOGUE_TTL seconds; FoodItem inserts / updates / deletes made
+# through the ORM in this process drop it at once (mapper events), other
+# workers and direct SQL imports are picked up when it expires.
+#
+# totals() works on the chosen rows only: gather their positions, then
+# each macro total is one dot product of the quantities against that
+# column - no per-food ORM objects, no loop over the whole catalogue.
+#
+# search() is the calculator's typeahead: every word of every name goes
+# into one sorted array of (word, row), so the rows with a word starting
+# with the typed prefix are one bisect + a contiguous slice, whatever the
+# size of the catalogue. Category counts of the matches come back as
+# facets.
+
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from operator import mul
+
+from sqlalchemy import event
+
+from models import db, FoodItem
+
+MACROS = ("calories", "protein", "carbs", "fat")
+
+# same groups and order as the /diet/foods/* pages
+CATEGORIES = {
+    "fruits": "Fruits",
+    "vegetables": "Vegetables",
+    "nuts_seeds": "Nuts & Seeds",
+    "dairy": "Dairy",
+    "grains": "Grains",
+    "protein": "Protein",
+}
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def words(text):
+    return WORD_RE.findall((text or "").lower())
+
+
+def _dot(a, b):
+    return sum(map(mul, a, b))
+
+
+class Catalogue:
+
+    def __init__(self, rows):
+        self.ids = array("q")
+        self.names = []
+        self.categories = []
+        self.columns = {m: array("d") for m in MACROS}
+        for food_id, name, category, *macros in rows:
+            self.ids.append(food_id)
+            self.names.append(name or "")
+            self.categories.append(category or "")
+            for m, value in zip(MACROS, macros):
+                self.columns[m].append(value or 0.0)
+        self.position = {food_id: i for i, food_id in enumerate(self.ids)}
+
+        # (word, row) for every word of every name, sorted for prefix bisects
+        self.word_index = sorted(
+            (w, i) for i, name in enumerate(self.names) for w in set(words(name))
+        )
+        self.word_keys = [w for w, _ in self.word_index]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, food_id):
+        return food_id in self.position
+
+    def foods(self):
+        """Every food as a dict, by name."""
+        return [self.food(food_id) for food_id in self.ids]
+
+    def food(self, food_id):
+        """One food as a dict, None if unknown."""
+        i = self.position.get(food_id)
+        if i is None:
+            return None
+        food = {"id": food_id, "name": self.names[i], "category": self.categories[i]}
+        for m in MACROS:
+            food[m] = self.columns[m][i]
+        return food
+
+    def totals(self, quantities):
+        """
+        quantities: {food_id: qty}. Unknown foods and qty <= 0 are
+        skipped. Returns (items, totals): one dict per kept food with its
+        scaled macros, and the summed macros.
+        """
+        chosen = [
+            (self.position[food_id], food_id, qty)
+            for food_id, qty in quantities.items()
+            if qty > 0 and food_id in self.position
+        ]
+        qty = array("d", (q for _, _, q in chosen))
+
+        scaled = {}
+        totals = {}
+        for m in MACROS:
+            column = array("d", (self.columns[m][i] for i, _, _ in chosen))
+            scaled[m] = array("d", map(mul, column, qty))
+            totals[m] = _dot(column, qty)
+
+        items = [
+            dict(food_id=food_id, quantity=q, **{m: scaled[m][k] for m in MACROS})
+            for k, (_, food_id, q) in enumerate(chosen)
+        ]
+        return items, totals
+
+
+    # -------------------------------------------------
+    # SEARCH
+    # -------------------------------------------------
+    def _rows_with_prefix(self, prefix):
+        start = bisect_left(self.word_keys, prefix)
+        end = bisect_left(self.word_keys, prefix + "\uffff", start)
+        return {i for _, i in self.word_index[start:end]}
+
+    def search(self, q="", category=None, limit=10):
+        """
+        Foods whose name has a word starting with each typed word
+        ("bas ri" finds "Basmati Rice"). Returns {"total", "results",
+        "facets"}; facets count the matches per category, before the
+        category filter, so the chips keep their numbers.
+        """
+        terms = words(q)
+        if terms:
+            rows = None
+            for term in terms:
+                hits = self._rows_with_prefix(term)
+                rows = hits if rows is None else rows & hits
+                if not rows:
+                    break
+        else:
+            rows = set(range(len(self.ids)))
+
+        facets = {}
+        for i in rows:
+            c = self.categories[i]
+            if c:
+                facets[c] = facets.get(c, 0) + 1
+
+        if category:
+            rows = {i for i in rows if self.categories[i] == category}
+
+        lowered = q.strip().lower()
+        best = heapq.nsmallest(
+            limit,
+            rows,
+            key=lambda i: (
+                not self.names[i].lower().startswith(lowered),   # whole-name prefix first
+                len(self.names[i]),
+                self.names[i].lower()
+            )
+        )
+        return {
+            "total": len(rows),
+            "results": [self.food(self.ids[i]) for i in best],
+            "facets": {c: facets[c] for c in CATEGORIES if c in facets}
+        }
+
+
+class FoodCatalogue:
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded = None     # (loaded_at, Catalogue)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("FOOD_CATALOGUE_TTL", self.ttl)
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(FoodItem, name, self._on_change)
+
+    def _on_change(self, mapper, connection, target):
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = None
+
+    def get(self):
+        loaded = self._loaded
+        if loaded is not None and time.monotonic() - loaded[0] < self.ttl:
+            return loaded[1]
+
+        rows = db.session.query(
+            FoodItem.id, FoodItem.name, FoodItem.category,
+            FoodItem.calories, FoodItem.protein, FoodItem.carbs, FoodItem.fat
+        ).order_by(FoodItem.name, FoodItem.id).all()
+
+        catalogue = Catalogue(rows)
+        with self._lock:
+            self._loaded = (time.monotonic(), catalogue)
+        return catalogue
+
+
+food_catalogue = FoodCatalogue()
@@ -0,0 +1,98 @@
+# services/identity.py
+#
+# What current_user is.
+#
+# Routes only ever read current_user.id / .role / .username, then look up
+# the user's Player or Coach row to get its id. load() answers all of that
+# with ONE query (users LEFT JOIN players LEFT JOIN coaches, plain columns)
+# into a small Identity object, kept per process for IDENTITY_TTL seconds.
+# Flask-Login already keeps the loaded user for the rest of the request,
+# so a request with a warm cache runs no identity query at all - the live
+# scoring permission checks on every ball included.
+#
+# User / Player / Coach changes made through the ORM in this process bump
+# the user's version and drop the entry (a load racing with the change is
+# not stored); other workers catch up when their entry expires.
+
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User, Player, Coach
+
+
+class Identity(UserMixin):
+    """The logged-in user: users columns + player_id / coach_id."""
+
+    def __init__(self, id, username, email, role, status, player_id, coach_id):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.status = status
+        self.player_id = player_id
+        self.coach_id = coach_id
+
+    def __repr__(self):
+        return f"<Identity {self.id} {self.username} {self.role}>"
+
+
+class IdentityCache:
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}      # user_id -> (loaded_at, version, Identity)
+        self._versions = {}   # user_id -> int, bumped on every change
+
+    def init_app(self, app):
+        self.ttl = app.config.get("IDENTITY_TTL", self.ttl)
+        for model, user_id in ((User, "id"), (Player, "user_id"), (Coach, "user_id")):
+            for name in ("after_insert", "after_update", "after_delete"):
+                event.listen(model, name, self._on_change(user_id))
+
+    def _on_change(self, attr):
+        def listener(mapper, connection, target):
+            user_id = getattr(target, attr, None)
+            if user_id is not None:
+                self.invalidate(user_id)
+        return listener
+
+    def invalidate(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._cache.pop(user_id, None)
+
+    def load(self, user_id):
+        """Identity of this user id, None if there is no such user."""
+        user_id = int(user_id)
+        entry = self._cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl \
+                and entry[1] == self._versions.get(user_id, 0):
+            return entry[2]
+
+        version = self._versions.get(user_id, 0)
+        row = (
+            db.session.query(
+                User.id, User.username, User.email, User.role, User.status,
+                Player.id, Coach.id
+            )
+            .outerjoin(Player, Player.user_id == User.id)
+            .outerjoin(Coach, Coach.user_id == User.id)
+            .filter(User.id == user_id)
+            .first()
+        )
+        if row is None:
+            return None
+
+        identity = Identity(*row)
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                self._cache[user_id] = (time.monotonic(), version, identity)
+        return identity
+
+
+identities = IdentityCache()
@@ -0,0 +1,331 @@
+# services/notifications.py
+#
+# Notification fan-out.
+#
+# fan_out() writes one Notification per user of an audience query with a
+# single INSERT ... SELECT, then pushes one "notification" Socket.IO event
+# per user_{id} room. Audiences larger than NOTIFY_ASYNC_THRESHOLD are
+# handled in a background task so the coach's request returns at once.
+#
+# notify() is the single-row path. The push is queued when the session
+# commits (dropped on rollback) and delivered by a background loop every
+# NOTIFY_COALESCE_MS, one event per user however many rows landed - 30 AI
+# suggestions from one attendance save become one {"count": 30} event.
+# Users who are not connected are skipped; they see the rows on next load.
+#
+# Duplicates are handled in the database, not by SELECT-then-INSERT:
+#   notify(..., dedup_key=k) - insert-or-ignore on UNIQUE(user_id, dedup_key),
+#                              e.g. one attendance reminder per coach per day
+#   digest()                 - the same message (same category + target)
+#                              again within NOTIFY_DIGEST_WINDOW upserts one
+#                              row and bumps its count instead of adding
+#                              another row; different messages keep their
+#                              own rows, so nothing is lost
+#
+# The digest window is a fixed bucket (unix time // window), not a sliding
+# one: a repeat that lands just after a bucket boundary starts a new row.
+# Sliding would need a SELECT-then-INSERT per item.
+#
+# prune() is the retention job: read notifications older than
+# NOTIFY_RETENTION_DAYS are deleted in id batches.
+
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, literal, select
+
+from models import db, Notification
+from services.presence import presence
+from services.upsert import upsert
+
+PENDING_KEY = "pending_notification_pushes"
+
+
+class Notifier:
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.async_threshold = 200
+        self.coalesce = 0.5
+        self.digest_window = 3600
+
+        self._lock = threading.Lock()
+        self._outbox = {}    # user_id -> {"count": n, "message": latest, ...}
+        self._running = False
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.async_threshold = app.config.get("NOTIFY_ASYNC_THRESHOLD", self.async_threshold)
+        self.coalesce = app.config.get("NOTIFY_COALESCE_MS", 500) / 1000.0
+        self.digest_window = app.config.get("NOTIFY_DIGEST_WINDOW", self.digest_window)
+
+        event.listen(db.session, "after_commit", self._on_commit)
+        event.listen(db.session, "after_rollback", self._on_rollback)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._push_loop)
+
+    # -------------------------------------------------
+    # PUBLIC
+    # -------------------------------------------------
+    def fan_out(self, audience, message, link=None, category=None, dedup_key=None):
+        """
+        audience: a select() returning one column of user ids.
+        Runs inline for small audiences, in the background otherwise.
+        With dedup_key, users who already have that key are skipped.
+        Returns the audience size.
+        """
+        audience = audience.distinct()
+        size = db.session.execute(
+            select(func.count()).select_from(audience.subquery())
+        ).scalar()
+
+        if not size:
+            return 0
+
+        if size > self.async_threshold:
+            self.socketio.start_background_task(
+                self._fan_out_in_context, audience, message, link, category, dedup_key
+            )
+        else:
+            self._fan_out(audience, message, link, category, dedup_key)
+
+        return size
+
+    def notify(self, user_id, message, link=None, category=None, dedup_key=None):
+        """
+        Add one notification to the current session (caller commits, as
+        with db.session.add). The real-time push goes out after commit.
+
+        With dedup_key the row is inserted only if the user has no row with
+        that key yet; returns False when it already existed.
+        """
+        if dedup_key is None:
+            db.session.add(Notification(
+                user_id=user_id,
+                message=message,
+                link=link,
+                category=category
+            ))
+        else:
+            result = db.session.execute(
+                self._insert_ignore().values(
+                    user_id=user_id,
+                    message=message,
+                    link=link,
+                    category=category,
+                    dedup_key=dedup_key,
+                    count=1,
+                    is_read=False,
+                    created_at=datetime.utcnow()
+                )
+            )
+            if not result.rowcount:
+                return False
+
+        self._pending_push(user_id, message, link, category)
+        return True
+
+    def digest(self, user_id, category, message, link=None, target=None):
+        """
+        Merge into the user's row for this message (category, target) in
+        the current NOTIFY_DIGEST_WINDOW: its count goes up and it becomes
+        unread again. A different message gets a row of its own. Caller
+        commits.
+        """
+        self.digest_many(category, [(user_id, message, link)], target)
+
+    def digest_many(self, category, items, target=None):
+        """
+        digest() for many (user_id, message, link) items at once: one
+        upsert row per user and distinct message, counting its repeats.
+        """
+        now = datetime.utcnow()
+        bucket = int(now.timestamp()) // self.digest_window
+
+        rows = {}
+        for user_id, message, link in items:
+            message = message[:255]
+            digest = hashlib.sha1(message.encode()).hexdigest()[:16]
+            # trimmed from the left: the bucket and hash must survive
+            dedup_key = f"{category}:{target or ''}:{bucket}:{digest}"[-120:]
+
+            row = rows.get((user_id, dedup_key))
+            if row is not None:
+                row["count"] += 1
+                continue
+            rows[(user_id, dedup_key)] = dict(
+                user_id=user_id,
+                message=message,
+                link=link,
+                category=category,
+                dedup_key=dedup_key,
+                count=1,
+                is_read=False,
+                created_at=now
+            )
+        if not rows:
+            return
+
+        db.session.execute(upsert(
+            Notification,
+            list(rows.values()),
+            ["user_id", "dedup_key"],
+            lambda new: dict(
+                link=new.link,
+                count=Notification.count + new.count,
+                is_read=False,
+                created_at=new.created_at
+            )
+        ))
+
+        for row in rows.values():
+            self._pending_push(row["user_id"], row["message"], row["link"], category, row["count"])
+
+    def mark_all_read(self, user_id):
+        """Single UPDATE; returns the number of rows changed."""
+        n = Notification.query.filter_by(
+            user_id=user_id,
+            is_read=False
+        ).update({"is_read": True}, synchronize_session=False)
+        db.session.commit()
+        return n
+
+    def prune(self, older_than_days, batch_size=1000):
+        """Delete read notifications older than the cutoff. Returns rows deleted."""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        deleted = 0
+
+        while True:
+            ids = [
+                r[0] for r in db.session.query(Notification.id)
+                .filter(
+                    Notification.is_read == True,
+                    Notification.created_at < cutoff
+                )
+                .order_by(Notification.id)
+                .limit(batch_size).all()
+            ]
+            if not ids:
+                break
+
+            db.session.query(Notification).filter(
+                Notification.id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+
+        return deleted
+
+    # -------------------------------------------------
+    # INTERNALS
+    # -------------------------------------------------
+    def _insert_ignore(self):
+        # duplicate (user_id, dedup_key) rows are skipped, not raised
+        return insert(Notification).prefix_with(
+            "IGNORE", dialect="mysql"
+        ).prefix_with(
+            "OR IGNORE", dialect="sqlite"
+        )
+
+    def _pending_push(self, user_id, message, link, category, count=1):
+        db.session.info.setdefault(PENDING_KEY, []).append(
+            (user_id, {"message": message, "link": link, "category": category, "count": count})
+        )
+
+    def _fan_out_in_context(self, audience, message, link, category, dedup_key):
+        with self.app.app_context():
+            try:
+                self._fan_out(audience, message, link, category, dedup_key)
+            except Exception as e:
+                db.session.rollback()
+                print("⚠️ Notification fan-out failed:", e)
+
+    def _fan_out(self, audience, message, link, category, dedup_key=None):
+        now = datetime.utcnow()
+        audience = audience.subquery()
+        user_col = list(audience.c)[0]
+
+        # rows with this key above the current max id are the ones we insert
+        # (created_at can't tell: DATETIME drops the microseconds of `now`)
+        last_id = None
+        if dedup_key:
+            last_id = db.session.execute(select(func.max(Notification.id))).scalar() or 0
+
+        stmt = self._insert_ignore() if dedup_key else insert(Notification)
+        db.session.execute(
+            stmt.from_select(
+                ["user_id", "message", "link", "category", "dedup_key",
+                 "count", "is_read", "created_at"],
+                select(
+                    user_col,
+                    literal(message),
+                    literal(link),
+                    literal(category),
+                    literal(dedup_key),
+                    literal(1),
+                    literal(False),
+                    literal(now)
+                )
+            )
+        )
+        db.session.commit()
+
+        if dedup_key:
+            # only the users that actually got a new row
+            users = select(Notification.user_id).where(
+                Notification.dedup_key == dedup_key,
+                Notification.id > last_id
+            )
+        else:
+            users = select(user_col)
+        user_ids = [r[0] for r in db.session.execute(users)]
+        payload = {"message": message, "link": link, "category": category}
+        self._queue_pushes((uid, payload) for uid in user_ids)
+
+    # -------------------------------------------------
+    # COALESCED PUSH
+    # -------------------------------------------------
+    def _on_commit(self, session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if pending:
+            self._queue_pushes(pending)
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+
+    def _queue_pushes(self, pushes):
+        with self._lock:
+            for uid, payload in pushes:
+                count = payload.get("count", 1)
+                entry = self._outbox.get(uid)
+                if entry is None:
+                    self._outbox[uid] = dict(payload, count=count)
+                else:
+                    entry.update(payload, count=entry["count"] + count)
+
+    def flush_pushes(self):
+        with self._lock:
+            outbox, self._outbox = self._outbox, {}
+
+        for uid, payload in outbox.items():
+            if not presence.is_online(uid):
+                continue
+            self.socketio.emit("notification", payload, to=f"user_{uid}")
+
+    def _push_loop(self):
+        while self._running:
+            self.socketio.sleep(self.coalesce)
+            try:
+                self.flush_pushes()
+            except Exception as e:
+                print("⚠️ Notification push failed:", e)
+
+
+notifier = Notifier()
@@ -0,0 +1,231 @@
+# services/nutrition_stats.py
+#
+# Nutrition rollups, so trends never scan nutrition_log:
+#   nutrition_daily        - macros per user per day (all groups)
+#   nutrition_group_daily  - macros per group per day + members who logged
+#
+# record_log() is called with every new log and adds it to both with two
+# upserts. Trends (7 / 30 / 90 days), group averages, target adherence and
+# the group leaderboard are read from the rollups only. rebuild()
+# (flask nutrition-rollup-rebuild) recomputes both from nutrition_log.
+#
+# A day is "on target" when calories and protein both reach
+# NUTRITION_TARGET_TOLERANCE of NUTRITION_TARGET_CALORIES / _PROTEIN
+# (the daily targets on the diet pages).
+
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, insert, select
+
+from models import (
+    db, NutritionDaily, NutritionGroupDaily, NutritionGroupMember, NutritionLog, User
+)
+from services.upsert import upsert
+
+MACROS = ("calories", "protein", "carbs", "fat")
+TREND_DAYS = (7, 30, 90)
+
+
+def _targets():
+    cfg = current_app.config
+    tolerance = cfg.get("NUTRITION_TARGET_TOLERANCE", 0.9)
+    return (
+        cfg.get("NUTRITION_TARGET_CALORIES", 3000) * tolerance,
+        cfg.get("NUTRITION_TARGET_PROTEIN", 130) * tolerance
+    )
+
+
+def on_target(calories, protein, targets=None):
+    min_calories, min_protein = targets or _targets()
+    return calories >= min_calories and protein >= min_protein
+
+
+def window(days, today=None):
+    """(first_day, today) of the last `days` days, today included."""
+    today = today or date.today()
+    return today - timedelta(days=days - 1), today
+
+
+# -------------------------------------------------
+# INCREMENTAL UPDATE
+# -------------------------------------------------
+def record_log(log):
+    """Add one new (flushed) NutritionLog to the rollups. Caller commits."""
+    values = {m: getattr(log, f"total_{m}") or 0 for m in MACROS}
+
+    db.session.execute(upsert(
+        NutritionDaily,
+        [dict(user_id=log.user_id, log_date=log.log_date, logs=1, **values)],
+        ["user_id", "log_date"],
+        lambda new: dict(
+            logs=NutritionDaily.logs + 1,
+            **{m: getattr(NutritionDaily, m) + getattr(new, m) for m in MACROS}
+        )
+    ))
+
+    if not log.group_id:
+        return
+
+    # (user_id, log_date) index: did this member already log to the group today?
+    first_today = not db.session.query(
+        db.session.query(NutritionLog.id).filter(
+            NutritionLog.user_id == log.user_id,
+            NutritionLog.log_date == log.log_date,
+            NutritionLog.group_id == log.group_id,
+            NutritionLog.id != log.id
+        ).exists()
+    ).scalar()
+
+    db.session.execute(upsert(
+        NutritionGroupDaily,
+        [dict(group_id=log.group_id, log_date=log.log_date, logs=1,
+              members=1 if first_today else 0, **values)],
+        ["group_id", "log_date"],
+        lambda new: dict(
+            logs=NutritionGroupDaily.logs + 1,
+            members=NutritionGroupDaily.members + new.members,
+            **{m: getattr(NutritionGroupDaily, m) + getattr(new, m) for m in MACROS}
+        )
+    ))
+
+
+# -------------------------------------------------
+# READS
+# -------------------------------------------------
+def _series(rows, first, today, value):
+    """One entry per day of the window, None for days without logs."""
+    by_day = {r.log_date: r for r in rows}
+    series = []
+    day = first
+    while day <= today:
+        r = by_day.get(day)
+        series.append({"date": day.isoformat(), **(value(r) if r else {m: None for m in MACROS})})
+        day += timedelta(days=1)
+    return series
+
+
+def _summary(days_logged, days, totals, on_target_days):
+    return {
+        "days": days,
+        "days_logged": days_logged,
+        "average": {m: round(totals[m] / days_logged, 1) if days_logged else 0 for m in MACROS},
+        "on_target_days": on_target_days,
+        "adherence": round(100 * on_target_days / days_logged) if days_logged else None
+    }
+
+
+def user_trend(user_id, days=7, today=None):
+    """Daily macros of one user over the last `days` days, plus averages and adherence."""
+    first, today = window(days, today)
+    rows = NutritionDaily.query.filter(
+        NutritionDaily.user_id == user_id,
+        NutritionDaily.log_date.between(first, today)
+    ).all()
+
+    targets = _targets()
+    totals = {m: sum(getattr(r, m) for r in rows) for m in MACROS}
+    hits = sum(1 for r in rows if on_target(r.calories, r.protein, targets))
+
+    return {
+        "series": _series(rows, first, today, lambda r: {m: round(getattr(r, m), 1) for m in MACROS}),
+        **_summary(len(rows), days, totals, hits)
+    }
+
+
+def group_trend(group_id, days=7, today=None):
+    """Per-member daily averages of one group over the last `days` days."""
+    first, today = window(days, today)
+    rows = NutritionGroupDaily.query.filter(
+        NutritionGroupDaily.group_id == group_id,
+        NutritionGroupDaily.log_date.between(first, today)
+    ).all()
+
+    targets = _targets()
+    averages = {m: sum(r.average(m) for r in rows) for m in MACROS}
+    hits = sum(1 for r in rows if on_target(r.average("calories"), r.average("protein"), targets))
+
+    return {
+        "series": _series(rows, first, today, lambda r: {
+            **{m: round(r.average(m), 1) for m in MACROS},
+            "members": r.members
+        }),
+        **_summary(len(rows), days, averages, hits)
+    }
+
+
+def group_leaderboard(group_id, days=7, today=None):
+    """
+    Members ranked by days on target, then average protein, from
+    nutrition_daily (their whole day, whichever group they logged to).
+    """
+    first, today = window(days, today)
+    min_calories, min_protein = _targets()
+
+    hit = func.sum(case(
+        ((NutritionDaily.calories >= min_calories) & (NutritionDaily.protein >= min_protein), 1),
+        else_=0
+    ))
+    rows = db.session.query(
+        User.id,
+        User.username,
+        func.count(NutritionDaily.id),
+        hit,
+        func.avg(NutritionDaily.calories),
+        func.avg(NutritionDaily.protein)
+    ).join(
+        NutritionGroupMember, NutritionGroupMember.user_id == User.id
+    ).outerjoin(
+        NutritionDaily,
+        (NutritionDaily.user_id == User.id) & NutritionDaily.log_date.between(first, today)
+    ).filter(
+        NutritionGroupMember.group_id == group_id
+    ).group_by(User.id, User.username).all()
+
+    board = [
+        {
+            "user_id": uid,
+            "username": username,
+            "days_logged": logged,
+            "on_target_days": int(hits or 0),
+            "adherence": round(100 * (hits or 0) / logged) if logged else None,
+            "avg_calories": round(avg_cal or 0),
+            "avg_protein": round(avg_pro or 0, 1)
+        }
+        for uid, username, logged, hits, avg_cal, avg_pro in rows
+    ]
+    board.sort(key=lambda r: (-r["on_target_days"], -r["avg_protein"], r["username"]))
+    return board
+
+
+# -------------------------------------------------
+# FULL REBUILD
+# -------------------------------------------------
+def rebuild():
+    """Recompute both rollups from nutrition_log. Returns user-days written."""
+    db.session.query(NutritionDaily).delete(synchronize_session=False)
+    db.session.query(NutritionGroupDaily).delete(synchronize_session=False)
+
+    sums = [func.coalesce(func.sum(getattr(NutritionLog, f"total_{m}")), 0) for m in MACROS]
+
+    result = db.session.execute(
+        insert(NutritionDaily).from_select(
+            ["user_id", "log_date", *MACROS, "logs"],
+            select(NutritionLog.user_id, NutritionLog.log_date, *sums, func.count())
+            .where(NutritionLog.user_id.isnot(None), NutritionLog.log_date.isnot(None))
+            .group_by(NutritionLog.user_id, NutritionLog.log_date)
+        )
+    )
+    db.session.execute(
+        insert(NutritionGroupDaily).from_select(
+            ["group_id", "log_date", *MACROS, "logs", "members"],
+            select(
+                NutritionLog.group_id, NutritionLog.log_date, *sums,
+                func.count(), func.count(NutritionLog.user_id.distinct())
+            )
+            .where(NutritionLog.group_id.isnot(None), NutritionLog.log_date.isnot(None))
+            .group_by(NutritionLog.group_id, NutritionLog.log_date)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
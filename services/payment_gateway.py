@@ -0,0 +1,141 @@
+# services/payment_gateway.py
+#
+# The one place that talks to Razorpay.
+#
+# - one razorpay.Client per process, reused for every call; its
+#   requests.Session keeps up to PAYMENT_GATEWAY_POOL keep-alive
+#   connections, so an order does not pay for a fresh TLS handshake
+# - every call has a PAYMENT_GATEWAY_TIMEOUT; after
+#   PAYMENT_BREAKER_FAILURES failures in a row calls fail fast for
+#   PAYMENT_BREAKER_COOLDOWN seconds instead of tying up workers on a
+#   gateway that is down
+# - signatures (checkout callback + webhooks) are checked locally with
+#   HMAC-SHA256, no network round trip
+#
+# PAYMENT_GATEWAY_URL points the client somewhere else than
+# api.razorpay.com, e.g. the local stand-in in tools/fake_razorpay.py.
+
+import hashlib
+import hmac
+import threading
+import time
+
+
+class GatewayUnavailable(Exception):
+    """Gateway timed out, errored, or is cooling down after repeated failures."""
+
+
+class PaymentGateway:
+
+    def __init__(self):
+        self.key_id = None
+        self.key_secret = None
+        self.webhook_secret = None
+        self.base_url = None
+        self.timeout = 5
+        self.pool_size = 10
+        self.breaker_failures = 3
+        self.breaker_cooldown = 30
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0
+
+    def init_app(self, app):
+        cfg = app.config
+        self.key_id = cfg.get("RAZORPAY_KEY_ID")
+        self.key_secret = cfg.get("RAZORPAY_KEY_SECRET")
+        self.webhook_secret = cfg.get("RAZORPAY_WEBHOOK_SECRET")
+        self.base_url = cfg.get("PAYMENT_GATEWAY_URL")
+        self.timeout = cfg.get("PAYMENT_GATEWAY_TIMEOUT", self.timeout)
+        self.pool_size = cfg.get("PAYMENT_GATEWAY_POOL", self.pool_size)
+        self.breaker_failures = cfg.get("PAYMENT_BREAKER_FAILURES", self.breaker_failures)
+        self.breaker_cooldown = cfg.get("PAYMENT_BREAKER_COOLDOWN", self.breaker_cooldown)
+
+    # -------------------------------------------------
+    # CLIENT (created once, shared)
+    # -------------------------------------------------
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import razorpay
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+
+                    options = {"base_url": self.base_url} if self.base_url else {}
+                    self._client = razorpay.Client(
+                        session=session,
+                        auth=(self.key_id, self.key_secret),
+                        **options
+                    )
+        return self._client
+
+    def _call(self, fn, *args):
+        if time.monotonic() < self._open_until:
+            raise GatewayUnavailable("Payment gateway is busy, please try again shortly")
+        try:
+            result = fn(*args, timeout=self.timeout)
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                if self._failures >= self.breaker_failures:
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+                    self._failures = 0
+            raise GatewayUnavailable(str(e)) from e
+
+        self._failures = 0
+        return result
+
+    # -------------------------------------------------
+    # API
+    # -------------------------------------------------
+    def create_order(self, amount_paise, receipt=None, notes=None):
+        return self._call(self.client.order.create, {
+            "amount": amount_paise,
+            "currency": "INR",
+            "receipt": receipt,
+            "notes": notes or {},
+            "payment_capture": 1
+        })
+
+    def fetch_order(self, order_id):
+        return self._call(self.client.order.fetch, order_id)
+
+    def order_payments(self, order_id):
+        return self._call(self.client.order.payments, order_id).get("items", [])
+
+    # -------------------------------------------------
+    # SIGNATURES (local)
+    # -------------------------------------------------
+    @staticmethod
+    def _hmac(secret, message):
+        return hmac.new(
+            (secret or "").encode(),
+            message if isinstance(message, bytes) else message.encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+    def verify_payment(self, order_id, payment_id, signature):
+        """Checkout callback: HMAC(key_secret, "order_id|payment_id")."""
+        if not (order_id and payment_id and signature and self.key_secret):
+            return False
+        expected = self._hmac(self.key_secret, f"{order_id}|{payment_id}")
+        return hmac.compare_digest(expected, signature)
+
+    def verify_webhook(self, body, signature):
+        """Webhook: HMAC(webhook_secret, raw body)."""
+        if not (body and signature and self.webhook_secret):
+            return False
+        expected = self._hmac(self.webhook_secret, body)
+        return hmac.compare_digest(expected, signature)
+
+
+gateway = PaymentGateway()
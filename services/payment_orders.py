@@ -0,0 +1,251 @@
+# services/payment_orders.py
+#
+# Idempotent "pay" buttons.
+#
+# A player has at most ONE active match_payments row per session
+# (uq_match_payments_active on availability_id, user_id, is_active), so
+# (availability_id, user_id) is the idempotency key of a payment:
+#
+# - checkout() reuses the active razorpay order instead of creating a new
+#   gateway order on every click. The row is claimed with an
+#   insert-or-ignore BEFORE the gateway is called, so two concurrent
+#   clicks cannot both create an order; the loser gets a 409 and retries.
+# - the order returned to the browser is kept in-process for
+#   PAYMENT_ORDER_CACHE_TTL seconds, so double clicks and page reloads do
+#   not even reach the database. forget() drops it once the payment settles.
+# - request_cash() is a no-op when the cash request already exists and
+#   supersedes (is_active NULL) an unfinished online attempt.
+# - approve_cash() settles a whole session's cash in one UPDATE.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, update
+
+from models import db, MatchPayment
+from services.notifications import notifier
+from services.payment_gateway import gateway
+from services.payment_stats import refresh as refresh_summary
+
+# a claimed row without an order id older than this is left over from a
+# crashed request and may be taken over
+CLAIM_TIMEOUT = timedelta(minutes=2)
+
+
+class OrderRejected(Exception):
+    """The player cannot start a payment right now; message is user-facing."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class PaymentOrders:
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}    # (availability_id, user_id) -> (stored_at, checkout dict)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("PAYMENT_ORDER_CACHE_TTL", self.ttl)
+
+    # -------------------------------------------------
+    # CACHE
+    # -------------------------------------------------
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def _remember(self, key, checkout):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), checkout)
+            # drop expired entries now and then
+            if len(self._cache) > 1000:
+                now = time.monotonic()
+                for k in [k for k, (t, _) in self._cache.items() if now - t >= self.ttl]:
+                    del self._cache[k]
+        return checkout
+
+    def forget(self, availability_id, user_id):
+        with self._lock:
+            self._cache.pop((availability_id, user_id), None)
+
+    # -------------------------------------------------
+    # ACTIVE PAYMENT
+    # -------------------------------------------------
+    @staticmethod
+    def active(availability_id, user_id):
+        return MatchPayment.query.filter_by(
+            availability_id=availability_id,
+            user_id=user_id,
+            is_active=True
+        ).first()
+
+    @staticmethod
+    def _claim(availability, user_id, method, status, **extra):
+        """Insert the active row unless one exists. Returns True if inserted."""
+        result = db.session.execute(
+            insert(MatchPayment)
+            .prefix_with("IGNORE", dialect="mysql")
+            .prefix_with("OR IGNORE", dialect="sqlite")
+            .values(
+                availability_id=availability.id,
+                user_id=user_id,
+                amount=availability.amount,
+                payment_method=method,
+                payment_status=status,
+                is_active=True,
+                created_at=datetime.utcnow(),
+                **extra
+            )
+        )
+        return bool(result.rowcount)
+
+    @staticmethod
+    def _supersede(payment):
+        db.session.execute(
+            update(MatchPayment)
+            .where(MatchPayment.id == payment.id)
+            .values(is_active=None)
+        )
+
+    # -------------------------------------------------
+    # ONLINE
+    # -------------------------------------------------
+    def _checkout(self, payment):
+        return {
+            "order_id": payment.razorpay_order_id,
+            "amount": int(round(float(payment.amount) * 100)),
+            "key": gateway.key_id
+        }
+
+    def checkout(self, availability, user_id):
+        """
+        The razorpay order the player should pay, created at most once.
+        Raises OrderRejected, or GatewayUnavailable when a new order
+        could not be created.
+        """
+        key = (availability.id, user_id)
+        cached = self._cached(key)
+        if cached:
+            return cached
+
+        payment = self.active(availability.id, user_id)
+        if payment:
+            if payment.payment_status == "paid":
+                raise OrderRejected("Already paid")
+            if payment.payment_method == "cash":
+                raise OrderRejected("Cash payment is waiting for coach approval")
+            if payment.razorpay_order_id:
+                # a failed attempt can be retried on the same order
+                if payment.payment_status == "failed":
+                    payment.payment_status = "pending"
+                    db.session.flush()
+                    refresh_summary([availability.id])
+                    db.session.commit()
+                return self._remember(key, self._checkout(payment))
+            if payment.created_at and datetime.utcnow() - payment.created_at < CLAIM_TIMEOUT:
+                raise OrderRejected("Payment is being prepared, please try again", 409)
+            db.session.delete(payment)
+            db.session.flush()
+
+        if not self._claim(availability, user_id, "razorpay", "pending"):
+            db.session.rollback()
+            raise OrderRejected("Payment is being prepared, please try again", 409)
+        db.session.commit()
+
+        payment = self.active(availability.id, user_id)
+        try:
+            order = gateway.create_order(
+                int(round(float(availability.amount) * 100)),
+                receipt=f"avail{availability.id}-user{user_id}",
+                notes={"availability_id": availability.id, "user_id": user_id}
+            )
+        except Exception:
+            # release the claim so the next click can try again
+            db.session.execute(delete(MatchPayment).where(MatchPayment.id == payment.id))
+            db.session.commit()
+            raise
+
+        payment.razorpay_order_id = order["id"]
+        db.session.flush()
+        refresh_summary([availability.id])
+        db.session.commit()
+
+        return self._remember(key, self._checkout(payment))
+
+    # -------------------------------------------------
+    # CASH
+    # -------------------------------------------------
+    def request_cash(self, availability, user_id, receipt=None):
+        """
+        Returns (payment, created). A receipt name (services/receipts)
+        is attached, or replaces the earlier one while still pending.
+        Raises OrderRejected when already paid.
+        """
+        payment = self.active(availability.id, user_id)
+        if payment:
+            if payment.payment_status == "paid":
+                raise OrderRejected("Already paid")
+            if payment.payment_method == "cash":
+                if receipt:
+                    payment.receipt = receipt
+                    db.session.commit()
+                return payment, False
+            # unfinished online attempt: keep it for reconciliation, but
+            # cash becomes the active payment
+            self._supersede(payment)
+            self.forget(availability.id, user_id)
+
+        created = self._claim(availability, user_id, "cash", "cash_pending", receipt=receipt)
+        db.session.flush()
+        refresh_summary([availability.id])
+        db.session.commit()
+        return self.active(availability.id, user_id), created
+
+    @staticmethod
+    def approve_cash(availability_id, payment_ids=None):
+        """
+        Mark the session's cash_pending payments (all, or just these ids)
+        paid with ONE UPDATE and notify the players in one digest upsert.
+        Returns the number approved. Caller commits.
+        """
+        pending = [
+            MatchPayment.availability_id == availability_id,
+            MatchPayment.payment_method == "cash",
+            MatchPayment.payment_status == "cash_pending"
+        ]
+        if payment_ids is not None:
+            pending.append(MatchPayment.id.in_(payment_ids or [0]))
+
+        # lock the rows (MySQL) so a second coach approving at the same
+        # time does not notify the same players again
+        user_ids = [
+            r[0] for r in db.session.query(MatchPayment.user_id)
+            .filter(*pending)
+            .with_for_update()
+        ]
+        if not user_ids:
+            return 0
+
+        db.session.execute(
+            update(MatchPayment)
+            .where(*pending)
+            .values(payment_status="paid"),
+            execution_options={"synchronize_session": False}
+        )
+        refresh_summary([availability_id])
+
+        notifier.digest_many(
+            "payment",
+            [(uid, "✅ Cash payment approved by coach", "/payment/history/player") for uid in user_ids],
+            target=availability_id
+        )
+        return len(user_ids)
+
+
+payment_orders = PaymentOrders()
@@ -0,0 +1,209 @@
+# services/payment_reconciler.py
+#
+# Brings match_payments in line with what the gateway says.
+#
+# 1. /payment/webhook verifies the signature and stores the event in
+#    payment_events (insert-or-ignore on the gateway's event id, so
+#    retried deliveries are harmless) - nothing else on the request path.
+# 2. Every PAYMENT_RECONCILE_INTERVAL seconds the worker takes up to
+#    PAYMENT_RECONCILE_BATCH unprocessed events and applies them with one
+#    bulk UPDATE per outcome (paid / failed), then marks them processed.
+# 3. Every PAYMENT_SWEEP_EVERY rounds, razorpay payments still pending
+#    after PAYMENT_STALE_MINUTES are checked against the gateway
+#    (missed or undelivered webhooks) and settled the same way.
+#
+# `flask payments-reconcile` runs one round by hand.
+
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+
+from models import db, MatchPayment, PaymentEvent
+from services.notifications import notifier
+from services.payment_gateway import gateway, GatewayUnavailable
+from services.payment_orders import payment_orders
+from services.payment_stats import refresh as refresh_summary
+
+PAID_EVENTS = ("payment.captured", "order.paid")
+FAILED_EVENTS = ("payment.failed",)
+
+
+class PaymentReconciler:
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.interval = 10
+        self.batch_size = 200
+        self.stale_minutes = 15
+        self.sweep_every = 6
+        self._running = False
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.interval = app.config.get("PAYMENT_RECONCILE_INTERVAL", self.interval)
+        self.batch_size = app.config.get("PAYMENT_RECONCILE_BATCH", self.batch_size)
+        self.stale_minutes = app.config.get("PAYMENT_STALE_MINUTES", self.stale_minutes)
+        self.sweep_every = app.config.get("PAYMENT_SWEEP_EVERY", self.sweep_every)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._loop)
+
+    def _loop(self):
+        rounds = 0
+        while self._running:
+            self.socketio.sleep(self.interval)
+            rounds += 1
+            with self.app.app_context():
+                try:
+                    self.process_events()
+                    if rounds % self.sweep_every == 0:
+                        self.sweep_pending()
+                except Exception as e:
+                    db.session.rollback()
+                    print("⚠️ Payment reconciliation failed:", e)
+
+    # -------------------------------------------------
+    # WEBHOOK INBOX
+    # -------------------------------------------------
+    def record_event(self, event_id, payload):
+        """Store one verified webhook. Returns False for a duplicate delivery. Caller commits."""
+        entity = (
+            payload.get("payload", {}).get("payment", {}).get("entity")
+            or payload.get("payload", {}).get("order", {}).get("entity")
+            or {}
+        )
+        order_id = entity.get("order_id") or (entity.get("id") if entity.get("entity") == "order" else None)
+
+        result = db.session.execute(
+            insert(PaymentEvent)
+            .prefix_with("IGNORE", dialect="mysql")
+            .prefix_with("OR IGNORE", dialect="sqlite")
+            .values(
+                event_id=event_id,
+                event=payload.get("event", ""),
+                order_id=order_id,
+                payment_id=entity.get("id") if entity.get("entity") == "payment" else None,
+                payload=json.dumps(payload)[:65000],
+                received_at=datetime.utcnow()
+            )
+        )
+        return bool(result.rowcount)
+
+    # -------------------------------------------------
+    # RECONCILIATION
+    # -------------------------------------------------
+    def process_events(self):
+        """Apply one batch of unprocessed webhook events. Returns events handled."""
+        events = (
+            PaymentEvent.query
+            .filter(PaymentEvent.processed_at.is_(None))
+            .order_by(PaymentEvent.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        if not events:
+            return 0
+
+        paid, failed = {}, {}
+        for e in events:
+            if not e.order_id:
+                continue
+            if e.event in PAID_EVENTS:
+                paid[e.order_id] = e.payment_id or paid.get(e.order_id)
+            elif e.event in FAILED_EVENTS:
+                failed[e.order_id] = e.payment_id
+
+        for order_id in paid:
+            failed.pop(order_id, None)
+
+        self._apply(paid, "paid")
+        self._apply(failed, "failed")
+
+        db.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.id.in_([e.id for e in events]))
+            .values(processed_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return len(events)
+
+    def sweep_pending(self):
+        """Ask the gateway about stale pending orders. Returns payments settled."""
+        cutoff = datetime.utcnow() - timedelta(minutes=self.stale_minutes)
+        order_ids = [
+            r[0] for r in db.session.query(MatchPayment.razorpay_order_id)
+            .filter(
+                MatchPayment.payment_method == "razorpay",
+                MatchPayment.payment_status == "pending",
+                MatchPayment.razorpay_order_id.isnot(None),
+                MatchPayment.created_at < cutoff
+            )
+            .order_by(MatchPayment.id)
+            .limit(self.batch_size)
+        ]
+
+        paid = {}
+        for order_id in order_ids:
+            try:
+                if gateway.fetch_order(order_id).get("status") != "paid":
+                    continue
+                captured = [p for p in gateway.order_payments(order_id) if p.get("status") == "captured"]
+            except GatewayUnavailable as e:
+                print("⚠️ Payment sweep stopped, gateway unavailable:", e)
+                break
+            paid[order_id] = captured[0]["id"] if captured else None
+
+        settled = self._apply(paid, "paid")
+        db.session.commit()
+        return settled
+
+    def _apply(self, orders, status):
+        """
+        orders: {order_id: payment_id or None}. One bulk UPDATE by primary
+        key for every matching payment not already settled. Caller commits.
+        """
+        if not orders:
+            return 0
+
+        open_states = ("pending", "failed") if status == "paid" else ("pending",)
+        rows = (
+            db.session.query(
+                MatchPayment.id, MatchPayment.user_id,
+                MatchPayment.razorpay_order_id, MatchPayment.availability_id
+            )
+            .filter(
+                MatchPayment.razorpay_order_id.in_(list(orders)),
+                MatchPayment.payment_status.in_(open_states)
+            )
+            .all()
+        )
+        if not rows:
+            return 0
+
+        changes = []
+        for pid, _, order_id, _ in rows:
+            change = {"id": pid, "payment_status": status}
+            if orders[order_id]:
+                change["razorpay_payment_id"] = orders[order_id]
+            changes.append(change)
+
+        db.session.execute(update(MatchPayment), changes)
+        refresh_summary({r.availability_id for r in rows})
+
+        if status == "paid":
+            for _, uid, _, availability_id in rows:
+                payment_orders.forget(availability_id, uid)
+            notifier.digest_many(
+                "payment",
+                [(uid, "✅ Match fee payment received", "/payment/history/player") for _, uid, _, _ in rows]
+            )
+        return len(rows)
+
+
+reconciler = PaymentReconciler()
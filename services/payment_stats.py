@@ -0,0 +1,109 @@
+# services/payment_stats.py
+#
+# payment_summaries: expected / paid / cash_pending / pending / failed and
+# the amount collected, per pre-match session.
+#
+# A player can own several match_payments rows for one session (retried
+# orders, a failed card then cash, ...), so the counts cannot be kept as
+# +1/-1 deltas. refresh() recomputes the touched sessions instead: one
+# GROUP BY answered from the (availability_id, user_id, payment_status)
+# index, each player counted once by their best status (and their fee
+# collected once), then a multi-row upsert. Call it after every payment
+# state change and availability response; `flask payments-summary-rebuild`
+# redoes every session.
+
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import db, MatchPayment, PaymentSummary, PreMatchAvailability, PreMatchResponse
+from services.upsert import upsert
+
+# best first: a player who paid is "paid" whatever else they tried
+STATUS_RANK = ("paid", "cash_pending", "pending", "failed")
+
+
+def refresh(availability_ids):
+    """Recompute the summaries of these sessions. Caller commits."""
+    ids = sorted({i for i in availability_ids if i})
+    if not ids:
+        return
+
+    expected = dict(
+        db.session.query(PreMatchResponse.availability_id, func.count())
+        .filter(
+            PreMatchResponse.availability_id.in_(ids),
+            PreMatchResponse.status == "available"
+        )
+        .group_by(PreMatchResponse.availability_id)
+        .all()
+    )
+
+    best = {}        # (availability_id, user_id) -> status
+    paid_amount = {} # (availability_id, user_id) -> amount of one paid row
+    for availability_id, user_id, status, amount in (
+        db.session.query(
+            MatchPayment.availability_id,
+            MatchPayment.user_id,
+            MatchPayment.payment_status,
+            func.max(MatchPayment.amount)
+        )
+        .filter(MatchPayment.availability_id.in_(ids))
+        .group_by(MatchPayment.availability_id, MatchPayment.user_id, MatchPayment.payment_status)
+    ):
+        if status not in STATUS_RANK:
+            continue
+        key = (availability_id, user_id)
+        if key not in best or STATUS_RANK.index(status) < STATUS_RANK.index(best[key]):
+            best[key] = status
+        if status == "paid":
+            paid_amount[key] = amount or 0
+
+    # one paid row per player, like the counts (paid online and in cash
+    # for the same session still collects the fee once)
+    collected = {}
+    for (availability_id, _), amount in paid_amount.items():
+        collected[availability_id] = collected.get(availability_id, 0) + amount
+
+    rows = {
+        i: dict(availability_id=i, expected=expected.get(i, 0), collected=collected.get(i, 0),
+                **{s: 0 for s in STATUS_RANK})
+        for i in ids
+    }
+    for (availability_id, _), status in best.items():
+        rows[availability_id][status] += 1
+
+    db.session.execute(upsert(
+        PaymentSummary,
+        list(rows.values()),
+        ["availability_id"],
+        lambda new: {
+            "expected": new.expected,
+            "paid": new.paid,
+            "cash_pending": new.cash_pending,
+            "pending": new.pending,
+            "failed": new.failed,
+            "collected": new.collected,
+            "updated_at": datetime.utcnow()
+        }
+    ))
+
+
+def summaries(availability_ids):
+    """{availability_id: PaymentSummary} for the sessions that have one."""
+    ids = list(availability_ids)
+    if not ids:
+        return {}
+    return {
+        s.availability_id: s
+        for s in PaymentSummary.query.filter(PaymentSummary.availability_id.in_(ids))
+    }
+
+
+def rebuild(batch_size=200):
+    """Refresh every session. Returns sessions processed."""
+    ids = [r[0] for r in db.session.query(PreMatchAvailability.id).order_by(PreMatchAvailability.id)]
+    for i in range(0, len(ids), batch_size):
+        refresh(ids[i:i + batch_size])
+        db.session.commit()
+    return len(ids)
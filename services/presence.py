@@ -0,0 +1,210 @@
+# services/presence.py
+#
+# Who is online, without touching the database.
+#
+# - every worker keeps user_id -> {sid: last_heartbeat} for its own sockets
+# - sockets that miss heartbeats for PRESENCE_TIMEOUT seconds are expired
+# - online/offline changes are coalesced and broadcast every
+#   PRESENCE_BROADCAST_INTERVAL seconds to the presence_{user_id} room
+#   (chat pages join the rooms of the people they are looking at), so a
+#   page reload - disconnect + connect - broadcasts nothing
+# - typing events are throttled per (user, conversation)
+#
+# With SOCKETIO_MESSAGE_QUEUE set, broadcasts already reach every worker.
+# If the queue is Redis, the online set is mirrored there too so
+# is_online() answers for users connected to another worker.
+
+import os
+import socket
+import threading
+import time
+
+
+class PresenceRegistry:
+
+    def __init__(self):
+        self.socketio = None
+        self.timeout = 60
+        self.interval = 2
+        self.typing_throttle = 2
+
+        self._lock = threading.Lock()
+        self._sids = {}          # user_id -> {sid: last_seen}
+        self._dirty = set()      # users whose state may have changed
+        self._broadcast = {}     # user_id -> last state sent (True/False)
+        self._typing = {}        # (user_id, target) -> last emit time
+
+        self._redis = None
+        self._worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = False
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.timeout = app.config.get("PRESENCE_TIMEOUT", self.timeout)
+        self.interval = app.config.get("PRESENCE_BROADCAST_INTERVAL", self.interval)
+        self.typing_throttle = app.config.get("TYPING_THROTTLE", self.typing_throttle)
+
+        queue = app.config.get("SOCKETIO_MESSAGE_QUEUE")
+        if queue and queue.startswith("redis"):
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(queue)
+            except ImportError:
+                print("⚠️ redis not installed, presence is per-worker only")
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.socketio.start_background_task(self._loop)
+
+    # -------------------------------------------------
+    # CONNECTIONS
+    # -------------------------------------------------
+    def connect(self, user_id, sid):
+        with self._lock:
+            sids = self._sids.setdefault(user_id, {})
+            first = not sids
+            sids[sid] = time.monotonic()
+            self._dirty.add(user_id)
+
+        if first:
+            self._mirror_online(user_id)
+
+    def disconnect(self, user_id, sid):
+        with self._lock:
+            sids = self._sids.get(user_id)
+            if not sids:
+                return
+            sids.pop(sid, None)
+            last = not sids
+            if last:
+                del self._sids[user_id]
+            self._dirty.add(user_id)
+
+        if last:
+            self._mirror_offline(user_id)
+
+    def heartbeat(self, user_id, sid):
+        # memory only - no DB, no Redis
+        with self._lock:
+            sids = self._sids.get(user_id)
+            if sids is not None and sid in sids:
+                sids[sid] = time.monotonic()
+                return
+
+        self.connect(user_id, sid)
+
+    # -------------------------------------------------
+    # QUERIES
+    # -------------------------------------------------
+    def is_online(self, user_id):
+        if user_id in self._sids:
+            return True
+        if self._redis is None:
+            return False
+        try:
+            return bool(self._redis.exists(f"presence:{user_id}"))
+        except Exception:
+            return False
+
+    def online_among(self, user_ids):
+        return {uid for uid in user_ids if self.is_online(uid)}
+
+    # -------------------------------------------------
+    # TYPING
+    # -------------------------------------------------
+    def should_send_typing(self, user_id, target):
+        """True at most once per typing_throttle seconds per conversation."""
+        now = time.monotonic()
+        key = (user_id, target)
+        with self._lock:
+            last = self._typing.get(key, 0)
+            if now - last < self.typing_throttle:
+                return False
+            self._typing[key] = now
+            return True
+
+    # -------------------------------------------------
+    # BACKGROUND: expiry + coalesced broadcast
+    # -------------------------------------------------
+    def _loop(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.expire()
+                self.flush()
+            except Exception as e:
+                print("⚠️ Presence loop error:", e)
+
+    def expire(self):
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            stale = [
+                (uid, sid)
+                for uid, sids in self._sids.items()
+                for sid, seen in sids.items()
+                if seen < cutoff
+            ]
+            typing_cutoff = time.monotonic() - self.typing_throttle
+            for key in [k for k, t in self._typing.items() if t < typing_cutoff]:
+                del self._typing[key]
+
+        for uid, sid in stale:
+            self.disconnect(uid, sid)
+
+        self._refresh_mirror()
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+
+        for uid in dirty:
+            online = self.is_online(uid)
+            if self._broadcast.get(uid) == online:
+                continue
+            self._broadcast[uid] = online
+            self.socketio.emit(
+                "presence",
+                {"user_id": uid, "online": online},
+                to=f"presence_{uid}"
+            )
+
+    # -------------------------------------------------
+    # REDIS MIRROR (optional)
+    # -------------------------------------------------
+    def _mirror_online(self, user_id):
+        if self._redis is None:
+            return
+        try:
+            key = f"presence:{user_id}"
+            pipe = self._redis.pipeline()
+            pipe.sadd(key, self._worker)
+            pipe.expire(key, self.timeout * 2)
+            pipe.execute()
+        except Exception as e:
+            print("⚠️ Presence mirror failed:", e)
+
+    def _mirror_offline(self, user_id):
+        if self._redis is None:
+            return
+        try:
+            self._redis.srem(f"presence:{user_id}", self._worker)
+        except Exception as e:
+            print("⚠️ Presence mirror failed:", e)
+
+    def _refresh_mirror(self):
+        # one pipelined round trip per sweep keeps keys of local users alive
+        if self._redis is None or not self._sids:
+            return
+        try:
+            pipe = self._redis.pipeline()
+            for uid in list(self._sids):
+                pipe.sadd(f"presence:{uid}", self._worker)
+                pipe.expire(f"presence:{uid}", self.timeout * 2)
+            pipe.execute()
+        except Exception as e:
+            print("⚠️ Presence mirror failed:", e)
+
+
+presence = PresenceRegistry()
@@ -0,0 +1,146 @@
+# services/receipts.py
+#
+# Cash payment receipts (photo of the slip / UPI screenshot), stored by
+# content instead of as loose files in static/uploads/payments/:
+#
+#   <RECEIPT_DIR>/ab/abcdef...<64 hex>.jpg      original
+#   <RECEIPT_DIR>/thumbs/ab/abcdef....jpg       small JPEG, images only
+#
+# The name IS the sha256 of the bytes, so the same upload twice is stored
+# once, a name never changes content, and the files can be served with a
+# year-long immutable Cache-Control + ETag. Thumbnails need Pillow; without
+# it the approval page links the original instead.
+#
+# `flask payments-receipts-migrate` moves the old loose files in.
+
+import hashlib
+import os
+import re
+import tempfile
+
+NAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+LEGACY_RE = re.compile(r"^(\d+)_\d+_.+$")   # {payment_id}_{timestamp}_{filename}
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif"}
+
+
+class ReceiptRejected(Exception):
+    """Upload is too large or of a type we do not keep."""
+
+
+class ReceiptStore:
+
+    def __init__(self):
+        self.root = None
+        self.extensions = IMAGE_EXTENSIONS | {"pdf"}
+        self.max_bytes = 5 * 1024 * 1024
+        self.thumb_size = 320
+        self.max_age = 365 * 24 * 3600
+        self._pillow = None
+
+    def init_app(self, app):
+        self.root = app.config.get("RECEIPT_DIR") or os.path.join(app.instance_path, "receipts")
+        self.max_bytes = app.config.get("RECEIPT_MAX_BYTES", self.max_bytes)
+        self.thumb_size = app.config.get("RECEIPT_THUMB_SIZE", self.thumb_size)
+        self.max_age = app.config.get("RECEIPT_CACHE_MAX_AGE", self.max_age)
+
+        try:
+            from PIL import Image
+            self._pillow = Image
+        except ImportError:
+            print("⚠️ Pillow not installed, receipt thumbnails disabled")
+
+    @property
+    def thumbnails_enabled(self):
+        return self._pillow is not None
+
+    # -------------------------------------------------
+    # PATHS
+    # -------------------------------------------------
+    @staticmethod
+    def valid(name):
+        return bool(name and NAME_RE.match(name))
+
+    def path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    def thumb_path(self, name):
+        return os.path.join(self.root, "thumbs", name[:2], name.rsplit(".", 1)[0] + ".jpg")
+
+    @staticmethod
+    def _write(path, data):
+        """Atomic write; an existing file is already the same content."""
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    # -------------------------------------------------
+    # STORE
+    # -------------------------------------------------
+    def save(self, file_storage):
+        """Store an uploaded receipt. Returns its name. Raises ReceiptRejected."""
+        ext = os.path.splitext(file_storage.filename or "")[1].lstrip(".").lower()
+        if ext not in self.extensions:
+            raise ReceiptRejected("Receipt must be an image or PDF")
+
+        data = file_storage.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise ReceiptRejected(f"Receipt is larger than {self.max_bytes // (1024 * 1024)} MB")
+        return self.save_bytes(data, ext)
+
+    def save_bytes(self, data, ext):
+        name = f"{hashlib.sha256(data).hexdigest()}.{'jpg' if ext == 'jpeg' else ext}"
+        self._write(self.path(name), data)
+        if ext in IMAGE_EXTENSIONS:
+            self.thumbnail(name)
+        return name
+
+    def thumbnail(self, name):
+        """Path of the thumbnail, made on first use. None when there is none."""
+        if self._pillow is None or name.rsplit(".", 1)[-1] not in IMAGE_EXTENSIONS:
+            return None
+
+        thumb = self.thumb_path(name)
+        if os.path.exists(thumb):
+            return thumb
+        try:
+            with self._pillow.open(self.path(name)) as img:
+                img.thumbnail((self.thumb_size, self.thumb_size))
+                os.makedirs(os.path.dirname(thumb), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(thumb))
+                with os.fdopen(fd, "wb") as f:
+                    img.convert("RGB").save(f, "JPEG", quality=80)
+                os.replace(tmp, thumb)
+        except (OSError, ValueError) as e:
+            print("⚠️ Receipt thumbnail failed:", name, e)
+            return None
+        return thumb
+
+    # -------------------------------------------------
+    # LEGACY UPLOADS
+    # -------------------------------------------------
+    def import_legacy(self, directory):
+        """
+        Store every old static/uploads/payments file. Returns
+        [(payment_id, name, old_path)]; the caller links the payments and
+        removes the old files once that is committed.
+        """
+        if not os.path.isdir(directory):
+            return []
+        imported = []
+        for filename in sorted(os.listdir(directory)):
+            m = LEGACY_RE.match(filename)
+            old_path = os.path.join(directory, filename)
+            if not m or not os.path.isfile(old_path):
+                continue
+            with open(old_path, "rb") as f:
+                data = f.read()
+            ext = os.path.splitext(filename)[1].lstrip(".").lower() or "bin"
+            imported.append((int(m.group(1)), self.save_bytes(data, ext), old_path))
+        return imported
+
+
+receipts = ReceiptStore()
@@ -0,0 +1,96 @@
+# services/scorers.py
+#
+# Who may score a match.
+#
+# A match is scored by its scorer_coach_id (a coach) or scorer_player_id
+# (a player). Those two ids are kept per worker for SCORER_CACHE_TTL
+# seconds, and current_user already carries coach_id / player_id
+# (services/identity.py), so the check is two dict lookups: a live ball
+# POST with warm caches runs its insert and nothing else.
+#
+# Match updates / deletes made through the ORM in this process drop the
+# match's entry at once (mapper events); other workers see a new scorer
+# when their entry expires.
+#
+# @scorer_required() guards the scoring routes: 404 for an unknown match,
+# then a JSON 403 ("not_allowed") for APIs, or a flash + redirect to the
+# match page for pages.
+
+import threading
+import time
+from functools import wraps
+
+from flask import abort, flash, jsonify, redirect, url_for
+from flask_login import current_user
+from sqlalchemy import event
+
+from models import db, Match
+
+
+def is_scorer(user, scorer_coach_id, scorer_player_id):
+    if user.role == "coach":
+        return user.coach_id is not None and scorer_coach_id == user.coach_id
+    if user.role == "player":
+        return user.player_id is not None and scorer_player_id == user.player_id
+    return False
+
+
+class ScorerCache:
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}    # match_id -> (loaded_at, scorer_coach_id, scorer_player_id)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("SCORER_CACHE_TTL", self.ttl)
+        for name in ("after_update", "after_delete"):
+            event.listen(Match, name, self._on_change)
+
+    def _on_change(self, mapper, connection, target):
+        self.invalidate(target.id)
+
+    def invalidate(self, match_id):
+        with self._lock:
+            self._cache.pop(match_id, None)
+
+    def get(self, match_id):
+        """(scorer_coach_id, scorer_player_id) of a match, None if there is no such match."""
+        entry = self._cache.get(match_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1:]
+
+        row = db.session.query(
+            Match.scorer_coach_id, Match.scorer_player_id
+        ).filter(Match.id == match_id).first()
+        if row is None:
+            return None
+
+        with self._lock:
+            self._cache[match_id] = (time.monotonic(), *row)
+        return tuple(row)
+
+    def allowed(self, user, match_id):
+        scorer = self.get(match_id)
+        return scorer is not None and is_scorer(user, *scorer)
+
+
+scorers = ScorerCache()
+
+
+def scorer_required(api=False, message="You are not the assigned scorer."):
+    """Only the match's scorer gets through; the view takes match_id."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(match_id, *args, **kwargs):
+            scorer = scorers.get(match_id)
+            if scorer is None:
+                abort(404)
+            if not is_scorer(current_user, *scorer):
+                if api:
+                    return jsonify({"error": "not_allowed"}), 403
+                flash(message, "danger")
+                return redirect(url_for("match_detail", match_id=match_id))
+            return view(match_id, *args, **kwargs)
+        return wrapper
+    return decorator
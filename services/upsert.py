@@ -0,0 +1,24 @@
+# services/upsert.py
+#
+# Multi-row INSERT ... ON DUPLICATE KEY UPDATE (MySQL) /
+# INSERT ... ON CONFLICT DO UPDATE (SQLite) behind one call, for tables
+# whose natural key is a unique constraint.
+
+from models import db
+
+
+def upsert(model, rows, keys, update):
+    """
+    Build one statement inserting `rows` (list of dicts) into `model`.
+    On a clash of the unique columns `keys`, the existing row is updated
+    with update(new), where new.<column> is the value that was about to be
+    inserted. Caller executes the statement.
+    """
+    if db.session.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(model).values(rows)
+        return stmt.on_duplicate_key_update(**update(stmt.inserted))
+
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(index_elements=keys, set_=update(stmt.excluded))
@@ -0,0 +1,176 @@
+"""
+Local stand-in for the Razorpay orders API, for tests and offline dev.
+
+    python tools/fake_razorpay.py --port 5055 \
+        --webhook-url http://127.0.0.1:5000/payment/webhook
+
+Point the app at it with:
+
+    PAYMENT_GATEWAY_URL=http://127.0.0.1:5055
+    RAZORPAY_KEY_ID=rzp_test_fake RAZORPAY_KEY_SECRET=fake_secret
+    RAZORPAY_WEBHOOK_SECRET=fake_webhook_secret
+
+Implements what the app uses:
+    POST /v1/orders
+    GET  /v1/orders/<id>
+    GET  /v1/orders/<id>/payments
+and a test hook standing in for the checkout popup:
+    POST /_fake/orders/<id>/pay[?fail=1]
+which settles the order, sends a signed webhook (if --webhook-url is
+set) and returns the fields checkout would post to /payment/success.
+
+--delay-ms slows every API call down, to watch timeouts / the breaker.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import threading
+import time
+
+import requests
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+ORDERS = {}
+PAYMENTS = {}   # order_id -> [payment]
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+settings = {
+    "key_secret": os.environ.get("RAZORPAY_KEY_SECRET", "fake_secret"),
+    "webhook_secret": os.environ.get("RAZORPAY_WEBHOOK_SECRET", "fake_webhook_secret"),
+    "webhook_url": None,
+    "delay": 0.0,
+}
+
+
+def _id(prefix):
+    return f"{prefix}_fake{next(_ids):010d}"
+
+
+def _sign(secret, message):
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _error(status, description):
+    return jsonify({"error": {"code": "BAD_REQUEST_ERROR", "description": description}}), status
+
+
+@app.before_request
+def slow_down():
+    if settings["delay"] and request.path.startswith("/v1/"):
+        time.sleep(settings["delay"])
+
+
+@app.route("/v1/orders", methods=["POST"])
+def create_order():
+    data = request.get_json(silent=True) or {}
+    if not data.get("amount"):
+        return _error(400, "amount is required")
+
+    order = {
+        "id": _id("order"),
+        "entity": "order",
+        "amount": int(data["amount"]),
+        "amount_paid": 0,
+        "currency": data.get("currency", "INR"),
+        "receipt": data.get("receipt"),
+        "notes": data.get("notes") or {},
+        "status": "created",
+        "attempts": 0,
+        "created_at": int(time.time()),
+    }
+    with _lock:
+        ORDERS[order["id"]] = order
+        PAYMENTS[order["id"]] = []
+    return jsonify(order)
+
+
+@app.route("/v1/orders/<order_id>")
+def fetch_order(order_id):
+    order = ORDERS.get(order_id)
+    return jsonify(order) if order else _error(404, "order not found")
+
+
+@app.route("/v1/orders/<order_id>/payments")
+def order_payments(order_id):
+    if order_id not in ORDERS:
+        return _error(404, "order not found")
+    items = PAYMENTS[order_id]
+    return jsonify({"entity": "collection", "count": len(items), "items": items})
+
+
+@app.route("/_fake/orders/<order_id>/pay", methods=["POST"])
+def pay(order_id):
+    order = ORDERS.get(order_id)
+    if not order:
+        return _error(404, "order not found")
+
+    failed = request.args.get("fail") == "1"
+    payment = {
+        "id": _id("pay"),
+        "entity": "payment",
+        "order_id": order_id,
+        "amount": order["amount"],
+        "currency": order["currency"],
+        "status": "failed" if failed else "captured",
+        "method": "upi",
+        "created_at": int(time.time()),
+    }
+    with _lock:
+        PAYMENTS[order_id].append(payment)
+        order["attempts"] += 1
+        if not failed:
+            order["status"] = "paid"
+            order["amount_paid"] = order["amount"]
+        else:
+            order["status"] = "attempted"
+
+    event = {
+        "entity": "event",
+        "event": "payment.failed" if failed else "payment.captured",
+        "payload": {"payment": {"entity": payment}},
+        "created_at": int(time.time()),
+    }
+    webhook = None
+    if settings["webhook_url"] and request.args.get("webhook", "1") == "1":
+        body = json.dumps(event).encode()
+        r = requests.post(
+            settings["webhook_url"],
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-Razorpay-Signature": _sign(settings["webhook_secret"], body),
+                "X-Razorpay-Event-Id": _id("evt"),
+            },
+            timeout=5,
+        )
+        webhook = r.status_code
+
+    return jsonify({
+        "razorpay_order_id": order_id,
+        "razorpay_payment_id": payment["id"],
+        "razorpay_signature": _sign(settings["key_secret"], f"{order_id}|{payment['id']}".encode()),
+        "webhook_status": webhook,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--webhook-url")
+    parser.add_argument("--delay-ms", type=int, default=0)
+    args = parser.parse_args()
+
+    settings["webhook_url"] = args.webhook_url
+    settings["delay"] = args.delay_ms / 1000.0
+
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()